@@ -0,0 +1,61 @@
+"""
+Alignment columns benchmark - gapped sequences & cigar path built from the alignment path vs formatted alignment text.
+Usage: python benchmarks/alignment_columns.py [n_reads]
+"""
+import random
+import sys
+import time
+from crispector.input_processing.alignment import Alignment
+
+READS_UNIT = 100000
+
+
+def random_seq(length):
+    return "".join(random.choice("ACGT") for _ in range(length))
+
+
+def mutate(seq, edits):
+    seq = list(seq)
+    for _ in range(edits):
+        pos = random.randrange(len(seq))
+        op = random.random()
+        if op < 0.4:
+            seq[pos] = random.choice("ACGT")
+        elif op < 0.7:
+            del seq[pos:pos + random.randint(1, 15)]
+        else:
+            seq.insert(pos, random_seq(random.randint(1, 10)))
+    return "".join(seq)
+
+
+def legacy_columns(alignment):
+    [ref_with_ins, _, read_with_del, _] = format(alignment).split("\n")
+    cigar_path, cigar_len = Alignment._compute_cigar_path_from_alignment(reference=ref_with_ins, read=read_with_del)
+    return ref_with_ins, read_with_del, cigar_path, cigar_len
+
+
+def main(n_reads):
+    random.seed(0)
+    aligner = Alignment._create_aligner({"match_score": 5, "mismatch_score": -4, "open_gap_score": -25,
+                                         "extend_gap_score": 0, "substitution_matrix": ""})
+    reference = random_seq(200)
+    reads = [mutate(reference, random.choice([0, 1, 2, 3, 5])) for _ in range(n_reads)]
+    alignments = [aligner.align(reference, read)[0] for read in reads]
+
+    start = time.time()
+    expected = [legacy_columns(alignment) for alignment in alignments]
+    legacy_time = time.time() - start
+
+    start = time.time()
+    result = [Alignment._compute_alignment_from_path(reference, read, alignment.path)
+              for read, alignment in zip(reads, alignments)]
+    path_time = time.time() - start
+
+    assert result == expected, "Alignment columns mismatch"
+    scale = READS_UNIT / n_reads
+    print("format + cigar loop: {:.2f}s per 100k reads".format(legacy_time * scale))
+    print("alignment path:      {:.2f}s per 100k reads (x{:.1f})".format(path_time * scale, legacy_time / path_time))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
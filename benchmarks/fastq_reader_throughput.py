@@ -0,0 +1,48 @@
+"""
+Throughput benchmark - FASTQ input layer vs the single-threaded gzip reader.
+Usage: python benchmarks/fastq_reader_throughput.py <fastq> [<fastq> ...]
+"""
+import gzip
+import os
+import re
+import sys
+import time
+from crispector.input_processing.utils import parse_fastq_file, get_compression_type, is_gz_file
+
+
+def legacy_parse_fastq_file(file_name):
+    """
+    The original reader - single-threaded gzip.open, re.match on every line, list of all reads.
+    """
+    fastq_file = gzip.open(file_name, 'rt') if is_gz_file(file_name) else open(file_name)
+    sequences = []
+    line = fastq_file.readline()
+    while line:
+        line = fastq_file.readline()
+        if re.match("[ACGT]+\\Z", line[:-1]):
+            sequences.append(line[:-1])
+    fastq_file.close()
+    return sequences
+
+
+def main(paths):
+    for path in paths:
+        size_mb = os.path.getsize(path) / 2**20
+        print("{} ({}, {:.1f} MB on disk)".format(path, get_compression_type(path).name, size_mb))
+        if get_compression_type(path).name in ["NONE", "GZIP", "BGZF"]:
+            start = time.time()
+            n_reads = len(legacy_parse_fastq_file(path))
+            elapsed = time.time() - start
+            print("  legacy reader   : {:8.2f}s {:8.1f} MB/s {:12,.0f} reads/s".format(elapsed, size_mb / elapsed,
+                                                                                      n_reads / elapsed))
+        for threads in [1, os.cpu_count()]:
+            start = time.time()
+            n_reads = parse_fastq_file(path, threads)["frequency"].sum()
+            elapsed = time.time() - start
+            print("  input layer x{:<2}: {:8.2f}s {:8.1f} MB/s {:12,.0f} reads/s".format(threads, elapsed,
+                                                                                       size_mb / elapsed,
+                                                                                       n_reads / elapsed))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,136 @@
+"""
+Indel events benchmark - columnar indel events of all alignments vs comma separated indels columns computed one
+alignment at a time, on the EMX1 example.
+Usage: python benchmarks/indel_events.py [example zip]
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import pandas as pd
+from crispector.input_processing.alignment import Alignment
+from crispector.input_processing.indel_events import compute_indel_events, indel_events_to_columns
+from crispector.input_processing.indel_shift import shift_indels_into_cut_site
+from crispector.input_processing.input_processing import InputProcessing
+from crispector.input_processing.utils import parse_fastq_file, parse_cigar
+from crispector.utils.configurator import Configurator
+from crispector.utils.constants_and_types import READ, IndelType, INDEL_COLS, ALIGN_CUT_SITE, DEL_LEN, DEL_START, \
+    DEL_END, DEL_BASE, INS_LEN, INS_POS, INS_BASE, SUB_CNT, SUB_POS, SUB_BASE
+
+EXAMPLE_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example",
+                           "EMX1_11_sites_singleplex_input_500k_reads.zip")
+
+
+def legacy_compute_indels_info(reference, read, cigar, cut_site, window_size):
+    """
+    The original indels annotation - one alignment at a time, with python strings.
+    """
+    start_idx = cut_site - window_size
+    end_idx = cut_site + window_size
+    values = dict.fromkeys(INDEL_COLS)
+
+    pos_idx = 0
+    align_idx = 0
+    for length, indel_type in parse_cigar(cigar):
+        if pos_idx > end_idx:
+            break
+        elif indel_type == IndelType.DEL:
+            if (pos_idx + length > start_idx) and (pos_idx < end_idx):
+                if values[DEL_LEN] is None:
+                    values[DEL_LEN] = str(length)
+                    values[DEL_START] = str(pos_idx)
+                    values[DEL_END] = str(pos_idx + length - 1)
+                    values[DEL_BASE] = reference[align_idx:align_idx+length]
+                else:
+                    values[DEL_LEN] += ", {}".format(length)
+                    values[DEL_START] += ", {}".format(pos_idx)
+                    values[DEL_END] += ", {}".format(pos_idx + length - 1)
+                    values[DEL_BASE] += ", {}".format(reference[align_idx:align_idx+length])
+        elif indel_type == IndelType.SUB:
+            if (pos_idx + length > start_idx) and (pos_idx < end_idx):
+                if values[SUB_CNT] is None:
+                    values[SUB_CNT] = int(length)
+                    values[SUB_POS] = str(pos_idx)
+                    values[SUB_POS] += "".join([", {}".format(pos_idx+i) for i in range(1, length)])
+                    values[SUB_BASE] = read[align_idx]
+                    values[SUB_BASE] += "".join([", {}".format(read[align_idx+i]) for i in range(1, length)])
+                else:
+                    values[SUB_CNT] += int(length)
+                    values[SUB_POS] += "".join([", {}".format(pos_idx+i) for i in range(length)])
+                    values[SUB_BASE] += "".join([", {}".format(read[align_idx+i]) for i in range(1, length)])
+        elif indel_type == IndelType.INS:
+            if pos_idx >= start_idx:
+                if values[INS_LEN] is None:
+                    values[INS_LEN] = str(length)
+                    values[INS_POS] = str(pos_idx)
+                    values[INS_BASE] = read[align_idx:align_idx+length]
+                else:
+                    values[INS_LEN] += ", {}".format(length)
+                    values[INS_POS] += ", {}".format(pos_idx)
+                    values[INS_BASE] += ", {}".format(read[align_idx:align_idx+length])
+        if indel_type != IndelType.INS:
+            if cut_site in range(pos_idx, pos_idx + length + 1):
+                values[ALIGN_CUT_SITE] = align_idx + (cut_site - pos_idx)
+            pos_idx += length
+        align_idx += length
+
+    return values
+
+
+def main(example_zip):
+    Configurator.set_cfg_path(None)
+    cfg = Configurator.get_cfg()
+    aligner = Alignment._create_aligner(cfg["alignment"])
+    window_size = cfg["NHEJ_inference"]["window_size"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(example_zip) as zip_file:
+            zip_file.extractall(tmp_dir)
+        example_dir = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+        config_df = pd.read_csv([os.path.join(example_dir, name) for name in os.listdir(example_dir)
+                                 if name.endswith(".csv")][0])
+
+        total_legacy_time, total_batch_time = 0, 0
+        for _, row in config_df.iterrows():
+            reference = row["AmpliconReference"]
+            cut_site, _ = InputProcessing._get_expected_cut_site(reference, row["gRNA"], -3)
+            reads = list(dict.fromkeys([read for exp in ["tx", "mock"] for read in parse_fastq_file(
+                os.path.join(example_dir, "{}_{}_merged.fq.gz".format(row["SiteName"], exp)))[READ]]))
+            alignments = Alignment._align_reads_unit(aligner, reference, True, reads)[0]
+            alignments = list(dict.fromkeys([(ref_w_ins, read_w_del, cigar) for ref_w_ins, read_w_del, cigar, *_
+                                             in alignments]))
+            shifted_l = shift_indels_into_cut_site([alignment[0] for alignment in alignments],
+                                                   [alignment[1] for alignment in alignments],
+                                                   [alignment[2] for alignment in alignments], cut_site, window_size)
+            alignments = [alignment if shifted is None else shifted
+                          for alignment, shifted in zip(alignments, shifted_l)]
+
+            start = time.time()
+            expected = pd.DataFrame([legacy_compute_indels_info(ref_w_ins, read_w_del, cigar, cut_site, window_size)
+                                     for ref_w_ins, read_w_del, cigar in alignments], columns=INDEL_COLS)
+            legacy_time = time.time() - start
+
+            start = time.time()
+            events, aligned_cut_site = compute_indel_events([alignment[0] for alignment in alignments],
+                                                            [alignment[1] for alignment in alignments],
+                                                            [alignment[2] for alignment in alignments], cut_site,
+                                                            window_size)
+            batch_time = time.time() - start
+
+            result = pd.DataFrame(indel_events_to_columns(events, len(alignments)))
+            result.insert(0, ALIGN_CUT_SITE, aligned_cut_site)
+            assert result.equals(expected), "Indels mismatch in {}".format(row["SiteName"])
+            total_legacy_time += legacy_time
+            total_batch_time += batch_time
+            print("{:12}: {:6} alignments ({:6} events), strings {:5.2f}s {:6.1f}MB, events {:5.2f}s {:6.1f}MB "
+                  "(x{:.1f})".format(row["SiteName"], len(alignments), events.shape[0], legacy_time,
+                                     expected.memory_usage(deep=True).sum() / 2 ** 20, batch_time,
+                                     events.memory_usage(deep=True).sum() / 2 ** 20, legacy_time / batch_time))
+
+    print("total       : strings {:.2f}s, events {:.2f}s (x{:.1f})".format(total_legacy_time, total_batch_time,
+                                                                         total_legacy_time / total_batch_time))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE_ZIP)
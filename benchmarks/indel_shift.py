@@ -0,0 +1,169 @@
+"""
+Indel shift benchmark - batched shift of all alignments vs shifting one alignment at a time, on the EMX1 example.
+Usage: python benchmarks/indel_shift.py [example zip]
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import pandas as pd
+from crispector.input_processing.alignment import Alignment
+from crispector.input_processing.indel_shift import shift_indels_into_cut_site
+from crispector.input_processing.input_processing import InputProcessing
+from crispector.input_processing.utils import parse_fastq_file, parse_cigar
+from crispector.utils.configurator import Configurator
+from crispector.utils.constants_and_types import READ, IndelType
+
+EXAMPLE_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example",
+                           "EMX1_11_sites_singleplex_input_500k_reads.zip")
+
+
+def legacy_find_closest_indels_to_cut_site(cigar, cut_site):
+    most_left, most_right = None, None
+    pos_idx, align_idx, aligned_cut_site = 0, 0, -1
+    search_finished = False
+    for length, indel_type in parse_cigar(cigar):
+        if indel_type == IndelType.DEL:
+            if pos_idx <= cut_site:
+                if (pos_idx + length) < cut_site:
+                    most_left = (indel_type, length, align_idx)
+                else:
+                    most_left = None
+                    search_finished = True
+            elif most_right is None:
+                most_right = (indel_type, length, align_idx)
+                search_finished = True
+        elif indel_type == IndelType.INS:
+            if pos_idx == cut_site:
+                most_left = None
+                search_finished = True
+            elif pos_idx < cut_site:
+                most_left = (indel_type, length, align_idx)
+            elif most_right is None:
+                most_right = (indel_type, length, align_idx)
+                search_finished = True
+        if indel_type != IndelType.INS:
+            if cut_site in range(pos_idx, pos_idx + length + 1):
+                aligned_cut_site = align_idx + (cut_site - pos_idx)
+            pos_idx += length
+        align_idx += length
+        if search_finished:
+            break
+    return most_left, most_right, aligned_cut_site
+
+
+def legacy_shift_indel_from_left(read_a, read_b, length, align_idx, alignment_cut_site):
+    shift = 0
+    start_idx, end_idx = align_idx, align_idx + length
+    while end_idx < alignment_cut_site:
+        if (read_a[end_idx] == read_b[start_idx]) or \
+           ((read_a[end_idx] != read_b[end_idx]) and (read_b[end_idx] != "-")):
+            shift += 1
+        else:
+            break
+        start_idx += 1
+        end_idx += 1
+    if shift == 0:
+        return read_a, False
+    shifted_bases = read_a[align_idx + length:align_idx + length + shift]
+    indels = read_a[align_idx:align_idx + length]
+    return read_a[0:align_idx] + shifted_bases + indels + read_a[align_idx + length + shift:], True
+
+
+def legacy_shift_indel_from_right(read_a, read_b, length, align_idx, alignment_cut_site):
+    shift = 0
+    start_idx, end_idx = align_idx - 1, align_idx + length - 1
+    while start_idx >= alignment_cut_site:
+        if (read_a[start_idx] == read_b[end_idx]) or \
+           ((read_a[start_idx] != read_b[start_idx]) and (read_b[start_idx] != "-")):
+            shift += 1
+        else:
+            break
+        start_idx -= 1
+        end_idx -= 1
+    if shift == 0:
+        return read_a, False
+    shifted_bases = read_a[align_idx - shift:align_idx]
+    indels = read_a[align_idx:align_idx + length]
+    return read_a[0:align_idx - shift] + indels + shifted_bases + read_a[align_idx + length:], True
+
+
+def legacy_shift_alignment(reference, read, cigar, cut_site, window_size):
+    """
+    The original shift - one alignment at a time, with python strings.
+    """
+    changed_left, changed_right = False, False
+    most_left, most_right, aligned_cut_site = legacy_find_closest_indels_to_cut_site(cigar, cut_site)
+    if most_left is not None:
+        indel_type, length, align_idx = most_left
+        if align_idx + length + (2 * window_size) < aligned_cut_site:
+            pass
+        elif indel_type == IndelType.DEL:
+            read, changed_left = legacy_shift_indel_from_left(read, reference, length, align_idx, aligned_cut_site)
+        else:
+            reference, changed_left = legacy_shift_indel_from_left(reference, read, length, align_idx,
+                                                                   aligned_cut_site)
+    if most_right is not None:
+        indel_type, length, align_idx = most_right
+        if align_idx > aligned_cut_site + (2 * window_size):
+            pass
+        elif indel_type == IndelType.DEL:
+            read, changed_right = legacy_shift_indel_from_right(read, reference, length, align_idx,
+                                                                aligned_cut_site)
+        else:
+            reference, changed_right = legacy_shift_indel_from_right(reference, read, length, align_idx,
+                                                                     aligned_cut_site)
+    if changed_right or changed_left:
+        cigar, _ = Alignment._compute_cigar_path_from_alignment(reference, read)
+        return reference, read, cigar
+    return None
+
+
+def main(example_zip):
+    Configurator.set_cfg_path(None)
+    cfg = Configurator.get_cfg()
+    aligner = Alignment._create_aligner(cfg["alignment"])
+    window_size = cfg["NHEJ_inference"]["window_size"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(example_zip) as zip_file:
+            zip_file.extractall(tmp_dir)
+        example_dir = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+        config_df = pd.read_csv([os.path.join(example_dir, name) for name in os.listdir(example_dir)
+                                 if name.endswith(".csv")][0])
+
+        total_legacy_time, total_batch_time = 0, 0
+        for _, row in config_df.iterrows():
+            reference = row["AmpliconReference"]
+            cut_site, _ = InputProcessing._get_expected_cut_site(reference, row["gRNA"], -3)
+            reads = list(dict.fromkeys([read for exp in ["tx", "mock"] for read in parse_fastq_file(
+                os.path.join(example_dir, "{}_{}_merged.fq.gz".format(row["SiteName"], exp)))[READ]]))
+            alignments = Alignment._align_reads_unit(aligner, reference, True, reads)[0]
+            alignments = list(dict.fromkeys([(ref_w_ins, read_w_del, cigar) for ref_w_ins, read_w_del, cigar, *_
+                                             in alignments]))
+
+            start = time.time()
+            expected = [legacy_shift_alignment(ref_w_ins, read_w_del, cigar, cut_site, window_size)
+                        for ref_w_ins, read_w_del, cigar in alignments]
+            legacy_time = time.time() - start
+
+            start = time.time()
+            result = shift_indels_into_cut_site([alignment[0] for alignment in alignments],
+                                                [alignment[1] for alignment in alignments],
+                                                [alignment[2] for alignment in alignments], cut_site, window_size)
+            batch_time = time.time() - start
+
+            assert result == expected, "Shift mismatch in {}".format(row["SiteName"])
+            total_legacy_time += legacy_time
+            total_batch_time += batch_time
+            print("{:12}: {:6} alignments ({:5} shifted), one by one {:5.2f}s, batch {:5.2f}s (x{:.1f})".format(
+                row["SiteName"], len(alignments), sum([shifted is not None for shifted in result]), legacy_time,
+                batch_time, legacy_time / batch_time))
+
+    print("total       : one by one {:.2f}s, batch {:.2f}s (x{:.1f})".format(total_legacy_time, total_batch_time,
+                                                                          total_legacy_time / total_batch_time))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE_ZIP)
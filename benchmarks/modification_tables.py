@@ -0,0 +1,130 @@
+"""
+Modification tables benchmark - all reads modifications filled together vs one read at a time, on the EMX1 example.
+Usage: python benchmarks/modification_tables.py [example zip]
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import numpy as np
+import pandas as pd
+from collections import defaultdict
+from crispector.input_processing.alignment import Alignment
+from crispector.input_processing.input_processing import InputProcessing
+from crispector.input_processing.utils import parse_fastq_file, parse_cigar_with_mixed_indels
+from crispector.modifications.modification_tables import ModificationTables
+from crispector.modifications.modification_types import ModificationTypes
+from crispector.utils.configurator import Configurator
+from crispector.utils.constants_and_types import READ, CIGAR, FREQ, REFERENCE, CUT_SITE, IndelType, ExpType, C_TX, \
+    C_MOCK, MOD_TABLE_IDX, INDEL_TYPE, INDEL_LEN, IS_EDIT, POS_IDX_S, POS_IDX_E
+
+EXAMPLE_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example",
+                           "EMX1_11_sites_singleplex_input_500k_reads.zip")
+
+
+class LegacyModificationTables(ModificationTables):
+    """
+    The original modification tables - filled one read at a time, with pointers of all positions.
+    """
+    def _create_modification_tables_and_distribution(self):
+        for idx, indel_type in enumerate(self._modifications.types):
+            table_size = len(self._amplicon) + 1 if indel_type == IndelType.INS else len(self._amplicon)
+            self._tables[idx] = np.zeros((2, table_size), dtype=np.int)
+            self._pointers[idx] = defaultdict(list)
+        self._tx_dist = self._convert_read_df_to_modifications(self._tx_reads, ExpType.TX)
+        self._mock_dist = self._convert_read_df_to_modifications(self._mock_reads, ExpType.MOCK)
+
+    def _convert_read_df_to_modifications(self, read, exp_type):
+        table_row = C_TX if exp_type == ExpType.TX else C_MOCK
+        dist_d = defaultdict(list)
+
+        for row_idx, row in read.iterrows():
+            pos_idx = 0
+            for length, length_wo_ins, indel_type, mixed_l in parse_cigar_with_mixed_indels(row[CIGAR]):
+                table_idx = self._modifications.find_index(indel_type, length)
+                if indel_type == IndelType.MATCH:
+                    pos_idx += length_wo_ins
+                    continue
+                elif indel_type in [IndelType.DEL, IndelType.SUB, IndelType.MIXED]:
+                    self._tables[table_idx][table_row, pos_idx:pos_idx+length_wo_ins] += row[FREQ]
+                    if exp_type == ExpType.TX:
+                        for pointer_idx in range(pos_idx, pos_idx+length_wo_ins):
+                            self._pointers[table_idx][pointer_idx].append(row_idx)
+                elif indel_type == IndelType.INS:
+                    self._tables[table_idx][table_row, pos_idx] += row[FREQ]
+                    if exp_type == ExpType.TX:
+                        self._pointers[table_idx][pos_idx].append(row_idx)
+
+                indel_l = [(length, indel_type)] if indel_type != IndelType.MIXED else mixed_l
+                for dist_length, dist_indel_type in indel_l:
+                    dist_d[MOD_TABLE_IDX].append(table_idx)
+                    dist_d[INDEL_TYPE].append(dist_indel_type)
+                    dist_d[INDEL_LEN].append(dist_length)
+                    dist_d[FREQ].append(row[FREQ])
+                    dist_d[IS_EDIT].append(False)
+                    dist_d[POS_IDX_S].append(pos_idx)
+                    end_idx = pos_idx + length_wo_ins if indel_type != IndelType.INS else pos_idx + 1
+                    dist_d[POS_IDX_E].append(end_idx)
+
+                pos_idx += length_wo_ins
+
+        return pd.DataFrame.from_dict(dist_d, orient='columns')
+
+
+def aligned_reads(aligner, reference, fastq):
+    reads_df = parse_fastq_file(fastq)
+    alignments = Alignment._align_reads_unit(aligner, reference, False, list(reads_df[READ]))[0]
+    reads_df[CIGAR] = [alignment[2] for alignment in alignments]
+    return reads_df.sort_values(by=[FREQ], ascending=False).reset_index(drop=True)
+
+
+def main(example_zip):
+    Configurator.set_cfg_path(None)
+    aligner = Alignment._create_aligner(Configurator.get_cfg()["alignment"])
+    modifications = ModificationTypes.init_from_cfg(True)
+    window_size = Configurator.get_cfg()["NHEJ_inference"]["window_size"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(example_zip) as zip_file:
+            zip_file.extractall(tmp_dir)
+        example_dir = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+        config_df = pd.read_csv([os.path.join(example_dir, name) for name in os.listdir(example_dir)
+                                 if name.endswith(".csv")][0])
+
+        total_legacy_time, total_batch_time = 0, 0
+        for _, row in config_df.iterrows():
+            tx_reads, mock_reads = [aligned_reads(aligner, row["AmpliconReference"], os.path.join(
+                example_dir, "{}_{}_merged.fq.gz".format(row["SiteName"], exp))) for exp in ["tx", "mock"]]
+            cut_site, _ = InputProcessing._get_expected_cut_site(row["AmpliconReference"], row["gRNA"], -3)
+            ref_row = pd.Series({REFERENCE: row["AmpliconReference"], CUT_SITE: cut_site})
+
+            start = time.time()
+            expected = LegacyModificationTables(tx_reads, mock_reads, modifications, ref_row)
+            legacy_time = time.time() - start
+
+            start = time.time()
+            result = ModificationTables(tx_reads, mock_reads, modifications, ref_row)
+            batch_time = time.time() - start
+
+            for table_idx in expected.tables:
+                assert np.array_equal(result.tables[table_idx], expected.tables[table_idx]), \
+                    "Table mismatch in {}".format(row["SiteName"])
+                for window_pos in range(2 * window_size + 1):
+                    pointers = expected.pointers[table_idx][cut_site - window_size + window_pos]
+                    assert sorted(result.pointers[table_idx][window_pos].indices) == pointers, \
+                        "Pointers mismatch in {}".format(row["SiteName"])
+            assert result.tx_dist.equals(expected.tx_dist) and result.mock_dist.equals(expected.mock_dist), \
+                "Distribution mismatch in {}".format(row["SiteName"])
+            total_legacy_time += legacy_time
+            total_batch_time += batch_time
+            print("{:12}: {:6} unique reads, one by one {:5.2f}s, batch {:5.2f}s (x{:.1f})".format(
+                row["SiteName"], tx_reads.shape[0] + mock_reads.shape[0], legacy_time, batch_time,
+                legacy_time / batch_time))
+
+    print("total       : one by one {:.2f}s, batch {:.2f}s (x{:.1f})".format(total_legacy_time, total_batch_time,
+                                                                          total_legacy_time / total_batch_time))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE_ZIP)
@@ -0,0 +1,67 @@
+"""
+Demultiplexing primer matching benchmark - PrimerIndex vs full edlib scan, across panel sizes.
+Usage: python benchmarks/primer_matching.py [n_prefixes]
+"""
+import random
+import sys
+import time
+from crispector.input_processing.primer_index import PrimerIndex, match_by_edit_distance
+from crispector.input_processing.utils import reverse_complement
+from crispector.utils.constants_and_types import PRIMER_LEN
+
+
+def random_seq(length):
+    return "".join(random.choice("ACGT") for _ in range(length))
+
+
+def mutate(seq, edits):
+    seq = list(seq)
+    for _ in range(edits):
+        pos = random.randrange(len(seq))
+        op = random.choice(["sub", "ins", "del"])
+        if op == "sub":
+            seq[pos] = random.choice("ACGT")
+        elif op == "ins":
+            seq.insert(pos, random.choice("ACGT"))
+        elif len(seq) > 1:
+            del seq[pos]
+    return "".join(seq)[:PRIMER_LEN]
+
+
+def main(n_prefixes, max_edit_distance=8):
+    random.seed(0)
+    for panel_size in [10, 100, 500, 1000]:
+        references = [random_seq(150) for _ in range(panel_size)]
+        primers = [ref[:PRIMER_LEN] for ref in references] + \
+                  [reverse_complement(ref[-PRIMER_LEN:]) for ref in references]
+        primers_rev = panel_size * [False] + panel_size * [True]
+        names = 2 * ["site_{}".format(idx) for idx in range(panel_size)]
+
+        # Mostly close prefixes, some far ones and some random sequences
+        prefixes = []
+        for _ in range(n_prefixes):
+            kind = random.random()
+            if kind < 0.8:
+                prefixes.append(mutate(random.choice(primers), random.choice([0, 1, 1, 2, 2, 3])))
+            elif kind < 0.9:
+                prefixes.append(mutate(random.choice(primers), random.randint(4, 10)))
+            else:
+                prefixes.append(random_seq(PRIMER_LEN))
+        prefixes = list(set(prefixes))
+
+        start = time.time()
+        expected = [match_by_edit_distance(p, primers, primers_rev, names, max_edit_distance) for p in prefixes]
+        scan_time = time.time() - start
+
+        start = time.time()
+        index = PrimerIndex(primers, primers_rev, names, max_edit_distance)
+        result = [index.match(p) for p in prefixes]
+        index_time = time.time() - start
+
+        assert result == expected
+        print("panel size {:5}: {:6} prefixes, full scan {:7.2f}s, index {:7.2f}s (x{:.1f})".format(
+            panel_size, len(prefixes), scan_time, index_time, scan_time / index_time))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
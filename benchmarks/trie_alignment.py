@@ -0,0 +1,56 @@
+"""
+Trie alignment benchmark - shared-prefix DP rows vs one PairwiseAligner alignment per read, on the EMX1 example.
+Usage: python benchmarks/trie_alignment.py [example zip]
+"""
+import os
+import sys
+import tempfile
+import time
+import zipfile
+import pandas as pd
+from crispector.input_processing.alignment import Alignment
+from crispector.input_processing.utils import parse_fastq_file
+from crispector.utils.configurator import Configurator
+from crispector.utils.constants_and_types import READ
+
+EXAMPLE_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "example",
+                           "EMX1_11_sites_singleplex_input_500k_reads.zip")
+
+
+def main(example_zip):
+    Configurator.set_cfg_path(None)
+    aligner = Alignment._create_aligner(Configurator.get_cfg()["alignment"])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(example_zip) as zip_file:
+            zip_file.extractall(tmp_dir)
+        example_dir = os.path.join(tmp_dir, os.listdir(tmp_dir)[0])
+        config_df = pd.read_csv([os.path.join(example_dir, name) for name in os.listdir(example_dir)
+                                 if name.endswith(".csv")][0])
+
+        total_nw_time, total_trie_time = 0, 0
+        for _, row in config_df.iterrows():
+            reads = list(parse_fastq_file(os.path.join(example_dir, "{}_tx_merged.fq.gz".format(
+                row["SiteName"])))[READ])
+            reference = row["AmpliconReference"]
+
+            start = time.time()
+            expected = {read: Alignment._needle_wunsch_align(aligner, reference, read) for read in reads}
+            nw_time = time.time() - start
+
+            start = time.time()
+            result = Alignment._trie_align(aligner, reference, reads)
+            trie_time = time.time() - start
+
+            assert result == expected, "Alignment mismatch in {}".format(row["SiteName"])
+            total_nw_time += nw_time
+            total_trie_time += trie_time
+            print("{:12}: {:6} unique reads, per read {:6.2f}s, trie {:6.2f}s (x{:.1f})".format(
+                row["SiteName"], len(reads), nw_time, trie_time, nw_time / trie_time))
+
+    print("total       : per read {:.2f}s, trie {:.2f}s (x{:.1f})".format(total_nw_time, total_trie_time,
+                                                                       total_nw_time / total_trie_time))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else EXAMPLE_ZIP)
@@ -49,7 +49,7 @@ class CoreAlgorithm:
         self._mock_df = tables.mock_reads
         self._n_reads_tx = tables.n_reads_tx
         self._n_reads_mock = tables.n_reads_mock
-        edited_indexes = []
+        edited_rows = []
 
         # Run evaluation on each modification type
         for table_idx, (indel_type, prior) in enumerate(zip(self._modifications.types, tables.priors)):
@@ -64,11 +64,12 @@ class CoreAlgorithm:
                 tx_indels, mock_indels = table[[C_TX, C_MOCK], self._tables_offset + pos_idx]
                 is_edit = self._classify_position(tx_indels, mock_indels, prior[pos_idx], binom_p)
                 self._edit[table_idx][pos_idx] = is_edit
-                if is_edit:
-                    edited_indexes += pointers[self._tables_offset + pos_idx]
+
+            # Reads of all edited positions (pointers rows start at the tables offset)
+            edited_rows.append(pointers[np.flatnonzero(self._edit[table_idx])].indices)
 
         # Compute editing activity.
-        result_dict = self._compute_editing_activity(edited_indexes)
+        result_dict = self._compute_editing_activity(np.concatenate(edited_rows))
 
         # Mark all edited modifications as an edit in modification distribution
         tables.set_tx_dist_is_edit_col(self._edit, self._tables_offset, self._win_size)
@@ -115,18 +116,18 @@ class CoreAlgorithm:
 
         raise ClassificationFailed()
 
-    def _compute_editing_activity(self, edited_indexes: List) -> AlgResult:
+    def _compute_editing_activity(self, edited_rows: np.ndarray) -> AlgResult:
         """
         - Compute editing activity.
         - Compute confidence interval
         - Fill inplace is_edit column in tx_read
-        :param edited_indexes: List
+        :param edited_rows: tx_read rows of all edited modifications (with duplicates)
         :return: AlgResult
         """
         # Compute editing activity & Fill inplace is_edit column in tx_read
-        edited_indexes = list(set(edited_indexes))  # remove duplicates
-        self._tx_df[IS_EDIT] = False
-        self._tx_df.loc[self._tx_df.index.isin(edited_indexes), IS_EDIT] = True
+        is_edit = np.zeros(self._tx_df.shape[0], dtype=bool)
+        is_edit[edited_rows] = True
+        self._tx_df[IS_EDIT] = is_edit
         edited_reads = self._tx_df.loc[self._tx_df[IS_EDIT], FREQ].sum()
         editing_activity = edited_reads / self._n_reads_tx
 
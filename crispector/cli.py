@@ -36,7 +36,7 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'], max_content_width=12
 @click.option('--fastp_options_string', type=click.STRING, default="-w 2 "
               "--adapter_sequence=AGATCGGAAGAGCACACGTCTGAACTCCAGTCA "
               "--adapter_sequence_r2=AGATCGGAAGAGCGTCGTGTAGGGAAAGAGTGT",
-              help="Try \"fastp --help\" for more details")
+              help="Try \"fastp --help\" for more details. fastp worker threads (-w) are set by --threads")
 @click.option("--min_num_of_reads", type=click.INT, default=500, show_default=True,
               help="Minimum number of reads (per locus site) to evaluate edit events")
 @click.option("--min_read_length_without_primers", type=click.INT, default=10, show_default=True,
@@ -73,6 +73,20 @@ CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'], max_content_width=12
               help="Do not create plots for sites (save memory and runtime)")
 @click.option('--keep_intermediate_files', is_flag=True, default=False, show_default=True, required=True,
               help="Keep intermediate files for debug purposes")
+@click.option("--fastp_cache_dir", type=click.Path(file_okay=False),
+              help="Cache folder for fastp merge results. Re-analysis of the same FASTQ files with the same "
+                   "--fastp_options_string reuses the cached results instead of running fastp (fastp always runs "
+                   "with --keep_intermediate_files) [OPTIONAL]")
+@click.option("--fastp_cache_size", type=click.FloatRange(min=0), default=20, show_default=True,
+              help="Maximum size (GB) of --fastp_cache_dir. Least recently used results are removed first.")
+@click.option("--alignment_cache", type=click.Path(dir_okay=False),
+              help="Cache file for read alignments. Reads that were aligned to the same amplicon in previous runs "
+                   "reuse the cached alignment instead of being re-aligned [OPTIONAL]")
+@click.option("--alignment_cache_size", type=click.FloatRange(min=0), default=5, show_default=True,
+              help="Maximum size (GB) of --alignment_cache. Least recently used alignments are removed first.")
+@click.option("--threads", type=click.IntRange(min=1), default=None,
+              help="Maximum number of CPUs to use (fastp jobs and parallel processing). Default is all available "
+                   "CPUs. fastp worker threads (-w) are set according to this budget.")
 @click.option('--verbose', is_flag=True, default=False, show_default=True,
               help="Higher verbosity")
 def main(**kwargs):
@@ -80,6 +94,8 @@ def main(**kwargs):
     kwargs["command_used"] = ' '.join(sys.argv)
     if kwargs["report_output"] is None:
         kwargs["report_output"] = os.path.abspath(os.getcwd())
+    if kwargs["threads"] is None:
+        kwargs["threads"] = os.cpu_count() or 1
 
     # Run crispector
     sys.exit(run(**kwargs))
@@ -9,7 +9,7 @@ from crispector.utils.exceptions import FastpRunTimeError, SgRNANotInReferenceSe
     AlignerSubstitutionDoesntExist, ClassificationFailed, BadSgRNAChar, BadReferenceAmpliconChar, BadInputError
 from crispector.utils.constants_and_types import Path, welcome_msg, FREQ, TX_READ_NUM, MOCK_READ_NUM, EDIT_PERCENT, \
     SITE_NAME, ON_TARGET, CUT_SITE, AlgResult, OUTPUT_DIR, SUMMARY_RESULTS_TITLES, \
-    AlgResultDf, DONOR
+    AlgResultDf, DONOR, ExpType
 from crispector.report.html_report import create_final_html_report
 from crispector.input_processing.input_processing import InputProcessing
 import traceback
@@ -30,7 +30,8 @@ def run(tx_in1: Path, tx_in2: Path, mock_in1: Path, mock_in2: Path, report_outpu
         min_read_length_without_primers: int, crispector_config: Path, override_noise_estimation: bool,
         max_edit_distance_on_primers: int, confidence_interval: float, min_editing_activity: float,
         translocation_p_value: float, suppress_site_output: bool, disable_translocations: bool,
-        enable_substitutions: bool, keep_intermediate_files: bool, command_used: str):
+        enable_substitutions: bool, keep_intermediate_files: bool, fastp_cache_dir: Path, fastp_cache_size: float,
+        alignment_cache: Path, alignment_cache_size: float, threads: int, command_used: str):
 
     try:
         # Create report output folder
@@ -74,7 +75,9 @@ def run(tx_in1: Path, tx_in2: Path, mock_in1: Path, mock_in2: Path, report_outpu
         # Create InputProcessing instance
         input_processing = InputProcessing(ref_df, output, amplicon_min_score, translocation_amplicon_min_score,
                                            min_read_length_without_primers, cut_site_position, disable_translocations,
-                                           fastp_options_string, keep_intermediate_files, max_edit_distance_on_primers)
+                                           fastp_options_string, keep_intermediate_files, max_edit_distance_on_primers,
+                                           threads, fastp_cache_dir, fastp_cache_size, alignment_cache,
+                                           alignment_cache_size)
 
         # process input
         tx_reads_d, mock_reads_d, tx_trans_df, mock_trans_df = input_processing.run(tx_in1, tx_in2, mock_in1, mock_in2)
@@ -96,7 +99,9 @@ def run(tx_in1: Path, tx_in2: Path, mock_in1: Path, mock_in2: Path, report_outpu
                 logger.info("Site {} - Discarded from evaluation due to low number of reads (treatment={}, "
                             "mock={}).".format(site, tx_reads_num, mock_reads_num))
             else:
-                tables_d[site] = ModificationTables(tx_reads_d[site], mock_reads_d[site], modifications, row)
+                tables_d[site] = ModificationTables(tx_reads_d[site], mock_reads_d[site], modifications, row,
+                                                    input_processing.indel_events(site, ExpType.TX),
+                                                    input_processing.indel_events(site, ExpType.MOCK))
                 logger.debug("Site {} - Converted. Number of reads (treatment={}, mock={}).".format(site,
                                                                                                     tx_reads_num,
                                                                                                     mock_reads_num))
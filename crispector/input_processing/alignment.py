@@ -1,19 +1,33 @@
 import gzip
 import os
 from crispector.utils.exceptions import AlignerSubstitutionDoesntExist
-from crispector.utils.constants_and_types import ReadsDf, IndelType, Path, DNASeq, CigarPath, \
-    READ, ALIGNMENT_W_INS, ALIGNMENT_W_DEL, CIGAR, ALIGN_SCORE, FREQ, INS_LEN, INS_POS, DEL_LEN, DEL_START, \
-    DEL_END, SUB_CNT, SUB_POS, INDEL_COLS, CIGAR_D, CIGAR_I, \
-    CIGAR_S, CIGAR_M, AlignedIndel, DEL_BASE, INS_BASE, SUB_BASE, REVERSED, CIGAR_LEN, CIGAR_LEN_THRESHOLD, \
-    ALIGN_CUT_SITE, ALIGNMENT_HUMAN, FILTERED_PATH, ExpType
-from crispector.input_processing.utils import reverse_complement, parse_cigar
+from crispector.utils.constants_and_types import ReadsDf, IndelType, Path, DNASeq, CigarPath, IndelEventsDf, \
+    READ, ALIGNMENT_W_INS, ALIGNMENT_W_DEL, CIGAR, ALIGN_SCORE, FREQ, READ_ID, CIGAR_OP_SHIFT, CIGAR_OP_I, \
+    CIGAR_OP_D, CIGAR_OP_M, CIGAR_OP_S, REVERSED, CIGAR_LEN, CIGAR_LEN_THRESHOLD, \
+    ALIGN_CUT_SITE, ALIGNMENT_HUMAN, FILTERED_PATH, ExpType, ALIGNMENT_CHUNK_SIZE, BANDED_ALIGNMENT_BATCH_SIZE, \
+    ALIGNMENT_BOUND_KMER_LEN, ALIGNMENT_EXACT_SCORE_UNIT, ALIGNMENT_EXACT_SCORE_MAX
+from crispector.input_processing.utils import reverse_complement, parse_cigar, pack_cigar
+from crispector.input_processing.banded_alignment import banded_align_batch
+from crispector.input_processing.edlib_alignment import edlib_align
+from crispector.input_processing.trie_alignment import trie_align_batch
+from crispector.input_processing.indel_shift import shift_indels_into_cut_site
+from crispector.input_processing.indel_events import compute_indel_events
+from crispector.input_processing.alignment_cache import AlignmentCache
 from crispector.utils.logger import LoggerWrapper
 from crispector.utils.configurator import Configurator
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional, Set
+import numpy as np
 import pandas as pd
 from Bio import Align
 from Bio.SubsMat import MatrixInfo
-from collections import defaultdict
+from collections import defaultdict, ChainMap
+from concurrent.futures import ProcessPoolExecutor
+
+# Read alignment - (alignment with ins, alignment with deletion, cigar path, cigar len, score, reversed flag)
+ReadAlignment = Tuple[DNASeq, DNASeq, CigarPath, int, float, bool]
+
+# Aligner of an alignment worker process (see Alignment.align_sites)
+_worker_aligner = None
 
 
 class Alignment:
@@ -21,8 +35,9 @@ class Alignment:
     All crispector alignment functionality - Needle-Wunsch, Shifting modification and so on.
     """
     def __init__(self, align_cfg: Dict, min_score: float, min_read_length_without_primers: int,
-                 window_size: int):
+                 window_size: int, alignment_cache: AlignmentCache = None):
         self._min_score = min_score
+        self._alignment_cache = alignment_cache
         self._window_size = window_size
 
         # Set logger
@@ -32,22 +47,151 @@ class Alignment:
         self._min_primer_dimer_thresh = min_read_length_without_primers
 
         # Create Aligner
-        # Init biopython aligner
-        self._aligner = Align.PairwiseAligner()
-        self._aligner.match_score = align_cfg["match_score"]
-        self._aligner.mismatch_score = align_cfg["mismatch_score"]
-        self._aligner.open_gap_score = align_cfg["open_gap_score"]
-        self._aligner.extend_gap_score = align_cfg["extend_gap_score"]
+        self._aligner = self._create_aligner(align_cfg)
+        self._align_cfg = align_cfg
+        # Self alignment is the identity alignment when no column scores more than a match
+        self._analytic_self_score = self._is_identity_optimal(self._aligner)
+        # Alignment shortcuts reproduce the alignment path of biopython only when gap opening is penalized
+        self._path_shortcuts = self._analytic_self_score and self._is_gap_open_penalized(self._aligner)
         if align_cfg["substitution_matrix"] != "":
-            if align_cfg["substitution_matrix"] in MatrixInfo.__dict__:
-                self._aligner.substitution_matrix = MatrixInfo.__dict__[align_cfg["substitution_matrix"]]
-                self._logger.warning("Shifting indels to cut-site isn't available for alignment with difference score"
-                                     "substitution matrix. Contact package owner if this feature is required")
+            self._logger.warning("Shifting indels to cut-site isn't available for alignment with difference score"
+                                 "substitution matrix. Contact package owner if this feature is required")
+
+        # Banded alignment - band margin or None if disabled
+        self._band_margin = None
+        if align_cfg.get("banded_alignment", False):
+            if self._is_banded_available(self._aligner):
+                self._band_margin = max(1, int(align_cfg["band_margin"]))
             else:
-                raise AlignerSubstitutionDoesntExist(align_cfg["substitution_matrix"])
+                self._logger.warning("Banded alignment isn't available for the configured alignment scores. "
+                                     "Reads are aligned without a band.")
+
+        # Trie alignment - DP shared by reads with a common prefix
+        self._trie_alignment = False
+        if align_cfg.get("trie_alignment", False):
+            if self._is_trie_available(self._aligner):
+                self._trie_alignment = True
+            else:
+                self._logger.warning("Trie alignment isn't available for the configured alignment scores. "
+                                     "Reads are aligned one by one.")
+
+    def align_sites(self, sites: List[Tuple[ReadsDf, DNASeq, int, int, Path, str, ExpType]], processes: int = 1) \
+            -> List[Tuple[ReadsDf, IndelEventsDf]]:
+        """
+        Align reads of several sites & experiments (see align_reads).
+        Sites with the same amplicon (e.g. treatment & mock of a site) are aligned together - the union of their
+        distinct oriented reads is aligned once, and shifting is computed once for each distinct alignment.
+        Needleman-Wunsch alignment is split to (amplicon, reads chunk) work units, which are aligned by a process pool -
+        largest units first. Results are identical to align_reads of each site.
+        If alignment cache is enabled, reads aligned in previous runs are taken from the cache.
+        :param sites: list of align_reads arguments - (reads_df, reference, cut_site, primers_len, output, exp_name,
+        exp_type)
+        :param processes: max number of worker processes
+        :return: List of align_reads results, in sites order
+        """
+        # Group sites by amplicon. Short reads (primer-dimer) are filtered regardless of their alignment, so they are
+        # handled separately for each site (see _align_short_reads).
+        groups_d: Dict[Tuple[DNASeq, int, bool], List[int]] = dict()
+        reads_l: List[List[DNASeq]] = [[] for _ in sites]
+        short_reads_l: List[List[DNASeq]] = [[] for _ in sites]
+        for site_idx, (reads_df, reference, cut_site, primers_len, *_) in enumerate(sites):
+            if reads_df.shape[0] == 0:
+                continue
+            min_len = primers_len + self._min_primer_dimer_thresh
+            site_reads = self._oriented_reads(reads_df).unique()
+            reads_l[site_idx] = [read for read in site_reads if len(read) >= min_len]
+            short_reads_l[site_idx] = [read for read in site_reads if len(read) < min_len]
+            groups_d.setdefault((reference, cut_site, REVERSED not in reads_df.columns), []).append(site_idx)
+        groups = list(groups_d.items())
+
+        # Create work units from the distinct oriented reads of each amplicon
+        units = []
+        align_d_l: List[Dict[DNASeq, ReadAlignment]] = [dict() for _ in groups]
+        cache_keys_l: List[Optional[str]] = len(groups) * [None]
+        for group_idx, ((reference, _, both_directions), site_idx_l) in enumerate(groups):
+            reads = list(dict.fromkeys([read for site_idx in site_idx_l for read in reads_l[site_idx]]))
+            group_name = ", ".join([sites[site_idx][5] for site_idx in site_idx_l])
+
+            # Reuse alignments from previous runs
+            if self._alignment_cache is not None:
+                cache_keys_l[group_idx] = self._alignment_cache.key(reference, both_directions, self._align_cfg)
+                align_d_l[group_idx] = self._alignment_cache.get(cache_keys_l[group_idx], reads)
+                self._logger.info("Alignment for {} - Alignment cache hits for {:,} of {:,} reads ({:.2f}%)".format(
+                                  group_name, len(align_d_l[group_idx]), len(reads),
+                                  100 * len(align_d_l[group_idx]) / max(len(reads), 1)))
+                reads = [read for read in reads if read not in align_d_l[group_idx]]
+
+            for start in range(0, len(reads), ALIGNMENT_CHUNK_SIZE):
+                units.append((group_idx, reference, both_directions, reads[start:start + ALIGNMENT_CHUNK_SIZE]))
+        units.sort(key=lambda unit: len(unit[3]) * len(unit[1]) * (2 if unit[2] else 1), reverse=True)
+
+        # Align all work units
+        new_align_d_l: List[Dict[DNASeq, ReadAlignment]] = [dict() for _ in groups]
+        first_pass_n_l, accepted_n_l = len(groups) * [0], len(groups) * [0]
+        banded_n_l, fallback_n_l = len(groups) * [0], len(groups) * [0]
+        processes = min(processes, len(units))
+        self._logger.debug("Alignment - Align {} work units with {} processes.".format(len(units), max(processes, 1)))
+        if processes > 1:
+            pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_alignment_worker,
+                                       initargs=(self._align_cfg,))
+            unit_results = pool.map(_align_reads_unit, [unit[1] for unit in units], [unit[2] for unit in units],
+                                    [unit[3] for unit in units], len(units) * [self._band_margin],
+                                    len(units) * [self._trie_alignment])
+        else:
+            pool = None
+            unit_results = (self._align_reads_unit(self._aligner, reference, both_directions, reads,
+                                                   self._band_margin, self._trie_alignment)
+                            for _, reference, both_directions, reads in units)
+        try:
+            for unit, (unit_result, first_pass_n, accepted_n, banded_n, fallback_n) in zip(units, unit_results):
+                new_align_d_l[unit[0]].update(zip(unit[3], unit_result))
+                first_pass_n_l[unit[0]] += first_pass_n
+                accepted_n_l[unit[0]] += accepted_n
+                banded_n_l[unit[0]] += banded_n
+                fallback_n_l[unit[0]] += fallback_n
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        for group_idx, new_align_d in enumerate(new_align_d_l):
+            align_d_l[group_idx].update(new_align_d)
+            if (self._alignment_cache is not None) and (len(new_align_d) > 0):
+                self._alignment_cache.put(cache_keys_l[group_idx], new_align_d)
+
+        # Report edlib first pass acceptance rate
+        for (_, site_idx_l), first_pass_n, accepted_n in zip(groups, first_pass_n_l, accepted_n_l):
+            if first_pass_n > 0:
+                self._logger.info("Alignment for {} - edlib first pass accepted {:,} of {:,} alignments "
+                                  "({:.2f}%)".format(", ".join([sites[site_idx][5] for site_idx in site_idx_l]),
+                                                     accepted_n, first_pass_n, 100 * accepted_n / first_pass_n))
+
+        # Report banded alignment fallback rate
+        if self._band_margin is not None:
+            for (_, site_idx_l), banded_n, fallback_n in zip(groups, banded_n_l, fallback_n_l):
+                if banded_n > 0:
+                    self._logger.info("Alignment for {} - Banded alignment fallback for {:,} of {:,} alignments "
+                                      "({:.2f}%)".format(", ".join([sites[site_idx][5] for site_idx in site_idx_l]),
+                                                         fallback_n, banded_n, 100 * fallback_n / banded_n))
+
+        # Short reads & per site processing. Shifting is shared by all sites of the amplicon.
+        results_l: List[Optional[Tuple[ReadsDf, IndelEventsDf]]] = len(sites) * [None]
+        for ((reference, _, both_directions), site_idx_l), align_d in zip(groups, align_d_l):
+            shift_d = dict()
+            for site_idx in site_idx_l:
+                site_align_d = align_d
+                if len(short_reads_l[site_idx]) > 0:
+                    max_score = max([align_d[read][4] for read in reads_l[site_idx]], default=float("-inf"))
+                    site_align_d = ChainMap(self._align_short_reads(reference, both_directions,
+                                                                    short_reads_l[site_idx], max_score), align_d)
+                results_l[site_idx] = self.align_reads(*sites[site_idx], align_d=site_align_d, shift_d=shift_d)
+
+        # Sites without reads
+        return [self.align_reads(*site) if result is None else result for site, result in zip(sites, results_l)]
 
     def align_reads(self, reads_df: ReadsDf, reference: DNASeq, cut_site: int, primers_len: int,
-                    output: Path, exp_name: str, exp_type: ExpType) -> ReadsDf:
+                    output: Path, exp_name: str, exp_type: ExpType,
+                    align_d: Dict[DNASeq, ReadAlignment] = None,
+                    shift_d: Dict = None) -> Tuple[ReadsDf, IndelEventsDf]:
         """
         - Align each read to his reference and filter noisy alignments.
         - Function add columns to reads_df in place.
@@ -58,16 +202,22 @@ class Alignment:
         :param output: output path for filtered reads
         :param exp_name: experiment name
         :param exp_type:
-        :return: reads_df with new columns & filtered reads (ReadDf type)
+        :param align_d: precomputed alignments of the oriented reads (see align_sites). None to align here.
+        :param shift_d: shifted alignments, shared with other sites of the same amplicon (see align_sites)
+        :return: reads_df with new columns & filtered reads (ReadDf type), and the reads indel events in the
+        qualification window (IndelEventsDf type)
         """
 
         if reads_df.shape[0] == 0:
-            return reads_df
+            return reads_df, compute_indel_events([], [], [], cut_site, self._window_size)[0]
+
+        if align_d is None:
+            return self.align_sites([(reads_df, reference, cut_site, primers_len, output, exp_name, exp_type)])[0]
 
         # Align reads to their amplicon
         self._logger.debug("Alignment for {} - Start Needleman-Wunsch alignment for all reads.".format(exp_name))
 
-        self._align_reads_to_amplicon(reads_df, reference)
+        self._align_reads_to_amplicon(reads_df, reference, align_d)
 
         # Filter reads with low alignment score
         self._filter_low_score_reads(reads_df, primers_len, output, exp_name, exp_type)
@@ -76,20 +226,20 @@ class Alignment:
 
         # Shift modification into cut-site
         self._logger.debug("Alignment for {} - Start shift modifications into cut-site.".format(exp_name))
-        self._shift_modifications_into_cut_site(reads_df, cut_site)
+        self._shift_modifications_into_cut_site(reads_df, cut_site, shift_d)
         self._logger.debug("Alignment for {} - Shift modifications into cut-site done.".format(exp_name))
 
         # Split read_df to all the different sites
         reads_df = reads_df.sort_values(by=[FREQ], ascending=False).reset_index(drop=True)
 
-        # Add indels columns to reads df
-        self._add_indels_columns(reads_df, cut_site)
+        # Compute indel events & add alignment cut-site column to reads df
+        indel_events = self._compute_indel_events(reads_df, cut_site)
 
         # Remove unnecessary columns
         reads_df.drop(columns=[REVERSED], inplace=True)
         self._logger.info("Alignment for {} - Done.".format(exp_name))
 
-        return reads_df
+        return reads_df, indel_events
 
     def needle_wunsch_align(self, reference: DNASeq, read: DNASeq) -> Tuple[DNASeq, DNASeq, CigarPath, int, float]:
         """
@@ -99,12 +249,26 @@ class Alignment:
         :param : aligner: type Align.PairwiseAligner
         :return: (alignment with ins, alignment with deletion, cigar path, score)
         """
-        alignments = self._aligner.align(reference, read)
-        [ref_with_ins, _, read_with_del, _] = format(alignments[0]).split("\n")
-        cigar_path, cigar_len = self._compute_cigar_path_from_alignment(reference=ref_with_ins, read=read_with_del)
-        align_score = alignments[0].score
+        return self._needle_wunsch_align(self._aligner, reference, read)
 
-        return ref_with_ins, read_with_del, cigar_path, cigar_len, align_score
+    def align_score(self, reference: DNASeq, read: DNASeq) -> float:
+        """
+        Compute needle wunsch alignment score only, without traceback (same score as needle_wunsch_align).
+        :param reference: amplicon reference sequences
+        :param read: read
+        :return: alignment score
+        """
+        return self._aligner.score(reference, read)
+
+    def self_align_score(self, reference: DNASeq) -> float:
+        """
+        Compute the alignment score of reference against itself (max alignment score for reference).
+        :param reference: reference sequence
+        :return: alignment score
+        """
+        if self._analytic_self_score:
+            return float(len(reference) * self._align_cfg["match_score"])
+        return self.align_score(reference, reference)
 
     def match_by_full_alignment(self, read: DNASeq, references: List[DNASeq], names: List[str],
                                 reverse_l: List[bool], ref_score_l) -> Tuple[str, bool, float]:
@@ -118,14 +282,12 @@ class Alignment:
         :param ref_score_l: List of alignment scores
         :return: site_name
         """
-        alignments = self._aligner.align(references[0], read)
         max_name = names[0]
-        max_score = alignments[0].score / ref_score_l[0]
+        max_score = self.align_score(references[0], read) / ref_score_l[0]
         max_rev = reverse_l[0]
 
         for reference, name, ref_score, rev in zip(references[1:], names[1:], ref_score_l[1:], reverse_l[1:]):
-            alignments = self._aligner.align(reference, read)
-            score = alignments[0].score / ref_score
+            score = self.align_score(reference, read) / ref_score
             if score > max_score:
                 max_score = score
                 max_name = name
@@ -165,6 +327,48 @@ class Alignment:
     #-------------------------------#
     ######### Private methods #######
     #-------------------------------#
+    def _align_short_reads(self, reference: DNASeq, both_directions: bool, reads: List[DNASeq],
+                           max_score: float) -> Dict[DNASeq, ReadAlignment]:
+        """
+        Pre-alignment of short reads (primer-dimer), which are filtered regardless of their alignment.
+        Only what _filter_low_score_reads needs is computed:
+        - Read orientation & score (site max score) - score only alignment.
+        - Reads below the score threshold are written twice to the filtered reads file if their cigar is long, so
+          only they are fully aligned.
+        :param reference: reference sequence
+        :param both_directions: Flag
+        :param reads: oriented short reads
+        :param max_score: max alignment score of all the other reads of the site
+        :return: Dict[read, alignment]. Alignment sequences & cigar are None for reads which weren't fully aligned.
+        """
+        rev_reference = reverse_complement(reference)
+        rev_reference_kmers = self._kmers(rev_reference)
+        scores_d = dict()
+        for read in reads:
+            score = self._aligner.score(reference, read)
+            reversed_read = False
+            if both_directions and (self._kmer_score_upper_bound(self._aligner, rev_reference_kmers,
+                                                                 len(rev_reference), read) > score):
+                rev_score = self._aligner.score(rev_reference, read)
+                if rev_score > score:
+                    score, reversed_read = rev_score, True
+            scores_d[read] = (score, reversed_read)
+
+        # Site score threshold (see _filter_low_score_reads)
+        max_score = max([max_score] + [score for score, _ in scores_d.values()])
+        score_threshold = (self._min_score / 100) * max_score
+
+        align = self._needle_wunsch_align_trimmed if self._path_shortcuts else self._needle_wunsch_align
+        short_align_d = dict()
+        for read, (score, reversed_read) in scores_d.items():
+            if score < score_threshold:
+                short_align_d[read] = align(self._aligner, rev_reference if reversed_read else reference, read) + \
+                                      (reversed_read,)
+            else:
+                short_align_d[read] = (None, None, None, 0, score, reversed_read)
+
+        return short_align_d
+
     def _filter_low_score_reads(self, reads_df: ReadsDf, primers_len: int, output: Path, exp_name: str,
                                 exp_type: ExpType):
         """
@@ -206,13 +410,14 @@ class Alignment:
         # remove unaligned reads from reads_df
         reads_df.drop(unaligned_df.index, inplace=True)
 
-    def _align_reads_to_amplicon(self, reads: ReadsDf, reference: DNASeq):
+    def _align_reads_to_amplicon(self, reads: ReadsDf, reference: DNASeq, align_d: Dict[DNASeq, ReadAlignment]):
         """
         - Align all reads to their amplicon.
         - Compute cigar path.
         - Compute score
         :param reads: all reads
         :param reference - reference sequence
+        :param align_d: alignments of the oriented reads
         :return:
         """
 
@@ -220,27 +425,17 @@ class Alignment:
         # Otherwise - compute both directions of the alignment.
 
         rev_flag = REVERSED in reads.columns
-        rev_reference = reverse_complement(reference)
 
         # Reverse all the reversed reads
-        if rev_flag:
-            rev_reads = reads.loc[reads[REVERSED], READ]
-            reads.loc[rev_reads.index, READ] = rev_reads.apply(reverse_complement)
+        reads[READ] = self._oriented_reads(reads)
 
+        # Each distinct read is aligned only once. After the orientation above, a read and its reverse complement
+        # share the same sequence.
         new_cols_d = defaultdict(list)
-        for row_idx, row in reads.iterrows():
-            ref_w_ins, read_w_del, cigar, c_len, score = self.needle_wunsch_align(
-                reference=reference, read=row[READ])
-            # compute both directions of alignment
+        for read in reads[READ]:
+            ref_w_ins, read_w_del, cigar, c_len, score, reversed_read = align_d[read]
             if not rev_flag:
-                rev_ref_w_ins, rev_read_w_del, rev_cigar, rev_c_len, rev_score = self.needle_wunsch_align(
-                    reference=rev_reference, read=row[READ])
-                if rev_score > score:
-                    ref_w_ins, read_w_del, cigar, c_len, score = rev_ref_w_ins, rev_read_w_del, rev_cigar, rev_c_len, rev_score
-                    new_cols_d[REVERSED].append(True)
-                else:
-                    new_cols_d[REVERSED].append(False)
-
+                new_cols_d[REVERSED].append(reversed_read)
             new_cols_d[ALIGNMENT_W_INS].append(ref_w_ins)
             new_cols_d[ALIGNMENT_W_DEL].append(read_w_del)
             new_cols_d[CIGAR].append(cigar)
@@ -255,6 +450,388 @@ class Alignment:
             rev_reads = reads.loc[reads[REVERSED], READ]
             reads.loc[rev_reads.index, READ] = rev_reads.apply(reverse_complement)
 
+    @staticmethod
+    def _oriented_reads(reads: ReadsDf) -> pd.Series:
+        """
+        Return reads sequences with all the reversed reads (REVERSED column) reverse complemented.
+        :param reads: all reads
+        :return: READ column after orientation
+        """
+        oriented = reads[READ].copy()
+        if REVERSED in reads.columns:
+            rev_reads = reads.loc[reads[REVERSED], READ]
+            oriented.loc[rev_reads.index] = rev_reads.apply(reverse_complement)
+        return oriented
+
+    @staticmethod
+    def _create_aligner(align_cfg: Dict) -> Align.PairwiseAligner:
+        """
+        Init biopython aligner
+        :param align_cfg: alignment configuration
+        :return: Align.PairwiseAligner
+        """
+        aligner = Align.PairwiseAligner()
+        aligner.match_score = align_cfg["match_score"]
+        aligner.mismatch_score = align_cfg["mismatch_score"]
+        aligner.open_gap_score = align_cfg["open_gap_score"]
+        aligner.extend_gap_score = align_cfg["extend_gap_score"]
+        if align_cfg["substitution_matrix"] != "":
+            if align_cfg["substitution_matrix"] in MatrixInfo.__dict__:
+                aligner.substitution_matrix = MatrixInfo.__dict__[align_cfg["substitution_matrix"]]
+            else:
+                raise AlignerSubstitutionDoesntExist(align_cfg["substitution_matrix"])
+        return aligner
+
+    @classmethod
+    def _needle_wunsch_align(cls, aligner: Align.PairwiseAligner, reference: DNASeq, read: DNASeq) \
+            -> Tuple[DNASeq, DNASeq, CigarPath, int, float]:
+        """
+        Compute needle wunsch alignment, cigar_path and score with aligner (see needle_wunsch_align).
+        """
+        alignments = aligner.align(reference, read)
+        ref_with_ins, read_with_del, cigar_path, cigar_len = cls._compute_alignment_from_path(reference, read,
+                                                                                           alignments[0].path)
+        align_score = alignments[0].score
+
+        return ref_with_ins, read_with_del, cigar_path, cigar_len, align_score
+
+    @classmethod
+    def _align_reads_unit(cls, aligner: Align.PairwiseAligner, reference: DNASeq, both_directions: bool,
+                          reads: List[DNASeq], band_margin: int = None, trie: bool = False) \
+            -> Tuple[List[ReadAlignment], int, int, int, int]:
+        """
+        Align reads to reference. If both_directions, reads are aligned also to the reference reverse complement,
+        and the best direction is returned.
+        Reads are aligned with edlib first pass (see _edlib_align), and the rest with the banded aligner (if enabled)
+        and then with the trie aligner (if enabled) or Needleman-Wunsch.
+        :param aligner: Align.PairwiseAligner
+        :param reference: reference sequence
+        :param both_directions: Flag
+        :param reads: oriented reads
+        :param band_margin: banded alignment margin. None to align without a band. Ignored if not
+        _is_banded_available(aligner).
+        :param trie: Flag, align with the trie aligner (see _trie_align). Ignored if not _is_trie_available(aligner).
+        :return: alignment of each read (in reads order), number of edlib first pass alignments, number of accepted
+        edlib first pass alignments, number of banded alignments and number of banded alignments which fell back to
+        the unbanded aligner
+        """
+        rev_reference = reverse_complement(reference)
+        rev_reference_kmers = cls._kmers(rev_reference) if both_directions else None
+        identity_optimal = cls._is_identity_optimal(aligner)
+        path_shortcuts = identity_optimal and cls._is_gap_open_penalized(aligner)
+        nw_align = cls._needle_wunsch_align_trimmed if path_shortcuts else cls._needle_wunsch_align
+
+        def align(align_reference: DNASeq, read: DNASeq) -> Tuple[DNASeq, DNASeq, CigarPath, int, float]:
+            first_pass_alignment = cls._edlib_align(aligner, align_reference, read) if path_shortcuts else None
+            return nw_align(aligner, align_reference, read) if first_pass_alignment is None else first_pass_alignment
+
+        # edlib first pass for all reads which aren't identical to the reference
+        first_pass_d = dict()
+        if path_shortcuts:
+            first_pass_d = {read: cls._edlib_align(aligner, reference, read) for read in reads if read != reference}
+        accepted_n = sum([alignment is not None for alignment in first_pass_d.values()])
+
+        # Banded alignment for all other reads
+        banded_d = dict()
+        if (band_margin is not None) and cls._is_banded_available(aligner):
+            banded_d = cls._banded_align(aligner, reference, [read for read in reads if (read != reference) and
+                                                              (first_pass_d.get(read) is None)], band_margin)
+        fallback_n = sum([alignment is None for alignment in banded_d.values()])
+
+        # Trie alignment for all other reads
+        trie_d = dict()
+        if trie and cls._is_trie_available(aligner):
+            trie_d = cls._trie_align(aligner, reference, [read for read in reads if
+                                                          ((read != reference) or not path_shortcuts) and
+                                                          (first_pass_d.get(read) is None) and
+                                                          (banded_d.get(read) is None)])
+
+        results = []
+        for read in reads:
+            # Read is identical to the reference reverse complement - reversed alignment is the best one
+            if both_directions and identity_optimal and (read == rev_reference) and (read != reference):
+                results.append(nw_align(aligner, rev_reference, read) + (True,))
+                continue
+            alignment = first_pass_d.get(read)
+            if alignment is None:
+                alignment = banded_d.get(read)
+            if alignment is None:
+                alignment = trie_d.get(read)
+            if alignment is None:
+                alignment = nw_align(aligner, reference, read)
+            ref_w_ins, read_w_del, cigar, c_len, score = alignment
+            reversed_read = False
+            # compute both directions of alignment. Reversed alignment is used only if its score is higher.
+            if both_directions and \
+                    (cls._kmer_score_upper_bound(aligner, rev_reference_kmers, len(rev_reference), read) > score) and \
+                    (aligner.score(rev_reference, read) > score):
+                ref_w_ins, read_w_del, cigar, c_len, score = align(rev_reference, read)
+                reversed_read = True
+            results.append((ref_w_ins, read_w_del, cigar, c_len, score, reversed_read))
+        return results, len(first_pass_d), accepted_n, len(banded_d), fallback_n
+
+    @staticmethod
+    def _kmers(sequence: DNASeq) -> Set[DNASeq]:
+        return {sequence[idx:idx + ALIGNMENT_BOUND_KMER_LEN]
+                for idx in range(len(sequence) - ALIGNMENT_BOUND_KMER_LEN + 1)}
+
+    @classmethod
+    def _kmer_score_upper_bound(cls, aligner: Align.PairwiseAligner, reference_kmers: Set[DNASeq],
+                                reference_len: int, read: DNASeq) -> float:
+        """
+        Upper bound on the alignment score of read to a reference, from their lengths & shared k-mers.
+        - Length bound - at most min length matches, and a gap if the lengths differ.
+        - k-mer bound - every read k-mer which isn't a reference k-mer overlaps a mismatch, an insertion or a
+          deletion junction. Each of them costs at least min_loss per k-mer, relative to a full match of the read.
+        Valid only if _is_identity_optimal(aligner) and _is_gap_open_penalized(aligner) - otherwise split gaps can
+        score more than a single gap of the length difference.
+        :param aligner: Align.PairwiseAligner
+        :param reference_kmers: reference k-mers (see _kmers)
+        :param reference_len: reference length
+        :param read: read
+        :return: score upper bound (inf if no bound is available for the aligner scores)
+        """
+        if not (cls._is_identity_optimal(aligner) and cls._is_gap_open_penalized(aligner)):
+            return float("inf")
+        match, mismatch = aligner.match_score, aligner.mismatch_score
+        open_gap, extend_gap = aligner.open_gap_score, aligner.extend_gap_score
+        k = ALIGNMENT_BOUND_KMER_LEN
+
+        len_diff = abs(len(read) - reference_len)
+        length_bound = match * min(len(read), reference_len) + \
+            ((open_gap + (len_diff - 1) * extend_gap) if len_diff > 0 else 0)
+
+        missing_n = sum([read[idx:idx + k] not in reference_kmers for idx in range(len(read) - k + 1)])
+        min_loss = min((match - mismatch) / k, (match - open_gap) / k, match, -open_gap / (k - 1))
+        kmer_bound = match * len(read) - missing_n * min_loss
+
+        return min(length_bound, kmer_bound)
+
+    @classmethod
+    def _edlib_align(cls, aligner: Align.PairwiseAligner, reference: DNASeq, read: DNASeq) \
+            -> Optional[Tuple[DNASeq, DNASeq, CigarPath, int, float]]:
+        """
+        edlib first pass alignment (see edlib_align). Same result as _needle_wunsch_align.
+        :return: alignment, or None if its optimality can't be proved
+        """
+        alignment = edlib_align(reference, read, aligner.match_score, aligner.mismatch_score,
+                                aligner.open_gap_score, aligner.extend_gap_score)
+        if alignment is None:
+            return None
+        path, score = alignment
+        return cls._compute_alignment_from_path(reference, read, path) + (score,)
+
+    @classmethod
+    def _trie_align(cls, aligner: Align.PairwiseAligner, reference: DNASeq, reads: List[DNASeq]) \
+            -> Dict[DNASeq, Tuple[DNASeq, DNASeq, CigarPath, int, float]]:
+        """
+        Trie alignment of reads (see trie_align_batch). Same result as _needle_wunsch_align.
+        :return: Dict[read, alignment]
+        """
+        align_d = dict()
+        if len(reads) == 0:
+            return align_d
+        for read, (path, score) in zip(reads, trie_align_batch(reference, reads, aligner.match_score,
+                                                                aligner.mismatch_score, aligner.open_gap_score,
+                                                                aligner.extend_gap_score)):
+            align_d[read] = cls._compute_alignment_from_path(reference, read, path) + (score,)
+        return align_d
+
+    @classmethod
+    def _banded_align(cls, aligner: Align.PairwiseAligner, reference: DNASeq, reads: List[DNASeq],
+                      band_margin: int) -> Dict[DNASeq, Optional[Tuple[DNASeq, DNASeq, CigarPath, int, float]]]:
+        """
+        Banded alignment of reads to reference (see banded_align_batch). Reads are batched by length, so each batch
+        shares a narrow band.
+        :param aligner: Align.PairwiseAligner
+        :param reference: reference sequence
+        :param reads: reads
+        :param band_margin: band margin
+        :return: Dict[read, needle_wunsch_align result or None if banded alignment isn't optimal]
+        """
+        banded_d = dict()
+        reads = sorted(reads, key=len)
+        batch_start = 0
+        for batch_end in range(1, len(reads) + 1):
+            if (batch_end < len(reads)) and (batch_end - batch_start < BANDED_ALIGNMENT_BATCH_SIZE) and \
+                    (len(reads[batch_end]) - len(reads[batch_start]) <= band_margin):
+                continue
+            batch = reads[batch_start:batch_end]
+            batch_results = banded_align_batch(reference, batch, aligner.match_score, aligner.mismatch_score,
+                                               aligner.open_gap_score, aligner.extend_gap_score, band_margin)
+            for read, result in zip(batch, batch_results):
+                if result is None:
+                    banded_d[read] = None
+                else:
+                    path, score = result
+                    banded_d[read] = cls._compute_alignment_from_path(reference, read, path) + (score,)
+            batch_start = batch_end
+
+        return banded_d
+
+    @staticmethod
+    def _is_identity_optimal(aligner: Align.PairwiseAligner) -> bool:
+        """
+        Return True if no alignment column scores more than a match, i.e. the identity alignment of a sequence to
+        itself is its unique best alignment.
+        """
+        return (aligner.substitution_matrix is None) and (aligner.match_score > 0) and \
+               (aligner.mismatch_score <= aligner.match_score) and (aligner.open_gap_score <= 0) and \
+               (aligner.extend_gap_score <= 0)
+
+    @staticmethod
+    def _is_gap_open_penalized(aligner: Align.PairwiseAligner) -> bool:
+        """
+        Return True if opening a gap scores less than extending it (biopython aligns with Gotoh algorithm). The
+        alignment shortcuts rely on it - a single gap scores more than split gaps of the same total length.
+        """
+        return aligner.open_gap_score < aligner.extend_gap_score
+
+    @staticmethod
+    def _is_gotoh(aligner: Align.PairwiseAligner) -> bool:
+        """
+        Return True if biopython aligns with Gotoh algorithm (open gap score differs from extend gap score).
+        With linear gap scores biopython uses Needleman-Wunsch algorithm, which breaks ties differently.
+        """
+        return aligner.open_gap_score != aligner.extend_gap_score
+
+    @staticmethod
+    def _is_score_exact(aligner: Align.PairwiseAligner) -> bool:
+        """
+        Return True if match, mismatch and gap scores are multiples of ALIGNMENT_EXACT_SCORE_UNIT (and not larger than
+        ALIGNMENT_EXACT_SCORE_MAX). Alignment scores are then exact in float64, so the numpy aligners compare scores
+        as biopython does. Otherwise, rounding can break ties differently.
+        """
+        scores = [aligner.match_score, aligner.mismatch_score, aligner.open_gap_score, aligner.extend_gap_score]
+        return all([(score / ALIGNMENT_EXACT_SCORE_UNIT).is_integer() and (abs(score) <= ALIGNMENT_EXACT_SCORE_MAX)
+                    for score in scores])
+
+    @classmethod
+    def _is_banded_available(cls, aligner: Align.PairwiseAligner) -> bool:
+        """
+        Return True if the banded aligner reproduces the alignment of biopython Gotoh algorithm.
+        """
+        return cls._is_identity_optimal(aligner) and cls._is_gap_open_penalized(aligner) and \
+            cls._is_score_exact(aligner)
+
+    @classmethod
+    def _is_trie_available(cls, aligner: Align.PairwiseAligner) -> bool:
+        """
+        Return True if the trie aligner reproduces the alignment of biopython Gotoh algorithm.
+        """
+        return (aligner.substitution_matrix is None) and cls._is_gotoh(aligner) and cls._is_score_exact(aligner)
+
+    @classmethod
+    def _needle_wunsch_align_trimmed(cls, aligner: Align.PairwiseAligner, reference: DNASeq, read: DNASeq) \
+            -> Tuple[DNASeq, DNASeq, CigarPath, int, float]:
+        """
+        Needleman-Wunsch alignment that aligns only the part of the read which differs from the reference:
+        - Read identical to the reference gets an all match alignment.
+        - Otherwise, the longest common prefix and suffix are matched and only the middle part is aligned.
+        If the first gap of the middle part could be shifted into the common prefix (biopython places such gaps as
+        left as possible), the read is aligned in full. Result is the same as _needle_wunsch_align.
+        Valid only if _is_identity_optimal(aligner) and _is_gap_open_penalized(aligner).
+        """
+        ref_len, read_len = len(reference), len(read)
+        if reference == read:
+            return reference, read, pack_cigar([(ref_len << CIGAR_OP_SHIFT) | CIGAR_OP_M]), 0, \
+                float(ref_len * aligner.match_score)
+
+        # Common prefix & suffix
+        prefix_len = len(os.path.commonprefix([reference, read]))
+        max_suffix_len = min(ref_len, read_len) - prefix_len
+        suffix_len = 0
+        while (suffix_len < max_suffix_len) and (reference[-suffix_len - 1] == read[-suffix_len - 1]):
+            suffix_len += 1
+        ref_middle = reference[prefix_len:ref_len - suffix_len]
+        read_middle = read[prefix_len:read_len - suffix_len]
+
+        # Align the middle part. Only a single gap is possible if one of the parts is empty.
+        if (len(ref_middle) == 0) or (len(read_middle) == 0):
+            gap_len = len(ref_middle) + len(read_middle)
+            middle_path = ((0, 0), (len(ref_middle), len(read_middle)))
+            middle_score = aligner.open_gap_score + (gap_len - 1) * aligner.extend_gap_score
+        else:
+            alignment = aligner.align(ref_middle, read_middle)[0]
+            middle_path = alignment.path
+            middle_score = alignment.score
+
+        # Check if the first gap can be shifted into the prefix
+        (ref_start, read_start), (ref_end, read_end) = middle_path[0], middle_path[1]
+        if prefix_len > 0:
+            if (ref_start == ref_end) and (read_middle[read_end - 1] == read[prefix_len - 1]):
+                return cls._needle_wunsch_align(aligner, reference, read)
+            if (read_start == read_end) and (ref_middle[ref_end - 1] == reference[prefix_len - 1]):
+                return cls._needle_wunsch_align(aligner, reference, read)
+
+        # Full alignment path - merge adjacent aligned blocks
+        path = [(0, 0)]
+        for ref_idx, read_idx in [(prefix_len + ref_idx, prefix_len + read_idx) for ref_idx, read_idx in middle_path] \
+                + [(ref_len, read_len)]:
+            if (ref_idx, read_idx) == path[-1]:
+                continue
+            if len(path) >= 2:
+                (prev_ref, prev_read), (last_ref, last_read) = path[-2], path[-1]
+                if (last_ref > prev_ref) and (last_read > prev_read) and (ref_idx > last_ref) and \
+                        (read_idx > last_read) and (last_ref - prev_ref == last_read - prev_read):
+                    path[-1] = (ref_idx, read_idx)
+                    continue
+            path.append((ref_idx, read_idx))
+
+        ref_with_ins, read_with_del, cigar_path, cigar_len = cls._compute_alignment_from_path(reference, read, path)
+        align_score = float((prefix_len + suffix_len) * aligner.match_score + middle_score)
+
+        return ref_with_ins, read_with_del, cigar_path, cigar_len, align_score
+
+    @staticmethod
+    def _compute_alignment_from_path(reference: DNASeq, read: DNASeq, path: Tuple[Tuple[int, int], ...]) \
+            -> Tuple[DNASeq, DNASeq, CigarPath, int]:
+        """
+        Build the gapped sequences and the cigar path from biopython alignment path (coordinates of the alignment
+        blocks). Same result as format(alignment) followed by _compute_cigar_path_from_alignment.
+        :param reference: reference sequence
+        :param read: read sequence
+        :param path: alignment path - (reference index, read index) of every block edge
+        :return: reference with insertions, read with deletions, cigar_path, cigar len
+        """
+        ref_parts, read_parts, cigar_path = [], [], []
+        for (ref_start, read_start), (ref_end, read_end) in zip(path[:-1], path[1:]):
+            # Insertion
+            if ref_start == ref_end:
+                ref_parts.append((read_end - read_start) * "-")
+                read_parts.append(read[read_start:read_end])
+                cigar_path.append(((read_end - read_start) << CIGAR_OP_SHIFT) | CIGAR_OP_I)
+            # Deletion
+            elif read_start == read_end:
+                ref_parts.append(reference[ref_start:ref_end])
+                read_parts.append((ref_end - ref_start) * "-")
+                cigar_path.append(((ref_end - ref_start) << CIGAR_OP_SHIFT) | CIGAR_OP_D)
+            # Aligned block - matches & mismatches
+            else:
+                ref_block, read_block = reference[ref_start:ref_end], read[read_start:read_end]
+                ref_parts.append(ref_block)
+                read_parts.append(read_block)
+                if ref_block == read_block:
+                    cigar_path.append((len(ref_block) << CIGAR_OP_SHIFT) | CIGAR_OP_M)
+                    continue
+                mismatches = [pos for pos, (ref_bp, read_bp) in enumerate(zip(ref_block, read_block))
+                              if ref_bp != read_bp]
+                match_start = 0
+                idx = 0
+                while idx < len(mismatches):
+                    end_idx = idx
+                    while (end_idx + 1 < len(mismatches)) and (mismatches[end_idx + 1] == mismatches[end_idx] + 1):
+                        end_idx += 1
+                    if mismatches[idx] > match_start:
+                        cigar_path.append(((mismatches[idx] - match_start) << CIGAR_OP_SHIFT) | CIGAR_OP_M)
+                    cigar_path.append(((mismatches[end_idx] - mismatches[idx] + 1) << CIGAR_OP_SHIFT) | CIGAR_OP_S)
+                    match_start = mismatches[end_idx] + 1
+                    idx = end_idx + 1
+                if match_start < len(ref_block):
+                    cigar_path.append(((len(ref_block) - match_start) << CIGAR_OP_SHIFT) | CIGAR_OP_M)
+
+        return "".join(ref_parts), "".join(read_parts), pack_cigar(cigar_path), len(cigar_path) - 1
+
     @staticmethod
     def _compute_cigar_path_from_alignment(reference: DNASeq, read: DNASeq) -> Tuple[CigarPath, int]:
         """
@@ -264,129 +841,86 @@ class Alignment:
         :return: cigar_path, cigar len
         """
         cigar_path = []
-        state: str = ""
+        state = 0
         length = 0
         cigar_length = 0
         for ref_bp, read_bp in zip(reference, read):
             # Insertion
             if ref_bp == "-":
-                if (state != CIGAR_I) and (length != 0):
-                    cigar_path.append("{}{}".format(length, state))
+                if (state != CIGAR_OP_I) and (length != 0):
+                    cigar_path.append((length << CIGAR_OP_SHIFT) | state)
                     length = 1
                     cigar_length += 1
                 else:
                     length += 1
-                state = CIGAR_I
+                state = CIGAR_OP_I
             # Deletion
             elif read_bp == "-":
-                if (state != CIGAR_D) and (length != 0):
-                    cigar_path.append("{}{}".format(length, state))
+                if (state != CIGAR_OP_D) and (length != 0):
+                    cigar_path.append((length << CIGAR_OP_SHIFT) | state)
                     length = 1
                     cigar_length += 1
                 else:
                     length += 1
-                state = CIGAR_D
+                state = CIGAR_OP_D
             # Match
             elif ref_bp == read_bp:
-                if (state != CIGAR_M) and (length != 0):
-                    cigar_path.append("{}{}".format(length, state))
+                if (state != CIGAR_OP_M) and (length != 0):
+                    cigar_path.append((length << CIGAR_OP_SHIFT) | state)
                     length = 1
                     cigar_length += 1
                 else:
                     length += 1
-                state = CIGAR_M
+                state = CIGAR_OP_M
             # Mismatch
             else:
-                if (state != CIGAR_S) and (length != 0):
-                    cigar_path.append("{}{}".format(length, state))
+                if (state != CIGAR_OP_S) and (length != 0):
+                    cigar_path.append((length << CIGAR_OP_SHIFT) | state)
                     length = 1
                     cigar_length += 1
                 else:
                     length += 1
-                state = CIGAR_S
+                state = CIGAR_OP_S
 
         # Push the last part of the path
-        cigar_path.append("{}{}".format(length, state))
-        return "".join(cigar_path), cigar_length
+        cigar_path.append((length << CIGAR_OP_SHIFT) | state)
+        return pack_cigar(cigar_path), cigar_length
 
-    def _add_indels_columns(self, reads: ReadsDf, cut_site: int):
+    def _compute_indel_events(self, reads: ReadsDf, cut_site: int) -> IndelEventsDf:
         """
-        Add columns with info about indels position and lengths in the qualification window.
+        Compute the indel events in the qualification window of each read (see compute_indel_events), and add the
+        alignment cut-site column. Events are computed once for each distinct alignment of the site.
         :param reads: The site aggregated reads
         :param cut_site: The site cut-site
-        :return:
+        :return: IndelEventsDf - READ_ID is the read row in reads
         """
-        start_idx = cut_site - self._window_size  # Start index to include indel
-        end_idx = cut_site + self._window_size  # end index to include indel
-        new_col_d = dict()
-
-        for col in INDEL_COLS:
-            new_col_d[col] = reads.shape[0] * [None]
-
-        for row_idx, row in reads.iterrows():
-            pos_idx = 0  # position index for the original reference (with no indels)
-            align_idx = 0  # position index for the alignment (with indels)
-            reference = row[ALIGNMENT_W_INS]
-            read = row[ALIGNMENT_W_DEL]
-            for length, indel_type in parse_cigar(row[CIGAR]):
-                # If outside the qualification window then move to the next read
-                if pos_idx > end_idx:
-                    break
-
-                # Deletions
-                elif indel_type == IndelType.DEL:
-                    if (pos_idx + length > start_idx) and (pos_idx < end_idx):
-                        # First deletion
-                        if new_col_d[DEL_LEN][row_idx] is None:
-                            new_col_d[DEL_LEN][row_idx] = str(length)
-                            new_col_d[DEL_START][row_idx] = str(pos_idx)
-                            new_col_d[DEL_END][row_idx] = str(pos_idx + length - 1)
-                            new_col_d[DEL_BASE][row_idx] = reference[align_idx:align_idx+length]
-                        else:
-                            new_col_d[DEL_LEN][row_idx] += ", {}".format(length)
-                            new_col_d[DEL_START][row_idx] += ", {}".format(pos_idx)
-                            new_col_d[DEL_END][row_idx] += ", {}".format(pos_idx + length - 1)
-                            new_col_d[DEL_BASE][row_idx] += ", {}".format(reference[align_idx:align_idx+length])
-
-                # Substations
-                elif indel_type == IndelType.SUB:
-                    if (pos_idx + length > start_idx) and (pos_idx < end_idx):
-                        # First snp
-                        if new_col_d[SUB_CNT][row_idx] is None:
-                            new_col_d[SUB_CNT][row_idx] = int(length)
-                            new_col_d[SUB_POS][row_idx] = str(pos_idx)
-                            new_col_d[SUB_POS][row_idx] += "".join([", {}".format(pos_idx+i) for i in range(1, length)])
-                            new_col_d[SUB_BASE][row_idx] = read[align_idx]
-                            new_col_d[SUB_BASE][row_idx] += "".join([", {}".format(read[align_idx+i]) for i in range(1, length)])
-                        else:
-                            new_col_d[SUB_CNT][row_idx] += int(length)
-                            new_col_d[SUB_POS][row_idx] += "".join([", {}".format(pos_idx+i) for i in range(length)])
-                            new_col_d[SUB_BASE][row_idx] += "".join([", {}".format(read[align_idx+i]) for i in range(1, length)])
-
-                # Insertions
-                elif indel_type == IndelType.INS:
-                    if pos_idx >= start_idx:
-                        # First Insertion
-                        if new_col_d[INS_LEN][row_idx] is None:
-                            new_col_d[INS_LEN][row_idx] = str(length)
-                            new_col_d[INS_POS][row_idx] = str(pos_idx)
-                            new_col_d[INS_BASE][row_idx] = read[align_idx:align_idx+length]
-                        else:
-                            new_col_d[INS_LEN][row_idx] += ", {}".format(length)
-                            new_col_d[INS_POS][row_idx] += ", {}".format(pos_idx)
-                            new_col_d[INS_BASE][row_idx] += ", {}".format(read[align_idx:align_idx+length])
-
-                # update indexes and store aligned_cut_site
-                if indel_type != IndelType.INS:
-                    # store cut-site position
-                    if cut_site in range(pos_idx, pos_idx + length + 1):
-                        new_col_d[ALIGN_CUT_SITE][row_idx] = align_idx + (cut_site - pos_idx)
-                    pos_idx += length
-                align_idx += length
-
-        # Add the new columns
-        for col in INDEL_COLS:
-            reads[col] = new_col_d[col]
+        alignment_idx_d: Dict[Tuple[DNASeq, DNASeq], int] = dict()
+        cigars, read_alignment = [], []
+        for reference, read, cigar in zip(reads[ALIGNMENT_W_INS], reads[ALIGNMENT_W_DEL], reads[CIGAR]):
+            alignment_idx = alignment_idx_d.get((reference, read))
+            if alignment_idx is None:
+                alignment_idx = alignment_idx_d[(reference, read)] = len(cigars)
+                cigars.append(cigar)
+            read_alignment.append(alignment_idx)
+        read_alignment = np.array(read_alignment, dtype=np.int64)
+        events, aligned_cut_site = compute_indel_events([reference for reference, _ in alignment_idx_d],
+                                                        [read for _, read in alignment_idx_d], cigars, cut_site,
+                                                        self._window_size)
+
+        # Alignment cut-site of each read (NaN if not found)
+        aligned_cut_site = aligned_cut_site[read_alignment]
+        if (aligned_cut_site < 0).any():
+            aligned_cut_site = np.where(aligned_cut_site >= 0, aligned_cut_site, np.nan)
+        reads[ALIGN_CUT_SITE] = aligned_cut_site
+
+        # Events of each read are the events of its alignment
+        events_n = np.bincount(events[READ_ID].values, minlength=len(cigars))
+        read_events_n = events_n[read_alignment]
+        events_offset = (np.cumsum(events_n) - events_n)[read_alignment] - (np.cumsum(read_events_n) - read_events_n)
+        event_idx = np.repeat(events_offset, read_events_n) + np.arange(read_events_n.sum())
+        read_events = events.iloc[event_idx].reset_index(drop=True)
+        read_events[READ_ID] = np.repeat(np.arange(len(read_alignment), dtype=np.int32), read_events_n)
+        return read_events
 
     @staticmethod
     def compute_alignment_score_from_cigar(cigar):
@@ -416,207 +950,46 @@ class Alignment:
         return score
 
     ######### Indel Modification #########
-    @staticmethod
-    def _shift_indel_from_left(read_a: DNASeq, read_b: DNASeq, length: int, align_idx: int, alignment_cut_site: int) \
-        -> Tuple[DNASeq, bool]:
-        """
-        Shift indel from left to right if possible. only read_a is changed.
-        For insertion - read_a is the reference and read_b is the read.
-        For deletion - read_a is the read and read_b is the reference.
-        Shift is possible in two scenarios:
-        1. The "pushed" base in read_a is identical to his match in read_b (read_a[end_idx] == read_b[start_idx])
-        2. The "pushed" base in read_a is already marked as a mismatch
-        ((read_a[end_idx] != read_b[end_idx]) and (read_b[end_idx] != "-"))
-        :param read_a: DNASeq
-        :param read_b: DNASeq
-        :param length: indel length
-        :param align_idx: indel position
-        :param alignment_cut_site: cut-site position
-        :return: A tuple of shifted read_a and flag is read_a was changes
-        """
-
-        shift = 0
-        start_idx = align_idx
-        end_idx = align_idx + length  # Consider to replace the base at end_idx
-        while end_idx < alignment_cut_site:
-            if (read_a[end_idx] == read_b[start_idx]) or \
-               ((read_a[end_idx] != read_b[end_idx]) and (read_b[end_idx] != "-")):
-                shift += 1
-            # Can't shift any further
-            else:
-                break
-            start_idx += 1
-            end_idx += 1
-
-        if shift == 0:
-            return read_a, False
-
-        # Shift indels left
-        shifted_bases = read_a[align_idx + length:align_idx + length + shift]
-        indels = read_a[align_idx:align_idx + length]
-        read_a = read_a[0:align_idx] + shifted_bases + indels + read_a[align_idx + length + shift:]
-
-        return read_a, True
-
-    @staticmethod
-    def _shift_indel_from_right(read_a: DNASeq, read_b: DNASeq, length: int, align_idx: int, alignment_cut_site: int) \
-        -> Tuple[DNASeq, bool]:
-        """
-        Shift indel from right to left if possible. only read_a is changed.
-        For insertion - read_a is the reference and read_b is the read.
-        For deletion - read_a is the read and read_b is the reference.
-        Shift is possible in two scenarios:
-        1. The "pushed" base in read_a is identical to his match in read_b (read_a[end_idx] == read_b[start_idx])
-        2. The "pushed" base in read_a is already marked as a mismatch
-        ((read_a[end_idx] != read_b[end_idx]) and (read_b[end_idx] != "-"))
-        :param read_a: DNASeq
-        :param read_b: DNASeq
-        :param length: indel length
-        :param align_idx: indel position
-        :param alignment_cut_site: cut-site position
-        :return: A tuple of shifted read_a and flag is read_a was changes
-        """
-        shift = 0
-        start_idx = align_idx - 1  # Consider to replace base at start_idx
-        end_idx = align_idx + length - 1
-        while start_idx >= alignment_cut_site:
-            if (read_a[start_idx] == read_b[end_idx]) or \
-               ((read_a[start_idx] != read_b[start_idx]) and (read_b[start_idx] != "-")):
-                shift += 1
-            # Can't shift any further
-            else:
-                break
-            start_idx -= 1
-            end_idx -= 1
-
-        if shift == 0:
-            return read_a, False
-
-        # Shift bp's in the read for deletions
-        shifted_bases = read_a[align_idx - shift:align_idx]
-        indels = read_a[align_idx:align_idx + length]
-        read_a = read_a[0:align_idx - shift] + indels + shifted_bases + read_a[align_idx + length:]
-
-        return read_a, True
-
-    @staticmethod
-    def _find_closest_indels_to_cut_site(cigar: CigarPath, cut_site: int) -> Tuple[AlignedIndel, AlignedIndel, int]:
-        """
-        Find closest indels left to the cut-site and right to the cut-site.
-        :param cigar: cigar path of the alignment
-        :param cut_site: cut-site in reference coordinates
-        :return: most_left indel, most right indel and aligned cut-site. return None if indel is already on cut-site
-        or if there is no such indel.
-        """
-        most_left: AlignedIndel = None  # closest indel from left to the cut-site
-        most_right: AlignedIndel = None  # closest indel from right to the cut-site
-        pos_idx = 0  # position index for the original reference (with no indels)
-        align_idx = 0  # position index for the alignment (with indels)
-        aligned_cut_site = -1  # cut-site in align_idx coordinates
-        search_finished = False  # Search finished flag. will be used to jump to return value
-
-        # Find closest indels from left and from right
-        for length, indel_type in parse_cigar(cigar):
-
-            # Deletions
-            if indel_type == IndelType.DEL:
-                # Deletion is left to the cut-site
-                if pos_idx <= cut_site:
-                    if (pos_idx + length) < cut_site:
-                        most_left = (indel_type, length, align_idx)
-                    # Deletion is already on the cut-site
-                    else:
-                        most_left = None
-                        search_finished = True
-                # Deletion is right to the cut-site
-                elif most_right is None:
-                    most_right = (indel_type, length, align_idx)
-                    search_finished = True
-
-            # Insertions
-            elif indel_type == IndelType.INS:
-                # Insertion is already on the cut-site
-                if pos_idx == cut_site:
-                    most_left = None
-                    search_finished = True
-                # Insertion is left to the cut-site
-                elif pos_idx < cut_site:
-                    most_left = (indel_type, length, align_idx)
-                # Insertion is right to the cut-site
-                elif most_right is None:
-                    most_right = (indel_type, length, align_idx)
-                    search_finished = True
-
-            # Update indexes and compute cut-site in alignment coordinates
-            if indel_type != IndelType.INS:
-                # store cut-site position
-                if cut_site in range(pos_idx, pos_idx + length + 1):
-                    aligned_cut_site = align_idx + (cut_site - pos_idx)
-                pos_idx += length
-            align_idx += length
-
-            if search_finished:
-                break
-
-        return most_left, most_right, aligned_cut_site
-
-    def _shift_modifications_into_cut_site(self, reads: ReadsDf, cut_site: int):
+    def _shift_modifications_into_cut_site(self, reads: ReadsDf, cut_site: int, shift_d: Dict = None):
         """
         Shift deletions and insertions with a region of 2*window_size into the cut-site
+        (see shift_indels_into_cut_site). All distinct alignments of the site are shifted together.
         :param reads: ReadsDf - All reads, already aligned with a cigar path.
         :param cut_site: cure_site position
+        :param shift_d: shift results of already shifted alignments. Shared by sites of the same amplicon.
         :return: no return value. Change reads inplace.
         """
-        update_idx = []  # Changed read indexes list
-        reference_l = []  # Changed references (read with insertions) list
-        read_l = []  # Changed reads (read with deletions) list
-        cigar_l = []  # Changed cigar path list
-
-        for row_idx, row in reads.iterrows():
-            cigar = row[CIGAR]
-            reference = row[ALIGNMENT_W_INS]
-            read = row[ALIGNMENT_W_DEL]
-            changed_right = False
-            changed_left = False
-
-            # Find closest indels left and right to the cut-site and cut-site in alignment coordinates
-            most_left, most_right, aligned_cut_site = self._find_closest_indels_to_cut_site(cigar, cut_site)
-
-            # Shift most left modification to the cut-site
-            if most_left is not None:
-                indel_type, length, align_idx = most_left  # most_left is type AlignedIndel
-                # shift indels with a region of twice the window size from the cut-site
-                if align_idx + length + (2*self._window_size) < aligned_cut_site:
-                    changed_left = False
-                elif indel_type == IndelType.DEL:
-                    read, changed_left = self._shift_indel_from_left(read, reference, length, align_idx,
-                                                                    aligned_cut_site)
-                else:
-                    reference, changed_left = self._shift_indel_from_left(reference, read, length, align_idx,
-                                                                         aligned_cut_site)
-
-            # Shift most right modification to the cut-site
-            if most_right is not None:
-                indel_type, length, align_idx = most_right  # most_left is type AlignedIndel
-                # shift indels with a region of twice the window size from the cut-site
-                if align_idx > aligned_cut_site + (2*self._window_size):
-                    changed_right = False
-                elif indel_type == IndelType.DEL:
-                    read, changed_right = self._shift_indel_from_right(read, reference, length, align_idx,
-                                                                      aligned_cut_site)
-                else:
-                    reference, changed_right = self._shift_indel_from_right(reference, read, length, align_idx,
-                                                                           aligned_cut_site)
-            # Mark read if it was changed
-            if changed_right or changed_left:
-                # Compute new cigar_path
-                cigar, _ = self._compute_cigar_path_from_alignment(reference, read)
-                update_idx.append(row_idx)
-                reference_l.append(reference)
-                read_l.append(read)
-                cigar_l.append(cigar)
+        if shift_d is None:
+            shift_d = dict()
+
+        # Shift all alignments which weren't shifted yet
+        new_alignments = dict()
+        for reference, read, cigar in zip(reads[ALIGNMENT_W_INS], reads[ALIGNMENT_W_DEL], reads[CIGAR]):
+            if (reference, read) not in shift_d:
+                new_alignments[(reference, read)] = cigar
+        shifted_l = shift_indels_into_cut_site([reference for reference, _ in new_alignments],
+                                               [read for _, read in new_alignments], list(new_alignments.values()),
+                                               cut_site, self._window_size)
+        shift_d.update(zip(new_alignments, shifted_l))
 
         # Update with all changed reads
-        updated_reads_df = pd.DataFrame({ALIGNMENT_W_INS: reference_l, ALIGNMENT_W_DEL: read_l,
-                                         CIGAR: cigar_l}, index=update_idx)
-        reads.update(updated_reads_df)
+        new_cols_d = {ALIGNMENT_W_INS: [], ALIGNMENT_W_DEL: [], CIGAR: []}
+        for reference, read, cigar in zip(reads[ALIGNMENT_W_INS], reads[ALIGNMENT_W_DEL], reads[CIGAR]):
+            shifted = shift_d[(reference, read)]
+            if shifted is not None:
+                reference, read, cigar = shifted
+            new_cols_d[ALIGNMENT_W_INS].append(reference)
+            new_cols_d[ALIGNMENT_W_DEL].append(read)
+            new_cols_d[CIGAR].append(cigar)
+        for col_name, col in new_cols_d.items():
+            reads[col_name] = col
+
+
+def _init_alignment_worker(align_cfg: Dict):
+    global _worker_aligner
+    _worker_aligner = Alignment._create_aligner(align_cfg)
+
+
+def _align_reads_unit(reference: DNASeq, both_directions: bool, reads: List[DNASeq], band_margin: int,
+                      trie: bool) -> Tuple[List[ReadAlignment], int, int, int, int]:
+    return Alignment._align_reads_unit(_worker_aligner, reference, both_directions, reads, band_margin, trie)
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import sqlite3
+import time
+from crispector.utils.constants_and_types import DNASeq, Path, ALIGNMENT_CACHE_VERSION, ALIGNMENT_CACHE_QUERY_SIZE
+from typing import List, Dict, Tuple
+
+
+class AlignmentCache:
+    """
+    Persistent alignment cache (SQLite file), with a size bounded LRU eviction.
+    Alignments are keyed by the reference, the alignment direction mode and the aligner scores, and the read
+    sequence. Each entry holds the alignment of the read (see Alignment.align_sites).
+    Alignment engine settings (banded_alignment, band_margin, trie_alignment) aren't part of the key - all engines
+    return the alignment & score of biopython aligner.
+    """
+    def __init__(self, cache_path: Path, max_size: int):
+        """
+        :param cache_path: cache file path
+        :param max_size: max cache size in bytes
+        """
+        self._cache_path = cache_path
+        self._max_size = max_size
+        cache_dir = os.path.dirname(os.path.abspath(cache_path))
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+        self._conn = sqlite3.connect(cache_path, timeout=60)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS alignments (ref_key TEXT, read TEXT, ref_w_ins TEXT, "
+                           "read_w_del TEXT, cigar BLOB, cigar_len INTEGER, score REAL, reversed INTEGER, "
+                           "last_used REAL, PRIMARY KEY (ref_key, read)) WITHOUT ROWID")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS last_used_idx ON alignments (last_used)")
+        self._conn.commit()
+        # max_size may be lower than in previous runs
+        self._evict()
+
+    @staticmethod
+    def key(reference: DNASeq, both_directions: bool, align_cfg: Dict) -> str:
+        """
+        Compute reference key from the reference, the alignment direction mode and the aligner scores.
+        :param reference: reference sequence
+        :param both_directions: Flag
+        :param align_cfg: alignment configuration
+        :return: reference key
+        """
+        key_hash = hashlib.sha256()
+        key_hash.update(ALIGNMENT_CACHE_VERSION.encode())
+        key_hash.update(reference.encode())
+        key_hash.update(str(both_directions).encode())
+        for score in ["substitution_matrix", "match_score", "mismatch_score", "open_gap_score", "extend_gap_score"]:
+            key_hash.update("|{}".format(align_cfg[score]).encode())
+        return key_hash.hexdigest()
+
+    def get(self, ref_key: str, reads: List[DNASeq]) -> Dict[DNASeq, Tuple]:
+        """
+        Return cached alignments of reads, and mark them as recently used. Missing reads aren't returned.
+        :param ref_key: reference key (see key)
+        :param reads: unique reads
+        :return: Dict[read, alignment]
+        """
+        align_d = dict()
+        try:
+            for start in range(0, len(reads), ALIGNMENT_CACHE_QUERY_SIZE):
+                chunk = reads[start:start + ALIGNMENT_CACHE_QUERY_SIZE]
+                rows = self._conn.execute("SELECT read, ref_w_ins, read_w_del, cigar, cigar_len, score, reversed FROM "
+                                          "alignments WHERE ref_key = ? AND read IN ({})".format(
+                                           ",".join(len(chunk) * ["?"])), [ref_key] + list(chunk))
+                for read, ref_w_ins, read_w_del, cigar, cigar_len, score, reversed_read in rows:
+                    align_d[read] = (ref_w_ins, read_w_del, cigar, cigar_len, score, bool(reversed_read))
+            self._conn.executemany("UPDATE alignments SET last_used = ? WHERE ref_key = ? AND read = ?",
+                                   [(time.time(), ref_key, read) for read in align_d])
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            return dict()
+
+        return align_d
+
+    def put(self, ref_key: str, align_d: Dict[DNASeq, Tuple]):
+        """
+        Store alignments in the cache. Evict least recently used entries if needed.
+        :param ref_key: reference key (see key)
+        :param align_d: Dict[read, alignment]
+        :return:
+        """
+        now = time.time()
+        try:
+            self._conn.executemany("INSERT OR REPLACE INTO alignments VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   [(ref_key, read, ref_w_ins, read_w_del, cigar, int(cigar_len), float(score),
+                                     int(reversed_read), now) for read, (ref_w_ins, read_w_del, cigar, cigar_len,
+                                                                          score, reversed_read) in align_d.items()])
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            return
+
+        self._evict()
+
+    def close(self):
+        self._conn.close()
+
+    def _evict(self):
+        """
+        Remove least recently used entries until cache size is below max_size.
+        :return:
+        """
+        try:
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            used_pages = self._conn.execute("PRAGMA page_count").fetchone()[0] - \
+                self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            size = page_size * used_pages
+            if size <= self._max_size:
+                return
+
+            # Entries size is estimated by the average entry size
+            entries_n = self._conn.execute("SELECT COUNT(*) FROM alignments").fetchone()[0]
+            remove_n = entries_n - int(entries_n * self._max_size / size)
+            self._conn.execute("DELETE FROM alignments WHERE (ref_key, read) IN (SELECT ref_key, read FROM alignments "
+                               "ORDER BY last_used LIMIT ?)", (remove_n,))
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
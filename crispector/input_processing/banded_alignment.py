@@ -0,0 +1,166 @@
+from crispector.utils.constants_and_types import DNASeq
+from typing import List, Tuple, Optional
+import numpy as np
+
+# Alignment path - (reference index, read index) of every block edge (same as biopython alignment.path)
+AlignmentPath = Tuple[Tuple[int, int], ...]
+
+_STATE_M, _STATE_D, _STATE_I = 0, 1, 2
+_NO_BASE = 255
+
+
+def banded_align_batch(reference: DNASeq, reads: List[DNASeq], match_score: float, mismatch_score: float,
+                       open_gap_score: float, extend_gap_score: float, margin: int) \
+        -> List[Optional[Tuple[AlignmentPath, float]]]:
+    """
+    Banded global alignment (Gotoh affine gaps) of a batch of reads against a single reference.
+    The band of each read spans the diagonals between 0 and the read/reference length difference, extended by
+    margin on both sides. The DP is computed for all reads together, one reference position at a time, and gaps
+    along the read are computed with a cumulative max.
+    Ties are broken as in biopython PairwiseAligner Gotoh algorithm (gaps are placed as left as possible).
+    A read alignment is returned only if it is provably optimal - its path doesn't touch the band edge and its score
+    is higher than any path that leaves the band. Otherwise None is returned, and the read should be aligned with the
+    unbanded aligner.
+    Assumes match_score >= mismatch_score and open_gap_score < extend_gap_score <= 0 (biopython Gotoh
+    algorithm). The score bound of a path which leaves the band relies on it. Also assumes scores which are multiples
+    of ALIGNMENT_EXACT_SCORE_UNIT, so the float64 DP and the returned scores are exact.
+    :param reference: reference sequence
+    :param reads: reads to align. Reads with similar lengths make a narrower band.
+    :param match_score: match score (positive)
+    :param mismatch_score: mismatch score
+    :param open_gap_score: open gap score (non positive)
+    :param extend_gap_score: extend gap score (non positive)
+    :param margin: band margin
+    :return: List of (alignment path, score) or None, in reads order
+    """
+    ref_len = len(reference)
+    reads_n = len(reads)
+    reads_len = np.array([len(read) for read in reads])
+    len_diff = reads_len - ref_len
+    band_low = np.minimum(0, len_diff) - margin
+    band_high = np.maximum(0, len_diff) + margin
+    low, high = int(band_low.min()), int(band_high.max())
+    width = high - low + 1
+    diagonals = np.arange(low, high + 1)
+    pad = width + 1
+    dtype = np.float64
+
+    # Substitution score of every read position against each reference base, -inf outside the read
+    read_codes = np.full((reads_n, pad + int(reads_len.max()) + pad), _NO_BASE, dtype=np.uint8)
+    for read_idx, read in enumerate(reads):
+        read_codes[read_idx, pad:pad + len(read)] = np.frombuffer(read.encode(), dtype=np.uint8)
+    sub_d = dict()
+    for base in set(reference):
+        sub_d[base] = np.where(read_codes == _NO_BASE, -np.inf,
+                               np.where(read_codes == ord(base), match_score, mismatch_score)).astype(dtype)
+    # Gaps along the read can't pass the read end
+    positions = np.arange(-pad, read_codes.shape[1] - pad)
+    read_end = np.where(positions[None, :] <= reads_len[:, None], 0, -np.inf).astype(dtype)
+
+    # Score matrices - [reference position, read, diagonal (read position - reference position)]
+    match_m = np.full((ref_len + 1, reads_n, width), -np.inf, dtype=dtype)
+    del_m = np.full((ref_len + 1, reads_n, width), -np.inf, dtype=dtype)
+    ins_m = np.full((ref_len + 1, reads_n, width), -np.inf, dtype=dtype)
+    match_m[0][:, diagonals == 0] = 0
+    ins_m[0] = np.where(diagonals >= 1, open_gap_score + (diagonals - 1) * extend_gap_score, -np.inf)[None, :] + \
+        read_end[:, pad + low:pad + low + width]
+    extend_cost = (np.arange(width) * extend_gap_score).astype(dtype)
+    open_gap_score, extend_gap_score = dtype(open_gap_score), dtype(extend_gap_score)
+
+    for ref_idx in range(1, ref_len + 1):
+        start = pad + ref_idx + low  # position of the first diagonal in the padded read arrays
+        # Match - from (i-1, j-1)
+        best = np.maximum(np.maximum(match_m[ref_idx - 1], del_m[ref_idx - 1]), ins_m[ref_idx - 1])
+        np.add(best, sub_d[reference[ref_idx - 1]][:, start - 1:start - 1 + width], out=match_m[ref_idx])
+        # Deletion - from (i-1, j)
+        np.maximum(np.maximum(match_m[ref_idx - 1, :, 1:], ins_m[ref_idx - 1, :, 1:]) + open_gap_score,
+                   del_m[ref_idx - 1, :, 1:] + extend_gap_score, out=del_m[ref_idx, :, :-1])
+        # Insertion - from (i, j-1)
+        best_open = np.maximum.accumulate(np.maximum(match_m[ref_idx], del_m[ref_idx]) - extend_cost, axis=1)
+        np.add(best_open[:, :-1] + (open_gap_score - extend_gap_score), extend_cost[1:], out=ins_m[ref_idx, :, 1:])
+        ins_m[ref_idx, :, 1:] += read_end[:, start + 1:start + width]
+
+    results = []
+    for read_idx in range(reads_n):
+        read_len = int(reads_len[read_idx])
+        path, score = _traceback(match_m[:, read_idx, :], del_m[:, read_idx, :], ins_m[:, read_idx, :], ref_len,
+                                 read_len, low, open_gap_score, extend_gap_score, int(band_low[read_idx]),
+                                 int(band_high[read_idx]))
+
+        # Upper bound on the score of a path which leaves the band. Such a path has at least one insertion and one
+        # deletion, with a total length set by the band edge it crosses.
+        bound = -np.inf
+        for del_n in [int(band_high[read_idx]) + 1 - int(len_diff[read_idx]), 1 - int(band_low[read_idx])]:
+            ins_n = del_n + int(len_diff[read_idx])
+            bound = max(bound, match_score * (ref_len - del_n) + 2 * open_gap_score +
+                        (ins_n + del_n - 2) * extend_gap_score)
+
+        if (path is None) or not (score > bound):
+            results.append(None)
+        else:
+            results.append((path, score))
+
+    return results
+
+
+def _traceback(match_m: np.ndarray, del_m: np.ndarray, ins_m: np.ndarray, ref_len: int, read_len: int, low: int,
+               open_gap_score: float, extend_gap_score: float, band_low: int, band_high: int) \
+        -> Tuple[Optional[AlignmentPath], float]:
+    """
+    Traceback a single read, one alignment block at a time.
+    :return: alignment path (None if the path touches the band edge) and alignment score
+    """
+    width = match_m.shape[1]
+    col = read_len - ref_len - low
+    final = [match_m[ref_len, col], del_m[ref_len, col], ins_m[ref_len, col]]
+    score = max(final)
+    state = final.index(score)
+    ref_idx, read_idx = ref_len, read_len
+    path = [(ref_idx, read_idx)]
+
+    while (ref_idx > 0) or (read_idx > 0):
+        col = read_idx - ref_idx - low
+        if state == _STATE_M:
+            # Aligned block - the previous state is the best state of (i-1, j-1), match first
+            rows = np.arange(ref_idx - 1, -1, -1)
+            prev_m, prev_d, prev_i = match_m[rows, col], del_m[rows, col], ins_m[rows, col]
+            stop = np.flatnonzero((prev_m < prev_d) | (prev_m < prev_i))
+            steps = int(stop[0]) + 1 if len(stop) > 0 else ref_idx
+            if len(stop) > 0:
+                state = _STATE_D if prev_d[steps - 1] >= prev_i[steps - 1] else _STATE_I
+            ref_idx -= steps
+            read_idx -= steps
+        elif state == _STATE_D:
+            # Deletion - the previous state is the first of match (open), deletion (extend) and insertion (open)
+            # which gives the deletion score
+            offsets = np.arange(1, min(ref_idx, width - 1 - col) + 1)
+            rows, cols = ref_idx - offsets, col + offsets
+            score_d = del_m[rows + 1, cols - 1]
+            open_m = match_m[rows, cols] + open_gap_score >= score_d
+            stop = np.flatnonzero(open_m | (del_m[rows, cols] + extend_gap_score < score_d))
+            if len(stop) == 0:
+                return None, score
+            steps = int(stop[0]) + 1
+            state = _STATE_M if open_m[steps - 1] else _STATE_I
+            ref_idx -= steps
+        else:
+            # Insertion - the previous state is the first of match (open), deletion (open) and insertion (extend)
+            cols = np.arange(col - 1, max(col - read_idx, 0) - 1, -1)
+            stop = np.flatnonzero(np.maximum(match_m[ref_idx, cols], del_m[ref_idx, cols]) + open_gap_score >=
+                                  ins_m[ref_idx, cols + 1])
+            if len(stop) == 0:
+                return None, score
+            steps = int(stop[0]) + 1
+            prev_col = cols[steps - 1]
+            state = _STATE_M if match_m[ref_idx, prev_col] >= del_m[ref_idx, prev_col] else _STATE_D
+            read_idx -= steps
+        path.append((ref_idx, read_idx))
+
+        # Blocks are monotonic in the diagonal, so it is enough to check the block edges
+        if (read_idx - ref_idx <= band_low) or (read_idx - ref_idx >= band_high):
+            return None, score
+
+    if (ref_idx, read_idx) != (0, 0):
+        return None, score
+
+    return tuple(path[::-1]), float(score)
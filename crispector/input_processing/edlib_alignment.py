@@ -0,0 +1,76 @@
+from crispector.utils.constants_and_types import DNASeq
+from crispector.input_processing.banded_alignment import AlignmentPath
+from typing import Tuple, Optional
+import numpy as np
+import edlib
+
+
+def edlib_align(reference: DNASeq, read: DNASeq, match_score: float, mismatch_score: float, open_gap_score: float,
+                extend_gap_score: float) -> Optional[Tuple[AlignmentPath, float]]:
+    """
+    First pass global alignment for reads with at most one gap event (insertion or deletion run).
+    The best alignment with at most one gap event is returned only if it is provably optimal under the affine gap
+    scores - its score is higher than the upper bound on any alignment with two or more gap events.
+    - edlib (NW mode) edit distance rejects reads with too many mismatches for the bound, without alignment.
+    - Gap position is the one with the least mismatches. Ties are broken as in biopython PairwiseAligner (gap is
+      placed as left as possible).
+    Assumes match_score >= mismatch_score and open_gap_score < extend_gap_score <= 0 (biopython Gotoh algorithm).
+    :param reference: reference sequence
+    :param read: read sequence
+    :param match_score: match score (positive)
+    :param mismatch_score: mismatch score
+    :param open_gap_score: open gap score (non positive)
+    :param extend_gap_score: extend gap score (non positive)
+    :return: (alignment path, score) or None if optimality can't be proved
+    """
+    ref_len, read_len = len(reference), len(read)
+    min_len = min(ref_len, read_len)
+    if min_len == 0:
+        return None
+    gap_len = abs(ref_len - read_len)
+    gap_score = (open_gap_score + (gap_len - 1) * extend_gap_score) if gap_len > 0 else 0
+
+    # Upper bound on alignments with two or more gap events - all gaps in the longer sequence (at least two gap
+    # events, so gap_len >= 2), or gaps in both sequences (at least one less aligned column).
+    bound = match_score * (min_len - 1) + 2 * open_gap_score + gap_len * extend_gap_score
+    if gap_len >= 2:
+        bound = max(bound, match_score * min_len + 2 * open_gap_score + (gap_len - 2) * extend_gap_score)
+
+    # Max number of mismatches with a score above the bound
+    margin = match_score * min_len + gap_score - bound
+    if margin <= 0:
+        return None
+    mismatch_loss = match_score - mismatch_score
+    max_mismatch_n = min_len if mismatch_loss <= 0 else int(margin // mismatch_loss)
+    edit_distance = edlib.align(read, reference, mode="NW", task="distance",
+                                k=gap_len + max_mismatch_n)["editDistance"]
+    if edit_distance == -1:
+        return None
+
+    # Mismatches for every gap position - prefix without shift and suffix with gap_len shift
+    long_seq, short_seq = (reference, read) if ref_len >= read_len else (read, reference)
+    long_codes = np.frombuffer(long_seq.encode(), dtype=np.uint8)
+    short_codes = np.frombuffer(short_seq.encode(), dtype=np.uint8)
+    prefix_n = np.zeros(min_len + 1, dtype=np.int64)
+    np.cumsum(long_codes[:min_len] != short_codes, out=prefix_n[1:])
+    suffix_n = np.zeros(min_len + 1, dtype=np.int64)
+    np.cumsum((long_codes[gap_len:] != short_codes)[::-1], out=suffix_n[1:])
+    mismatch_n = prefix_n + suffix_n[::-1]
+    gap_pos = int(np.argmin(mismatch_n)) if gap_len > 0 else min_len  # first minimum - left most gap
+    mismatch_n = int(mismatch_n[gap_pos])
+
+    score = match_score * (min_len - mismatch_n) + mismatch_score * mismatch_n + gap_score
+    if not (score > bound):
+        return None
+
+    # Alignment path - aligned block, gap and aligned block (empty blocks are dropped)
+    if ref_len >= read_len:
+        edges = [(0, 0), (gap_pos, gap_pos), (gap_pos + gap_len, gap_pos), (ref_len, read_len)]
+    else:
+        edges = [(0, 0), (gap_pos, gap_pos), (gap_pos, gap_pos + gap_len), (ref_len, read_len)]
+    path = [edges[0]]
+    for edge in edges[1:]:
+        if edge != path[-1]:
+            path.append(edge)
+
+    return tuple(path), float(score)
@@ -0,0 +1,129 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+from crispector.utils.constants_and_types import ReadsDf, Path, READ, FREQ, IO_BUFFER_SIZE, FASTP_CACHE_READS, \
+    FASTP_CACHE_FILES
+from typing import List, Optional
+import pandas as pd
+
+
+class FastpCache:
+    """
+    Content addressed cache for fastp merge results, with a size bounded LRU eviction.
+    Each entry is a folder named by the cache key, which holds the merged reads (grouped to unique reads and
+    compressed), fastp.json and fastp.html.
+    """
+    def __init__(self, cache_dir: Path, max_size: int):
+        """
+        :param cache_dir: cache folder
+        :param max_size: max cache size in bytes
+        """
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._fastp_version = None
+        if not os.path.exists(self._cache_dir):
+            os.makedirs(self._cache_dir)
+
+    def key(self, inputs: List[Path], fastp_options: str) -> str:
+        """
+        Compute cache key from the input files content, fastp version and the exact fastp options.
+        :param inputs: fastp input files
+        :param fastp_options: fastp options string (without input, output and threads arguments)
+        :return: cache key
+        """
+        key_hash = hashlib.sha256()
+        key_hash.update(self._get_fastp_version().encode())
+        key_hash.update(fastp_options.encode())
+        for path in inputs:
+            key_hash.update(self._file_digest(path))
+        return key_hash.hexdigest()
+
+    def get(self, key: str, fastp_output: Path) -> Optional[ReadsDf]:
+        """
+        Return cached merged reads and copy fastp.json & fastp.html to fastp_output. Return None for cache miss.
+        :param key: cache key
+        :param fastp_output: fastp output folder
+        :return: ReadsDf with READ & FREQ columns or None
+        """
+        entry = os.path.join(self._cache_dir, key)
+        try:
+            reads_df = pd.read_csv(os.path.join(entry, FASTP_CACHE_READS), sep="\t", dtype={READ: str, FREQ: int},
+                                   keep_default_na=False)
+            for file_name in FASTP_CACHE_FILES:
+                shutil.copyfile(os.path.join(entry, file_name), os.path.join(fastp_output, file_name))
+            # Mark entry as recently used
+            os.utime(entry)
+        except (IOError, OSError, ValueError):
+            return None
+
+        return reads_df
+
+    def put(self, key: str, reads_df: ReadsDf, fastp_output: Path):
+        """
+        Store merged reads and fastp summary files in the cache. Evict least recently used entries if needed.
+        :param key: cache key
+        :param reads_df: merged reads (READ & FREQ columns)
+        :param fastp_output: fastp output folder
+        :return:
+        """
+        entry = os.path.join(self._cache_dir, key)
+        tmp_entry = os.path.join(self._cache_dir, ".tmp_{}".format(uuid.uuid4().hex))
+        try:
+            os.makedirs(tmp_entry)
+            reads_df[[READ, FREQ]].to_csv(os.path.join(tmp_entry, FASTP_CACHE_READS), sep="\t", index=False,
+                                          compression="gzip")
+            for file_name in FASTP_CACHE_FILES:
+                shutil.copyfile(os.path.join(fastp_output, file_name), os.path.join(tmp_entry, file_name))
+            # Publish the entry atomically
+            os.rename(tmp_entry, entry)
+        except (IOError, OSError):
+            pass
+        finally:
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+
+        self._evict()
+
+    def _evict(self):
+        """
+        Remove least recently used entries until cache size is below max_size.
+        :return:
+        """
+        with self._lock:
+            entries = []
+            for name in os.listdir(self._cache_dir):
+                entry = os.path.join(self._cache_dir, name)
+                if name.startswith(".") or not os.path.isdir(entry):
+                    continue
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, file_name)) for file_name in os.listdir(entry))
+                    entries.append((os.path.getmtime(entry), size, entry))
+                except OSError:
+                    continue
+
+            total_size = sum(size for _, size, _ in entries)
+            for _, size, entry in sorted(entries):
+                if total_size <= self._max_size:
+                    break
+                shutil.rmtree(entry, ignore_errors=True)
+                total_size -= size
+
+    def _get_fastp_version(self) -> str:
+        if self._fastp_version is None:
+            try:
+                version = subprocess.run(["fastp", "--version"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+                self._fastp_version = version.stdout.decode().strip()
+            except OSError:
+                self._fastp_version = ""
+        return self._fastp_version
+
+    @staticmethod
+    def _file_digest(path: Path) -> bytes:
+        file_hash = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for block in iter(lambda: file.read(IO_BUFFER_SIZE), b""):
+                file_hash.update(block)
+        return file_hash.digest()
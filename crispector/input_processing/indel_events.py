@@ -0,0 +1,110 @@
+from crispector.utils.constants_and_types import DNASeq, CigarPath, IndelType, IndelEventsDf, CIGAR_OP_SHIFT, \
+    CIGAR_OP_MASK, CIGAR_OP_I, CIGAR_OP_D, CIGAR_OP_S, CIGAR_DTYPE, READ_ID, INDEL_TYPE, POS_IDX_S, POS_IDX_E, \
+    INDEL_LEN, INDEL_BASES, INDEL_COLS, ALIGN_CUT_SITE, DEL_LEN, DEL_START, DEL_END, DEL_BASE, INS_LEN, INS_POS, \
+    INS_BASE, SUB_CNT, SUB_POS, SUB_BASE
+from typing import List, Tuple, Dict
+import numpy as np
+import pandas as pd
+
+_EVENT_TYPES = [IndelType.DEL, IndelType.INS, IndelType.MIXED, IndelType.SUB]  # categories, coded by IndelType value
+
+
+def compute_indel_events(references: List[DNASeq], reads: List[DNASeq], cigars: List[CigarPath], cut_site: int,
+                         window_size: int) -> Tuple[IndelEventsDf, np.ndarray]:
+    """
+    Find the indel events in the qualification window of a batch of alignments - deletions and substitutions which
+    overlap (cut_site - window_size, cut_site + window_size), and insertions in [cut_site - window_size,
+    cut_site + window_size]. A substitution event is a run of consecutive substitutions.
+    All alignments are processed together from the packed cigar operations.
+    :param references: references with insertions
+    :param reads: reads with deletions
+    :param cigars: cigar paths
+    :param cut_site: cut-site position
+    :param window_size: qualification window size
+    :return: IndelEventsDf (READ_ID is the alignment index), in alignments & operations order. And the aligned
+    cut-site of each alignment (-1 if not found).
+    """
+    start_idx = cut_site - window_size  # Start index to include indel
+    end_idx = cut_site + window_size  # end index to include indel
+    alignments_n = len(cigars)
+    ops_n = np.array([len(cigar) // 4 for cigar in cigars], dtype=np.int64)
+    ops = np.frombuffer(b"".join(cigars), dtype=CIGAR_DTYPE)
+    op_row = np.repeat(np.arange(alignments_n), ops_n)
+    op_idx = np.arange(len(ops))
+    lengths = (ops >> CIGAR_OP_SHIFT).astype(np.int64)
+    codes = (ops & CIGAR_OP_MASK).astype(np.int64)
+    is_ins = codes == CIGAR_OP_I
+
+    # Operation start in alignment coordinates & in reference coordinates (exclusive cumsum of each alignment)
+    first_op = np.cumsum(ops_n) - ops_n
+    align_idx = np.cumsum(lengths) - lengths
+    align_idx -= align_idx[first_op][op_row]
+    ref_lengths = np.where(is_ins, 0, lengths)
+    pos_idx = np.cumsum(ref_lengths) - ref_lengths
+    pos_idx -= pos_idx[first_op][op_row]
+
+    # Operations after the qualification window are ignored
+    scanned = pos_idx <= end_idx
+    overlaps = scanned & (pos_idx + lengths > start_idx) & (pos_idx < end_idx)
+    is_event = ((codes == CIGAR_OP_D) | (codes == CIGAR_OP_S)) & overlaps
+    is_event |= is_ins & scanned & (pos_idx >= start_idx)
+    event_ops = np.flatnonzero(is_event)
+
+    # Aligned cut-site - from the last scanned reference operation which contains the cut-site
+    contains_cut = ~is_ins & scanned & (pos_idx <= cut_site) & (cut_site <= pos_idx + lengths)
+    cut_op = np.full(alignments_n, -1)
+    np.maximum.at(cut_op, op_row[contains_cut], op_idx[contains_cut])
+    aligned_cut_site = np.where(cut_op >= 0, align_idx[cut_op] + cut_site - pos_idx[cut_op], -1)
+
+    # Deleted bases are taken from the reference, inserted and substituted bases from the read
+    event_codes, event_lengths = codes[event_ops], lengths[event_ops]
+    event_types = np.select([event_codes == CIGAR_OP_D, event_codes == CIGAR_OP_I],
+                            [IndelType.DEL.value, IndelType.INS.value], IndelType.SUB.value)
+    event_bases = [(references if code == CIGAR_OP_D else reads)[row][start:start + length] for row, code, start, length
+                   in zip(op_row[event_ops], event_codes, align_idx[event_ops], event_lengths)]
+    event_start = pos_idx[event_ops]
+    event_end = np.where(event_codes == CIGAR_OP_I, event_start, event_start + event_lengths - 1)
+
+    events = pd.DataFrame({READ_ID: op_row[event_ops].astype(np.int32),
+                           INDEL_TYPE: pd.Categorical.from_codes(event_types, categories=_EVENT_TYPES),
+                           POS_IDX_S: event_start.astype(np.int32),
+                           POS_IDX_E: event_end.astype(np.int32),
+                           INDEL_LEN: event_lengths.astype(np.int32),
+                           INDEL_BASES: pd.Categorical(event_bases)})
+    return events, aligned_cut_site
+
+
+def indel_events_to_columns(events: IndelEventsDf, reads_n: int) -> Dict[str, List]:
+    """
+    Render the indel events of each read as comma separated string columns - DEL_LEN, DEL_START, DEL_END, DEL_BASE,
+    INS_LEN, INS_POS, INS_BASE, SUB_CNT, SUB_POS and SUB_BASE. Values of reads without such events are None.
+    Substitutions are listed by position. The bases of every substitution run but the first omit the run first base.
+    :param events: IndelEventsDf
+    :param reads_n: number of reads
+    :return: Dict of column name to values, in reads order
+    """
+    str_cols = [col for col in INDEL_COLS if col not in [ALIGN_CUT_SITE, SUB_CNT]]
+    parts_d = {col: [[] for _ in range(reads_n)] for col in str_cols}
+    sub_cnt = reads_n * [None]
+
+    for read_id, indel_type, start, end, length, bases in zip(events[READ_ID].values, events[INDEL_TYPE],
+                                                             events[POS_IDX_S].values, events[POS_IDX_E].values,
+                                                             events[INDEL_LEN].values, events[INDEL_BASES]):
+        if indel_type == IndelType.DEL:
+            parts_d[DEL_LEN][read_id].append(str(length))
+            parts_d[DEL_START][read_id].append(str(start))
+            parts_d[DEL_END][read_id].append(str(end))
+            parts_d[DEL_BASE][read_id].append(bases)
+        elif indel_type == IndelType.INS:
+            parts_d[INS_LEN][read_id].append(str(length))
+            parts_d[INS_POS][read_id].append(str(start))
+            parts_d[INS_BASE][read_id].append(bases)
+        else:
+            first_run = sub_cnt[read_id] is None
+            sub_cnt[read_id] = int(length) if first_run else sub_cnt[read_id] + int(length)
+            parts_d[SUB_POS][read_id] += [str(pos) for pos in range(start, start + length)]
+            parts_d[SUB_BASE][read_id] += list(bases if first_run else bases[1:])
+
+    cols_d = {col: [", ".join(parts) if parts else None for parts in parts_d[col]] for col in str_cols}
+    cols_d[SUB_CNT] = sub_cnt
+    return {col: cols_d[col] for col in INDEL_COLS if col != ALIGN_CUT_SITE}
@@ -0,0 +1,220 @@
+from crispector.utils.constants_and_types import DNASeq, CigarPath, CIGAR_OP_SHIFT, CIGAR_OP_MASK, CIGAR_OP_I, \
+    CIGAR_OP_D, CIGAR_OP_M, CIGAR_OP_S, CIGAR_DTYPE, INDEL_SHIFT_BATCH_SIZE
+from typing import List, Tuple, Optional
+import numpy as np
+
+_GAP = ord("-")
+_REF, _READ = 0, 1  # sequence index in the alignments array
+
+
+def shift_indels_into_cut_site(references: List[DNASeq], reads: List[DNASeq], cigars: List[CigarPath], cut_site: int,
+                               window_size: int) -> List[Optional[Tuple[DNASeq, DNASeq, CigarPath]]]:
+    """
+    Shift deletions and insertions within a region of 2*window_size into the cut-site, for a batch of alignments.
+    The closest indel left to the cut-site is shifted right, and the closest indel right to the cut-site is shifted
+    left, as long as the shifted bases match (or are already mismatches). Indels which are already on the cut-site
+    are kept.
+    All alignments are processed together - indels are found from the packed cigar operations, and the gapped
+    sequences are shifted as byte arrays.
+    :param references: references with insertions
+    :param reads: reads with deletions
+    :param cigars: cigar paths
+    :param cut_site: cut-site position
+    :param window_size: qualification window size
+    :return: List of shifted (reference, read, cigar), or None if the alignment wasn't changed, in alignments order
+    """
+    results = []
+    for start in range(0, len(references), INDEL_SHIFT_BATCH_SIZE):
+        end = start + INDEL_SHIFT_BATCH_SIZE
+        results += _shift_batch(references[start:end], reads[start:end], cigars[start:end], cut_site, window_size)
+    return results
+
+
+def _shift_batch(references: List[DNASeq], reads: List[DNASeq], cigars: List[CigarPath], cut_site: int,
+                 window_size: int) -> List[Optional[Tuple[DNASeq, DNASeq, CigarPath]]]:
+    """
+    Shift indels of a batch of alignments (see shift_indels_into_cut_site).
+    """
+    results: List[Optional[Tuple[DNASeq, DNASeq, CigarPath]]] = len(references) * [None]
+    left, right, aligned_cut_site = _find_closest_indels_to_cut_site(cigars, cut_site)
+
+    # Shift only indels within a region of twice the window size from the cut-site
+    left_type, left_len, left_idx = left
+    right_type, right_len, right_idx = right
+    shift_left = (left_type >= 0) & (left_idx + left_len + 2 * window_size >= aligned_cut_site)
+    shift_right = (right_type >= 0) & (right_idx <= aligned_cut_site + 2 * window_size)
+    rows = np.flatnonzero(shift_left | shift_right)
+    if len(rows) == 0:
+        return results
+
+    # Gapped sequences of the candidate alignments - [reference / read, alignment, position]
+    align_len = np.array([len(references[row]) for row in rows])
+    seqs = np.zeros((2, len(rows), int(align_len.max())), dtype=np.uint8)
+    for seq_idx, sequences in [(_REF, references), (_READ, reads)]:
+        _fill_rows(seqs[seq_idx], [sequences[row] for row in rows])
+
+    # Deletions are shifted in the read and insertions in the reference. The most left indel is shifted first.
+    aligned_cut_site = aligned_cut_site[rows]
+    changed = np.zeros(len(rows), dtype=bool)
+    for shift, indel_type, length, align_idx, from_left in [(shift_left, left_type, left_len, left_idx, True),
+                                                           (shift_right, right_type, right_len, right_idx, False)]:
+        sub_rows = np.flatnonzero(shift[rows])
+        if len(sub_rows) == 0:
+            continue
+        seq_a = np.where(indel_type[rows[sub_rows]] == CIGAR_OP_D, _READ, _REF)
+        changed[sub_rows] |= _shift_indels(seqs, sub_rows, seq_a, length[rows[sub_rows]],
+                                           align_idx[rows[sub_rows]], aligned_cut_site[sub_rows], from_left)
+
+    # Shifted alignments and their new cigar paths
+    changed_rows = np.flatnonzero(changed)
+    new_cigars = _compute_cigars(seqs[:, changed_rows], align_len[changed_rows])
+    for changed_idx, cigar in zip(changed_rows, new_cigars):
+        length = align_len[changed_idx]
+        results[rows[changed_idx]] = (seqs[_REF, changed_idx, :length].tobytes().decode(),
+                                      seqs[_READ, changed_idx, :length].tobytes().decode(), cigar)
+    return results
+
+
+def _fill_rows(matrix: np.ndarray, sequences: List[DNASeq]):
+    """
+    Copy sequences to the rows of a byte matrix (padded with zeros).
+    """
+    width = matrix.shape[1]
+    matrix[:] = np.frombuffer("".join([seq.ljust(width, "\0") for seq in sequences]).encode(),
+                              dtype=np.uint8).reshape(len(sequences), width)
+
+
+def _find_closest_indels_to_cut_site(cigars: List[CigarPath], cut_site: int) \
+        -> Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray, np.ndarray], np.ndarray]:
+    """
+    Find closest indels left to the cut-site and right to the cut-site, for each alignment.
+    Indels are scanned from the alignment start - a deletion which ends before the cut-site or an insertion before the
+    cut-site is a left indel. The scan stops on the first other indel, which is either on the cut-site (no left indel)
+    or right to the cut-site (the right indel).
+    :param cigars: cigar paths
+    :param cut_site: cut-site in reference coordinates
+    :return: most left indels and most right indels - (op code, length, position in alignment coordinates) arrays,
+    op code is -1 if there is no such indel. And the aligned cut-site of each alignment (-1 if not found).
+    """
+    alignments_n = len(cigars)
+    ops_n = np.array([len(cigar) // 4 for cigar in cigars], dtype=np.int64)
+    ops = np.frombuffer(b"".join(cigars), dtype=CIGAR_DTYPE)
+    op_row = np.repeat(np.arange(alignments_n), ops_n)
+    op_idx = np.arange(len(ops))
+    lengths = (ops >> CIGAR_OP_SHIFT).astype(np.int64)
+    codes = (ops & CIGAR_OP_MASK).astype(np.int64)
+    is_ins, is_del = codes == CIGAR_OP_I, codes == CIGAR_OP_D
+
+    # Operation start in alignment coordinates & in reference coordinates (exclusive cumsum of each alignment)
+    first_op = np.cumsum(ops_n) - ops_n
+    align_idx = np.cumsum(lengths) - lengths
+    align_idx -= align_idx[first_op][op_row]
+    ref_lengths = np.where(is_ins, 0, lengths)
+    pos_idx = np.cumsum(ref_lengths) - ref_lengths
+    pos_idx -= pos_idx[first_op][op_row]
+
+    # Left indels, and the first indel which stops the scan
+    is_left = (is_del & (pos_idx + lengths < cut_site)) | (is_ins & (pos_idx < cut_site))
+    is_stop = (is_ins | is_del) & ~is_left
+    stop_op = np.full(alignments_n, len(ops))
+    np.minimum.at(stop_op, op_row[is_stop], op_idx[is_stop])
+    scanned = op_idx <= stop_op[op_row]
+
+    left_op = np.full(alignments_n, -1)
+    np.maximum.at(left_op, op_row[is_left & scanned], op_idx[is_left & scanned])
+    has_stop = stop_op < len(ops)
+    right_op = np.where(has_stop, stop_op, -1)
+    right_op[has_stop] = np.where(pos_idx[stop_op[has_stop]] > cut_site, stop_op[has_stop], -1)
+    left_op[has_stop & (right_op == -1)] = -1  # indel on the cut-site
+
+    # Aligned cut-site - from the last scanned reference operation which contains the cut-site
+    contains_cut = ~is_ins & scanned & (pos_idx <= cut_site) & (cut_site <= pos_idx + lengths)
+    cut_op = np.full(alignments_n, -1)
+    np.maximum.at(cut_op, op_row[contains_cut], op_idx[contains_cut])
+    aligned_cut_site = np.where(cut_op >= 0, align_idx[cut_op] + cut_site - pos_idx[cut_op], -1)
+
+    indels = []
+    for indel_op in [left_op, right_op]:
+        found = indel_op >= 0
+        indels.append((np.where(found, codes[indel_op], -1), np.where(found, lengths[indel_op], 0),
+                       np.where(found, align_idx[indel_op], 0)))
+    return indels[0], indels[1], aligned_cut_site
+
+
+def _shift_indels(seqs: np.ndarray, rows: np.ndarray, seq_a: np.ndarray, length: np.ndarray, align_idx: np.ndarray,
+                  aligned_cut_site: np.ndarray, from_left: bool) -> np.ndarray:
+    """
+    Shift a single indel of each alignment towards the cut-site. Only sequence seq_a (read for deletion and reference
+    for insertion) is changed, in place.
+    Shift is possible as long as one of:
+    1. The "pushed" base in seq_a is identical to his match in the other sequence.
+    2. The "pushed" base in seq_a is already marked as a mismatch.
+    :param seqs: gapped sequences - [reference / read, alignment, position]
+    :param rows: alignments (rows of seqs)
+    :param seq_a: index of the shifted sequence of each alignment
+    :param length: indel length
+    :param align_idx: indel position in alignment coordinates
+    :param aligned_cut_site: cut-site in alignment coordinates
+    :param from_left: Flag, shift from left (indel is left to the cut-site) or from right
+    :return: changed flag for each alignment
+    """
+    width = seqs.shape[2]
+    # Max number of steps until the cut-site
+    max_steps = np.maximum(aligned_cut_site - align_idx - length if from_left else
+                           align_idx - np.maximum(aligned_cut_site, 0), 0)
+    steps = np.arange(int(max_steps.max()))[None, :]
+    if from_left:
+        pushed = align_idx[:, None] + length[:, None] + steps  # base of seq_a which is pushed to the left
+        matched = align_idx[:, None] + steps  # its new match in the other sequence
+    else:
+        pushed = align_idx[:, None] - 1 - steps
+        matched = align_idx[:, None] + length[:, None] - 1 - steps
+    valid = steps < max_steps[:, None]
+    pushed, matched = np.clip(pushed, 0, width - 1), np.clip(matched, 0, width - 1)
+
+    seq_b = 1 - seq_a
+    base_a = seqs[seq_a[:, None], rows[:, None], pushed]
+    match_b = seqs[seq_b[:, None], rows[:, None], matched]
+    pushed_b = seqs[seq_b[:, None], rows[:, None], pushed]
+    can_shift = valid & ((base_a == match_b) | ((base_a != pushed_b) & (pushed_b != _GAP)))
+    # Number of steps until the first position which can't be shifted
+    shift = np.argmin(np.concatenate([can_shift, np.zeros((len(rows), 1), dtype=bool)], axis=1), axis=1)
+
+    # Rotate the indel & the shifted bases segment
+    changed = shift > 0
+    if changed.any():
+        rows, seq_a, length, align_idx, shift = rows[changed], seq_a[changed], length[changed], align_idx[changed], \
+            shift[changed]
+        seg_start = align_idx if from_left else align_idx - shift
+        seg_len = length + shift
+        rotation = length if from_left else shift
+        positions = np.arange(width)[None, :]
+        in_seg = (positions >= seg_start[:, None]) & (positions < (seg_start + seg_len)[:, None])
+        source = np.where(in_seg, seg_start[:, None] + (positions - seg_start[:, None] + rotation[:, None]) %
+                          seg_len[:, None], positions)
+        seqs[seq_a, rows] = np.take_along_axis(seqs[seq_a, rows], source, axis=1)
+
+    return changed
+
+
+def _compute_cigars(seqs: np.ndarray, align_len: np.ndarray) -> List[CigarPath]:
+    """
+    Compute cigar paths of gapped sequences (same as Alignment._compute_cigar_path_from_alignment).
+    :param seqs: gapped sequences - [reference / read, alignment, position]
+    :param align_len: alignment length
+    :return: cigar path of each alignment
+    """
+    if seqs.shape[1] == 0:
+        return []
+    ref_m, read_m = seqs[_REF], seqs[_READ]
+    codes = np.where(ref_m == _GAP, CIGAR_OP_I, np.where(read_m == _GAP, CIGAR_OP_D,
+                                                         np.where(ref_m == read_m, CIGAR_OP_M, CIGAR_OP_S)))
+    valid = np.arange(seqs.shape[2])[None, :] < align_len[:, None]
+    codes, code_row = codes[valid], np.nonzero(valid)[0]
+
+    # Run-length encoding of the op codes of all alignments
+    run_start = np.flatnonzero(np.concatenate([[True], (codes[1:] != codes[:-1]) | (code_row[1:] != code_row[:-1])]))
+    run_len = np.diff(np.concatenate([run_start, [len(codes)]]))
+    ops = ((run_len << CIGAR_OP_SHIFT) | codes[run_start]).astype(CIGAR_DTYPE).tobytes()
+    run_end = 4 * np.cumsum(np.bincount(code_row[run_start], minlength=seqs.shape[1]))
+    return [ops[start:end] for start, end in zip(np.concatenate([[0], run_end[:-1]]), run_end)]
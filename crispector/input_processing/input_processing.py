@@ -1,4 +1,5 @@
 import gzip
+import io
 import os
 import subprocess
 from crispector.utils.exceptions import FastpRunTimeError, SgRNANotInReferenceSequence
@@ -6,17 +7,23 @@ from crispector.utils.constants_and_types import AmpliconDf, ReadsDict, ExpType,
     READ, ALIGNMENT_W_INS, ALIGNMENT_W_DEL, CIGAR, ALIGN_SCORE, FREQ, REFERENCE, SGRNA, SITE_NAME, CUT_SITE, REVERSED, \
     L_SITE, L_REV, R_SITE, R_REV, L_READ, R_READ, PRIMER_LEN, TransDf, TRANS_NAME, BAD_AMPLICON_THRESHOLD, CIGAR_LEN, \
     CIGAR_LEN_THRESHOLD, MAX_SCORE, F_PRIMER, R_PRIMER, SGRNA_REVERSED, \
-    NORM_SCORE, TX_IN2, TX_IN1, MOCK_IN1, TX_MERGED, MOCK_MERGED, MOCK_IN2, DONOR, ON_TARGET, \
-    UNMATCHED_PATH
+    NORM_SCORE, TX_IN2, TX_IN1, MOCK_IN1, MOCK_IN2, DONOR, ON_TARGET, UNMATCHED_PATH, IO_BUFFER_SIZE, \
+    FASTP_MIN_THREADS, FASTP_MAX_THREADS, FASTP_THREADS_OPT_RE, FASTP_CACHE_DEFAULT_SIZE, \
+    ALIGNMENT_CACHE_DEFAULT_SIZE, IndelEventsDf
 from crispector.input_processing.alignment import Alignment
-from crispector.input_processing.utils import reverse_complement, parse_fastq_file
+from crispector.input_processing.fastp_cache import FastpCache
+from crispector.input_processing.alignment_cache import AlignmentCache
+from crispector.input_processing.primer_index import match_reads_to_primers
+from crispector.input_processing.utils import reverse_complement, parse_fastq_file, parse_fastq_stream
 from crispector.utils.logger import LoggerWrapper
 from crispector.utils.configurator import Configurator
 from typing import List, Tuple, Dict
 import pandas as pd
+import numpy as np
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import json
-import edlib
+import re
 
 
 class InputProcessing:
@@ -25,7 +32,9 @@ class InputProcessing:
     """
     def __init__(self, ref_df: AmpliconDf, output: Path, min_alignment_score: float, min_trans_alignment_score: float,
                  min_read_length_without_primers: int, cut_site_position: int, disable_translocations: bool, fastp_options_string: str,
-                 keep_intermediate_files: bool, max_edit_distance_on_primers: int):
+                 keep_intermediate_files: bool, max_edit_distance_on_primers: int, threads: int = 1,
+                 fastp_cache_dir: Path = None, fastp_cache_size: float = FASTP_CACHE_DEFAULT_SIZE,
+                 alignment_cache_path: Path = None, alignment_cache_size: float = ALIGNMENT_CACHE_DEFAULT_SIZE):
         """
         :param ref_df: AmpliconDf type
         :param output: output path
@@ -34,15 +43,27 @@ class InputProcessing:
         :param cut_site_position: position relative to the PAM
         :param disable_translocations : Flag
         :param fastp_options_string: string
+        :param keep_intermediate_files: Flag
+        :param max_edit_distance_on_primers: Max edit distance to account as a primer match
+        :param threads: CPUs budget
+        :param fastp_cache_dir: fastp merge results cache folder. None to disable the cache.
+        :param fastp_cache_size: fastp cache max size (GB)
+        :param alignment_cache_path: alignment cache file. None to disable the cache.
+        :param alignment_cache_size: alignment cache max size (GB)
         :return:
         """
         self._ref_df = ref_df
         self._output = output
         self._min_trans_score = min_trans_alignment_score
         self._cut_site_pos = cut_site_position
-        self._fastp_options = fastp_options_string
+        # fastp worker threads are set by the fastp scheduler
+        self._fastp_options = re.sub(FASTP_THREADS_OPT_RE, " ", " " + fastp_options_string).strip()
+        self._threads = threads
         self._dis_trans = disable_translocations
         self._keep_fastp = keep_intermediate_files
+        self._fastp_cache = None
+        if fastp_cache_dir is not None:
+            self._fastp_cache = FastpCache(fastp_cache_dir, int(fastp_cache_size * 2**30))
 
         # Set logger
         logger = LoggerWrapper.get_logger()
@@ -54,16 +75,16 @@ class InputProcessing:
         self._max_error_on_primer = max_edit_distance_on_primers
 
         # create alignment instance
+        alignment_cache = None
+        if alignment_cache_path is not None:
+            alignment_cache = AlignmentCache(alignment_cache_path, int(alignment_cache_size * 2**30))
         self._aligner = Alignment(self._cfg["alignment"], min_alignment_score, min_read_length_without_primers,
-                                  self._cfg["NHEJ_inference"]["window_size"])
+                                  self._cfg["NHEJ_inference"]["window_size"], alignment_cache)
 
         # Add max_score column to ref_df
         max_score_list = []
         for _, row in self._ref_df.iterrows():
-            reference = row[REFERENCE]
-
-            _, _, _, _, max_score = self._aligner.needle_wunsch_align(reference=reference, read=reference)
-            max_score_list.append(max_score)
+            max_score_list.append(self._aligner.self_align_score(row[REFERENCE]))
         self._ref_df[MAX_SCORE] = max_score_list
 
         # Add primers where values are None
@@ -94,6 +115,9 @@ class InputProcessing:
         self._aligned_n[ExpType.TX] = 0
         self._aligned_n[ExpType.MOCK] = 0
 
+        # Indel events of each site (see Alignment.align_reads)
+        self._indel_events: Dict[Tuple[str, ExpType], IndelEventsDf] = dict()
+
     # -------------------------------#
     ######### Public methods #########
     # -------------------------------#
@@ -107,8 +131,9 @@ class InputProcessing:
 
             # Filter low quality reads and merge pair-end reads with fastp
             if not override_fastp:
-                tx_merged, tx_read_n, tx_merged_n = self._fastp(tx_in1, tx_in2, self._output, ExpType.TX)
-                mock_merged, mock_read_n, mock_merged_n = self._fastp(mock_in1, mock_in2, self._output, ExpType.MOCK)
+                [(tx_reads, tx_read_n, tx_merged_n), (mock_reads, mock_read_n, mock_merged_n)] = self._run_fastp_jobs(
+                    [(tx_in1, tx_in2, self._output, ExpType.TX, ExpType.TX.name),
+                     (mock_in1, mock_in2, self._output, ExpType.MOCK, ExpType.MOCK.name)])
                 self._input_n[ExpType.TX] += tx_read_n
                 self._merged_n[ExpType.TX] += tx_merged_n
                 self._input_n[ExpType.MOCK] += mock_read_n
@@ -116,116 +141,76 @@ class InputProcessing:
             # Skip merge
             else:
                 self._logger.info("Skip merging with fastp and read merged files from input.")
-                tx_merged, mock_merged = tx_in1, mock_in1
+                tx_reads, mock_reads = parse_fastq_file(tx_in1), parse_fastq_file(mock_in1)
 
             # Demultiplexing reads
-            tx_reads, tx_trans_df = self._demultiplex_reads(tx_merged, ExpType.TX)
-            mock_reads, mock_trans_df = self._demultiplex_reads(mock_merged, ExpType.MOCK)
+            tx_reads, tx_trans_df = self._demultiplex_reads(tx_reads, ExpType.TX)
+            mock_reads, mock_trans_df = self._demultiplex_reads(mock_reads, ExpType.MOCK)
 
             # Split read_df to all the different sites
-            tx_reads_d: ReadsDict = dict()
-            mock_reads_d: ReadsDict = dict()
-            for _, row in self._ref_df.iterrows():
-                site = row[SITE_NAME]
-                if self._donor and row[ON_TARGET]:
-                    tx_reads_d[site] = pd.DataFrame(columns=[READ, FREQ])
-                    mock_reads_d[site] = pd.DataFrame(columns=[READ, FREQ])
-                    continue
-                tx_reads_d[site] = tx_reads.loc[tx_reads[SITE_NAME] == site].sort_values(by=[FREQ],
-                                                                                         ascending=False).reset_index(drop=True)
-                mock_reads_d[site] = mock_reads.loc[mock_reads[SITE_NAME] == site].sort_values(by=[FREQ],
-                                                                                               ascending=False).reset_index(drop=True)
-                tx_reads_d[site].drop(columns=[SITE_NAME], inplace=True)
-                mock_reads_d[site].drop(columns=[SITE_NAME], inplace=True)
-
-            # Remove fastp files
-            if not override_fastp and not self._keep_fastp:
-                if os.path.exists(tx_merged):
-                    os.remove(tx_merged)
-                if os.path.exists(mock_merged):
-                    os.remove(mock_merged)
+            tx_reads_d: ReadsDict = self._split_reads_by_site(tx_reads)
+            mock_reads_d: ReadsDict = self._split_reads_by_site(mock_reads)
 
         # Multiplexed input
         else:
             override_fastp = self._ref_df[TX_IN2].isna().all()
-
-            # Filter low quality reads and merge pair-end reads with fastp
-            if not override_fastp:
-                tx_merged_l = []
-                mock_merged_l = []
-                for _, row in self._ref_df.iterrows():
-                    self._logger.info("fastp for {} - May take a few minutes.".format(row[SITE_NAME]))
-                    site_output = os.path.join(self._output, row[SITE_NAME])
-                    tx_merged, tx_read_n, tx_merged_n = self._fastp(row[TX_IN1], row[TX_IN2], site_output, ExpType.TX)
-                    mock_merged, mock_read_n, mock_merged_n = self._fastp(row[MOCK_IN1], row[MOCK_IN2], site_output,
-                                                                          ExpType.MOCK)
-                    tx_merged_l.append(tx_merged)
-                    mock_merged_l.append(mock_merged)
-                    self._input_n[ExpType.TX] += tx_read_n
-                    self._merged_n[ExpType.TX] += tx_merged_n
-                    self._input_n[ExpType.MOCK] += mock_read_n
-                    self._merged_n[ExpType.MOCK] += mock_merged_n
-
-                self._ref_df[TX_MERGED] = tx_merged_l
-                self._ref_df[MOCK_MERGED] = mock_merged_l
-            # Skip merge
-            else:
+            if override_fastp:
                 self._logger.info("Skip merging with fastp and read merged files from input.")
-                self._ref_df[TX_MERGED] = self._ref_df[TX_IN1]
-                self._ref_df[MOCK_MERGED] = self._ref_df[MOCK_IN1]
 
             # No demultiplexing
             tx_trans_df, mock_trans_df = pd.DataFrame(), pd.DataFrame()
 
-            # Split read_df to all the different sites
+            # Filter low quality reads and merge pair-end reads with fastp - All sites run concurrently
+            if not override_fastp:
+                fastp_jobs = []
+                for _, row in self._ref_df.iterrows():
+                    site_output = os.path.join(self._output, row[SITE_NAME])
+                    for in1, in2, exp_type in zip([row[TX_IN1], row[MOCK_IN1]], [row[TX_IN2], row[MOCK_IN2]],
+                                                  [ExpType.TX, ExpType.MOCK]):
+                        fastp_jobs.append((in1, in2, site_output, exp_type,
+                                           "{}_{}".format(row[SITE_NAME], exp_type.name)))
+                fastp_results = iter(self._run_fastp_jobs(fastp_jobs))
+
+            # Split reads to the different sites
             tx_reads_d: ReadsDict = dict()
             mock_reads_d: ReadsDict = dict()
             for _, row in self._ref_df.iterrows():
-                for reads_d, merged_fastq, exp_type in zip([tx_reads_d, mock_reads_d],
-                                                           [row[TX_MERGED], row[MOCK_MERGED]],
-                                                           [ExpType.TX, ExpType.MOCK]):
+                for reads_d, in1, exp_type in zip([tx_reads_d, mock_reads_d], [row[TX_IN1], row[MOCK_IN1]],
+                                                  [ExpType.TX, ExpType.MOCK]):
+                    if not override_fastp:
+                        reads_df, read_n, merged_n = next(fastp_results)
+                        self._input_n[exp_type] += read_n
+                        self._merged_n[exp_type] += merged_n
+
                     if self._donor and row[ON_TARGET]:
                         reads_d[row[SITE_NAME]] = pd.DataFrame(columns=[READ, FREQ])
                         continue
-                    reads = parse_fastq_file(merged_fastq)
-                    reads_df = pd.DataFrame(data=reads, columns=[READ])
-                    # Group identical reads together
-                    reads_df = reads_df.groupby(READ).size().to_frame(FREQ).reset_index()
-                    reads_d[row[SITE_NAME]] = reads_df
 
                     if override_fastp:
+                        # Parse and group identical reads together
+                        reads_df = parse_fastq_file(in1)
                         self._input_n[exp_type] += reads_df[FREQ].sum()
                         self._merged_n[exp_type] += reads_df[FREQ].sum()
-
-            # Remove fastp files
-            if not override_fastp and not self._keep_fastp:
-                for _, row in self._ref_df.iterrows():
-                    if os.path.exists(row[TX_MERGED]):
-                        os.remove(row[TX_MERGED])
-                    if os.path.exists(row[MOCK_MERGED]):
-                        os.remove(row[MOCK_MERGED])
+                    reads_d[row[SITE_NAME]] = reads_df
 
         # Align reads
         self._logger.debug("Alignment - Start alignment for all reads")
+        align_sites = []
         for _, row in self._ref_df.iterrows():
             site_output = os.path.join(self._output, row[SITE_NAME])
             primers_len = len(row[F_PRIMER]) + len(row[R_PRIMER])
+            for exp_type, reads_d in [(ExpType.TX, tx_reads_d), (ExpType.MOCK, mock_reads_d)]:
+                exp_name = "{}_{}".format(row[SITE_NAME], exp_type.name)
+                align_sites.append((reads_d[row[SITE_NAME]], row[REFERENCE], row[CUT_SITE], primers_len, site_output,
+                                    exp_name, exp_type))
 
-            # Align Treatment
-            reads_df = tx_reads_d[row[SITE_NAME]]
-            exp_name = "{}_{}".format(row[SITE_NAME], ExpType.TX.name)
-            reads_df = self._aligner.align_reads(reads_df, row[REFERENCE], row[CUT_SITE], primers_len, site_output,
-                                                 exp_name, ExpType.TX)
-            tx_reads_d[row[SITE_NAME]] = reads_df
-            self._aligned_n[ExpType.TX] += reads_df[FREQ].sum()
-
-            # Align Mock
-            reads_df = mock_reads_d[row[SITE_NAME]]
-            exp_name = "{}_{}".format(row[SITE_NAME], ExpType.MOCK.name)
-            reads_df = self._aligner.align_reads(reads_df, row[REFERENCE], row[CUT_SITE], primers_len, site_output,
-                                                 exp_name, ExpType.MOCK)
-            mock_reads_d[row[SITE_NAME]] = reads_df
-            self._aligned_n[ExpType.MOCK] += reads_df[FREQ].sum()
+        aligned_reads = iter(self._aligner.align_sites(align_sites, self._threads))
+        for _, row in self._ref_df.iterrows():
+            for exp_type, reads_d in [(ExpType.TX, tx_reads_d), (ExpType.MOCK, mock_reads_d)]:
+                reads_df, indel_events = next(aligned_reads)
+                reads_d[row[SITE_NAME]] = reads_df
+                self._indel_events[(row[SITE_NAME], exp_type)] = indel_events
+                self._aligned_n[exp_type] += reads_df[FREQ].sum()
 
         # Warning if the number of reads isn't balanced
         if (self._aligned_n[ExpType.TX] > 3 * self._aligned_n[ExpType.MOCK]) or \
@@ -239,39 +224,94 @@ class InputProcessing:
     ######### Private methods #######
     #-------------------------------#
     ######### Merging ###########
-    def _fastp(self, in1: Path, in2: Path, output: Path, exp_type: ExpType) -> Tuple[Path, int, int]:
+    def _run_fastp_jobs(self, jobs: List[Tuple[Path, Path, Path, ExpType, str]]) -> List[Tuple[ReadsDf, int, int]]:
+        """
+        Run fastp jobs concurrently under the CPUs budget. The budget is split evenly between concurrent jobs.
+        :param jobs: list of _fastp arguments - (in1, in2, output, exp_type, name)
+        :return: list of _fastp results, in jobs order
+        """
+        if len(jobs) == 0:
+            return []
+        concurrency = min(len(jobs), max(1, self._threads // FASTP_MIN_THREADS))
+        fastp_threads = min(FASTP_MAX_THREADS, max(1, self._threads // concurrency))
+        self._logger.info("fastp - Run {} jobs, {} concurrently with {} threads each (may take a few minutes)."
+                          .format(len(jobs), concurrency, fastp_threads))
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(self._fastp, *job, fastp_threads) for job in jobs]
+            try:
+                return [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _fastp(self, in1: Path, in2: Path, output: Path, exp_type: ExpType, name: str, threads: int) \
+            -> Tuple[ReadsDf, int, int]:
         """
         Wrapper for fastp SW.
+        Merged reads are streamed from fastp stdout and grouped while fastp is still running. Merged & unmerged
+        reads are written to the fastp folder only if intermediate files are kept.
+        If fastp cache is enabled, merge results of identical inputs & options are reused. Cached results aren't
+        reused if intermediate files are kept, since only fastp writes them.
         :param in1: read1 input
         :param in2: read2 input
         :param output: output directory
         :param exp_type
-        :return: path to merged fastq file, reads_numbers, reads_merged_numbers
+        :param name: experiment name for logging
+        :param threads: fastp worker threads
+        :return: merged reads (ReadsDf), reads_numbers, reads_merged_numbers
         """
         # Create output folder
         fastp_output = os.path.join(output, FASTP_DIR[exp_type])
         if not os.path.exists(fastp_output):
             os.makedirs(fastp_output)
 
-        if not os.path.exists(fastp_output):
-            os.makedirs(fastp_output)
-
         merged_path = os.path.join(fastp_output, "merged_reads.fastq")
+        if self._keep_fastp:
+            out_args = ["-o", os.path.join(fastp_output, "r1_filtered_reads.fastq"),
+                        "-O", os.path.join(fastp_output, "r2_filtered_reads.fastq"), "--merged_out", merged_path]
+            log_redirect = ">> {} 2>&1".format(LoggerWrapper.get_log_path())
+        else:
+            out_args = ["-o", os.devnull, "-O", os.devnull, "--stdout"]
+            log_redirect = "2>> {}".format(LoggerWrapper.get_log_path())
 
-        command = ["fastp", "-i", in1, "-I", in2, "-o", os.path.join(fastp_output, "r1_filtered_reads.fastq"),
-                   "-O", os.path.join(fastp_output, "r2_filtered_reads.fastq"), "-m", "--merged_out", merged_path,
-                   "-j", os.path.join(fastp_output, "fastp.json"), "-h", os.path.join(fastp_output, "fastp.html"),
-                   "--length_required {}".format(2*PRIMER_LEN),
-                   self._fastp_options, ">> {} 2>&1".format(LoggerWrapper.get_log_path())]
+        fastp_options = "-m --length_required {} {}".format(2*PRIMER_LEN, self._fastp_options)
+        command = ["fastp", "-i", in1, "-I", in2] + out_args + \
+                  ["-j", os.path.join(fastp_output, "fastp.json"), "-h", os.path.join(fastp_output, "fastp.html"),
+                   "-w {}".format(threads), fastp_options, log_redirect]
 
         command = " ".join(command)
 
-        self._logger.debug("fastp for {} - Command {}".format(exp_type.name, command))
-        self._logger.info("fastp for {} - Run (may take a few minutes).".format(exp_type.name))
-        try:
-            subprocess.run(command, shell=True, check=True)
-        except subprocess.CalledProcessError:
-            raise FastpRunTimeError()
+        # Reuse merge results from cache
+        cache_key = None
+        reads_df = None
+        if self._fastp_cache is not None:
+            cache_key = self._fastp_cache.key([in1, in2], fastp_options)
+            if not self._keep_fastp:
+                reads_df = self._fastp_cache.get(cache_key, fastp_output)
+            if reads_df is not None:
+                self._logger.info("fastp for {} - Reuse cached merge results ({}).".format(name, cache_key))
+
+        # Run fastp
+        if reads_df is None:
+            self._logger.debug("fastp for {} - Command {}".format(name, command))
+            self._logger.info("fastp for {} - Run (may take a few minutes).".format(name))
+            if self._keep_fastp:
+                try:
+                    subprocess.run(command, shell=True, check=True)
+                except subprocess.CalledProcessError:
+                    raise FastpRunTimeError()
+                reads_df = parse_fastq_file(merged_path)
+            else:
+                process = subprocess.Popen(command, shell=True, stdout=subprocess.PIPE, bufsize=IO_BUFFER_SIZE)
+                with io.TextIOWrapper(process.stdout) as merged_stream:
+                    reads_df = parse_fastq_stream(merged_stream)
+                if process.wait() != 0:
+                    raise FastpRunTimeError()
+
+            if self._fastp_cache is not None:
+                self._fastp_cache.put(cache_key, reads_df, fastp_output)
 
         # Get the number of reads in the input
         fastp_summary_path = os.path.join(fastp_output, "fastp.json")
@@ -284,22 +324,42 @@ class InputProcessing:
             reads_in_input_num = -1
             merged_reads_num =-1
 
-        self._logger.info("fastp for {} - Done.".format(exp_type.name))
+        self._logger.info("fastp for {} - Done.".format(name))
 
-        return merged_path, reads_in_input_num, merged_reads_num
+        return reads_df, reads_in_input_num, merged_reads_num
 
     ######### Demultiplex ###########
-    def _demultiplex_reads(self, merged_fastq: Path, exp_type: ExpType) -> Tuple[ReadsDf, TransDf]:
+    def _split_reads_by_site(self, reads_df: ReadsDf) -> ReadsDict:
+        """
+        Split demultiplexed reads to the different sites in a single pass.
+        Reads are grouped by the site categorical code and each site is sorted by frequency.
+        :param reads_df: demultiplexed reads with SITE_NAME column
+        :return: ReadsDict
+        """
+        sites = list(self._ref_df[SITE_NAME])
+        site_codes = pd.Categorical(reads_df[SITE_NAME], categories=sites).codes
+        order = np.argsort(site_codes, kind="stable")
+        bounds = np.searchsorted(site_codes[order], np.arange(len(sites) + 1))
+        reads_df = reads_df.drop(columns=[SITE_NAME])
+
+        reads_d: ReadsDict = dict()
+        for site_idx, (site, on_target) in enumerate(zip(sites, self._ref_df[ON_TARGET])):
+            if self._donor and on_target:
+                reads_d[site] = pd.DataFrame(columns=[READ, FREQ])
+                continue
+            site_reads = reads_df.take(order[bounds[site_idx]:bounds[site_idx + 1]])
+            reads_d[site] = site_reads.sort_values(by=[FREQ], ascending=False).reset_index(drop=True)
+
+        return reads_d
+
+    def _demultiplex_reads(self, reads_df: ReadsDf, exp_type: ExpType) -> Tuple[ReadsDf, TransDf]:
         """
         Demultiplex reads using edit distance on primers.
         For ambiguous matching - search for correct matching or translocation by full alignment
-        :param merged_fastq: fastp merged fastq file
+        :param reads_df: merged reads, grouped to unique reads (READ & FREQ columns)
         :param exp_type: ExpType
         :return: Tuple ReadsDf & translocation df
         """
-        reads = parse_fastq_file(merged_fastq)
-        reads_df = pd.DataFrame(data=reads, columns=[READ])
-
         # Prepare primers for match
         references = self._ref_df[REFERENCE].str
         left_primers = list(references[:PRIMER_LEN]) + list(references[-PRIMER_LEN:].apply(reverse_complement))
@@ -316,8 +376,6 @@ class InputProcessing:
             primers_names += 2*list(self._donor_names)
             primers_rev += len(self._donor_names) * [False] + len(self._donor_names) * [True]
 
-        # Group identical reads together
-        reads_df = reads_df.groupby(READ).size().to_frame(FREQ).reset_index()
         total_read_n = reads_df[FREQ].sum()
 
         # Update number of reads in input (relevant when input is already merged)
@@ -338,8 +396,9 @@ class InputProcessing:
         r_match = self._compute_read_primer_matching(reads_df[R_READ].unique(), right_primers, primers_rev,
                                                      primers_names, self._max_error_on_primer)
 
-        reads_df[[L_SITE, L_REV]] = reads_df.apply((lambda row: l_match[row[L_READ]]), axis=1, result_type='expand')
-        reads_df[[R_SITE, R_REV]] = reads_df.apply((lambda row: r_match[row[R_READ]]), axis=1, result_type='expand')
+        for match, read_col, site_col, rev_col in [(l_match, L_READ, L_SITE, L_REV), (r_match, R_READ, R_SITE, R_REV)]:
+            reads_df[site_col] = reads_df[read_col].map({read: site for read, (site, _) in match.items()})
+            reads_df[rev_col] = reads_df[read_col].map({read: rev for read, (_, rev) in match.items()})
 
         unmatched_df = reads_df.loc[(reads_df[L_SITE] != reads_df[R_SITE]) | (reads_df[L_REV] != reads_df[R_REV])].copy()
         reads_df.drop(index=unmatched_df.index, inplace=True)
@@ -374,6 +433,7 @@ class InputProcessing:
                                           primers_names: List[str], max_edit_distance: int) -> Dict[DNASeq, Tuple[str, bool]]:
         """
         Create a dictionary with a match between each possible read (key) and a primer (val).
+        Reads are matched in parallel by up to self._threads processes.
         :param reads:  partial (left or right) reads
         :param primers: List of primers sequences
         :param primers_revered: List that indicates if primers reversed or not
@@ -381,37 +441,8 @@ class InputProcessing:
         :param max_edit_distance: Max edit distance to account as a match
         :return: Dict[read, Tuple[site_name, reversed_flag]]
         """
-        match = dict()
-        for read in reads:
-            match[read] = self._match_by_edit_distance(read, primers, primers_revered, primers_names, max_edit_distance)
-
-        return match
-
-    @staticmethod
-    def _match_by_edit_distance(read: DNASeq, primers: List[DNASeq], primers_revered: List[bool],
-                                primers_names: List[str], max_edit_distance: int) -> Tuple[str, bool]:
-        """
-        Find for every read the most similar sequence (primer).
-        If the minimum edit distance is above DNASeq, no primer is matched.
-        :param read:  reads
-        :param primers: List of primers sequences
-        :param primers_revered: List that indicates if primers reversed or not
-        :param primers_names: primers names
-        :param max_edit_distance: Max edit distance to account as a match
-        :return: site_name, reversed flag
-        """
-        min_name = None
-        min_dist = max_edit_distance + 1
-        min_reversed = False
-
-        for primer, reverse, name  in zip(primers, primers_revered, primers_names):
-            d = edlib.align(read, primer, k=min_dist)['editDistance']
-            if d < min_dist and d != -1:
-                min_dist = d
-                min_name = name
-                min_reversed = reverse
-
-        return min_name, min_reversed
+        return match_reads_to_primers(reads, primers, primers_revered, primers_names, max_edit_distance,
+                                      self._threads)
 
     def _detect_bad_amplicons(self, unmatched_df: ReadsDf):
         """
@@ -457,7 +488,7 @@ class InputProcessing:
         r_ref = reverse_complement(r_ref[:r_cut_site]) if r_rev else r_ref[r_cut_site:]
 
         reference = l_ref + r_ref
-        _, _, _, _, max_score = self._aligner.needle_wunsch_align(reference=reference, read=reference)
+        max_score = self._aligner.self_align_score(reference)
 
         return reference, l_cut_site, max_score
 
@@ -512,11 +543,11 @@ class InputProcessing:
 
             # Compute left site and right site alignment score - to verify that the highest is the translocation
             l_ref = reverse_complement(self._ref_df[REFERENCE][l_name]) if l_rev else self._ref_df[REFERENCE][l_name]
-            _, _, _, _, l_align_score = self._aligner.needle_wunsch_align(reference=l_ref, read=row[READ])
+            l_align_score = self._aligner.align_score(reference=l_ref, read=row[READ])
             l_normalized_score = l_align_score / self._ref_df[MAX_SCORE][l_name]
 
             r_ref = reverse_complement(self._ref_df[REFERENCE][r_name]) if r_rev else self._ref_df[REFERENCE][r_name]
-            _, _, _, _, r_align_score = self._aligner.needle_wunsch_align(reference=r_ref, read=row[READ])
+            r_align_score = self._aligner.align_score(reference=r_ref, read=row[READ])
             r_normalized_score = r_align_score / self._ref_df[MAX_SCORE][r_name]
 
             # Check if left or right sites have better alignment than the translocation
@@ -620,3 +651,12 @@ class InputProcessing:
         :return:
         """
         return self._input_n[exp_type], self._merged_n[exp_type], self._aligned_n[exp_type]
+
+    def indel_events(self, site_name: str, exp_type: ExpType) -> IndelEventsDf:
+        """
+        return the indel events of the site aligned reads (available after run)
+        :param site_name:
+        :param exp_type:
+        :return:
+        """
+        return self._indel_events[(site_name, exp_type)]
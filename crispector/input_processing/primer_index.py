@@ -0,0 +1,163 @@
+from crispector.utils.constants_and_types import DNASeq, PRIMER_MIN_PIECE_LEN, DEMULTIPLEX_MIN_SHARD_SIZE
+from typing import List, Tuple, Dict
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import edlib
+
+# Primers index of a worker process (see match_reads_to_primers)
+_worker_primer_index = None
+
+
+def match_by_edit_distance(read: DNASeq, primers: List[DNASeq], primers_revered: List[bool],
+                           primers_names: List[str], max_edit_distance: int) -> Tuple[str, bool]:
+    """
+    Find for every read the most similar sequence (primer).
+    If the minimum edit distance is above DNASeq, no primer is matched.
+    For equal edit distance, the first primer in the list is matched.
+    :param read:  reads
+    :param primers: List of primers sequences
+    :param primers_revered: List that indicates if primers reversed or not
+    :param primers_names: primers names
+    :param max_edit_distance: Max edit distance to account as a match
+    :return: site_name, reversed flag
+    """
+    min_name = None
+    min_dist = max_edit_distance + 1
+    min_reversed = False
+
+    for primer, reverse, name in zip(primers, primers_revered, primers_names):
+        d = edlib.align(read, primer, k=min_dist)['editDistance']
+        if d < min_dist and d != -1:
+            min_dist = d
+            min_name = name
+            min_reversed = reverse
+
+    return min_name, min_reversed
+
+
+class PrimerIndex:
+    """
+    Primers index for demultiplexing. Return exactly the same match as match_by_edit_distance:
+    1. Exact match - hash lookup.
+    2. For increasing edit distance levels t - pigeonhole filter: a primer with edit distance <= t from the read
+       has at least one of its t+1 disjoint pieces as an exact substring of the read. Only these candidates are
+       verified with edlib.
+    3. If no primer is found within the filter levels - full scan with edlib.
+    """
+    def __init__(self, primers: List[DNASeq], primers_revered: List[bool], primers_names: List[str],
+                 max_edit_distance: int):
+        """
+        :param primers: List of primers sequences
+        :param primers_revered: List that indicates if primers reversed or not
+        :param primers_names: primers names
+        :param max_edit_distance: Max edit distance to account as a match
+        """
+        self._primers = list(primers)
+        self._primers_rev = list(primers_revered)
+        self._primers_names = list(primers_names)
+        self._max_edit_distance = max_edit_distance
+
+        # Exact match - first primer with identical sequence
+        self._exact: Dict[DNASeq, int] = dict()
+        for idx, primer in enumerate(self._primers):
+            self._exact.setdefault(primer, idx)
+
+        # Pigeonhole filter levels - Key is edit distance level and value is Dict[piece, primers indexes]
+        min_primer_len = min([len(primer) for primer in self._primers], default=0)
+        self._levels: List[Tuple[int, Dict[DNASeq, List[int]], List[int]]] = []
+        for t in range(1, max_edit_distance + 1):
+            if min_primer_len // (t + 1) < PRIMER_MIN_PIECE_LEN:
+                break
+            pieces_d = defaultdict(set)
+            for idx, primer in enumerate(self._primers):
+                for piece in self._split_to_pieces(primer, t + 1):
+                    pieces_d[piece].add(idx)
+            pieces_len = sorted({len(piece) for piece in pieces_d})
+            self._levels.append((t, {piece: sorted(idx_s) for piece, idx_s in pieces_d.items()}, pieces_len))
+
+    def match(self, read: DNASeq) -> Tuple[str, bool]:
+        """
+        Find the most similar primer to read.
+        :param read: partial (left or right) read
+        :return: site_name, reversed flag
+        """
+        # Exact match
+        idx = self._exact.get(read)
+        if idx is not None:
+            return self._primers_names[idx], self._primers_rev[idx]
+
+        # Pigeonhole filter & verification
+        for t, pieces_d, pieces_len in self._levels:
+            candidates = set()
+            for piece_len in pieces_len:
+                for start in range(len(read) - piece_len + 1):
+                    candidates.update(pieces_d.get(read[start:start + piece_len], ()))
+            if not candidates:
+                continue
+            candidates = sorted(candidates)
+            name, rev = match_by_edit_distance(read, [self._primers[idx] for idx in candidates],
+                                               [self._primers_rev[idx] for idx in candidates],
+                                               [self._primers_names[idx] for idx in candidates], t)
+            # Found primer within distance t. All primers within distance t are candidates, so match is optimal.
+            if name is not None:
+                return name, rev
+
+        # Full scan (the closest primer is farther than all filter levels)
+        if (len(self._levels) > 0) and (self._levels[-1][0] == self._max_edit_distance):
+            return None, False
+        return match_by_edit_distance(read, self._primers, self._primers_rev, self._primers_names,
+                                      self._max_edit_distance)
+
+    @staticmethod
+    def _split_to_pieces(primer: DNASeq, pieces_n: int) -> List[DNASeq]:
+        """
+        Split primer to pieces_n disjoint pieces (lengths differ by at most 1).
+        """
+        q, r = divmod(len(primer), pieces_n)
+        pieces = []
+        start = 0
+        for piece_idx in range(pieces_n):
+            end = start + q + (1 if piece_idx < r else 0)
+            pieces.append(primer[start:end])
+            start = end
+        return pieces
+
+
+def _init_primer_index_worker(primers: List[DNASeq], primers_revered: List[bool], primers_names: List[str],
+                              max_edit_distance: int):
+    global _worker_primer_index
+    _worker_primer_index = PrimerIndex(primers, primers_revered, primers_names, max_edit_distance)
+
+
+def _match_reads_shard(reads: List[DNASeq]) -> List[Tuple[str, bool]]:
+    return [_worker_primer_index.match(read) for read in reads]
+
+
+def match_reads_to_primers(reads: List[DNASeq], primers: List[DNASeq], primers_revered: List[bool],
+                           primers_names: List[str], max_edit_distance: int, processes: int = 1) \
+        -> Dict[DNASeq, Tuple[str, bool]]:
+    """
+    Match each read to the most similar primer. Reads are split into shards which are matched by a process pool.
+    :param reads: unique partial (left or right) reads
+    :param primers: List of primers sequences
+    :param primers_revered: List that indicates if primers reversed or not
+    :param primers_names: primers names
+    :param max_edit_distance: Max edit distance to account as a match
+    :param processes: max number of worker processes
+    :return: Dict[read, Tuple[site_name, reversed_flag]]
+    """
+    reads = list(reads)
+    shards_n = min(processes, len(reads) // DEMULTIPLEX_MIN_SHARD_SIZE)
+    if shards_n <= 1:
+        primer_index = PrimerIndex(primers, primers_revered, primers_names, max_edit_distance)
+        return {read: primer_index.match(read) for read in reads}
+
+    # Smaller shards than processes, for load balance
+    shards = [reads[idx::4*shards_n] for idx in range(4*shards_n)]
+    with ProcessPoolExecutor(max_workers=shards_n, initializer=_init_primer_index_worker,
+                             initargs=(primers, primers_revered, primers_names, max_edit_distance)) as pool:
+        match = dict()
+        for shard, shard_match in zip(shards, pool.map(_match_reads_shard, shards)):
+            match.update(zip(shard, shard_match))
+
+    return match
@@ -0,0 +1,179 @@
+from crispector.utils.constants_and_types import DNASeq, TRIE_ALIGNMENT_MAX_CELLS
+from crispector.input_processing.banded_alignment import AlignmentPath
+from typing import List, Tuple
+import numpy as np
+
+_STATE_M, _STATE_D, _STATE_I = 0, 1, 2
+
+
+def trie_align_batch(reference: DNASeq, reads: List[DNASeq], match_score: float, mismatch_score: float,
+                     open_gap_score: float, extend_gap_score: float) -> List[Tuple[AlignmentPath, float]]:
+    """
+    Global alignment (Gotoh affine gaps) of a batch of reads against a single reference, with DP rows shared by
+    reads with a common prefix.
+    Reads are sorted and arranged in a trie - every trie node (distinct read prefix) is a DP row over the
+    reference, computed once from its parent row. Rows of all nodes of the same depth are computed together, and
+    the rows are kept for the traceback of every read. Reads are processed in groups, to bound the memory of the
+    kept rows.
+    Ties are broken as in biopython PairwiseAligner Gotoh algorithm, so alignments are identical to PairwiseAligner
+    alignments. Assumes open_gap_score != extend_gap_score, and scores which are multiples of
+    ALIGNMENT_EXACT_SCORE_UNIT - the DP is computed exactly, in float32 if possible and otherwise in float64.
+    :param reference: reference sequence
+    :param reads: reads to align
+    :param match_score: match score
+    :param mismatch_score: mismatch score
+    :param open_gap_score: open gap score
+    :param extend_gap_score: extend gap score
+    :return: List of (alignment path, score), in reads order
+    """
+    order = sorted(range(len(reads)), key=lambda idx: reads[idx])
+    results = len(reads) * [None]
+
+    # Group sorted reads, such that each group doesn't keep more than TRIE_ALIGNMENT_MAX_CELLS DP cells. prefix_len
+    # is the common prefix length with the previous read in the group (-1 for the first read).
+    group, prefix_len, group_cells, prev_read = [], [], 0, ""
+    for idx in order:
+        read = reads[idx]
+        common_len = _common_prefix_len(prev_read, read)
+        new_cells = (len(read) - common_len) * (len(reference) + 1)
+        if group and (group_cells + new_cells > TRIE_ALIGNMENT_MAX_CELLS):
+            _align_trie(reference, reads, group, prefix_len, results, match_score, mismatch_score, open_gap_score,
+                        extend_gap_score)
+            group, prefix_len, group_cells = [], [], len(read) * (len(reference) + 1)
+        else:
+            group_cells += new_cells
+        group.append(idx)
+        prefix_len.append(common_len if len(group) > 1 else -1)
+        prev_read = read
+    if group:
+        _align_trie(reference, reads, group, prefix_len, results, match_score, mismatch_score, open_gap_score,
+                    extend_gap_score)
+
+    return results
+
+
+def _common_prefix_len(seq_a: DNASeq, seq_b: DNASeq) -> int:
+    length = min(len(seq_a), len(seq_b))
+    for idx in range(length):
+        if seq_a[idx] != seq_b[idx]:
+            return idx
+    return length
+
+
+def _score_dtype(scores: List[float], path_len: int) -> type:
+    """
+    Return float32 if every DP value is exact in float32, otherwise float64. DP values are multiples of the scores
+    unit (one over the largest denominator of the scores, a power of 2), bounded by twice the path length times the
+    largest score (intermediate gap values included), and float32 is exact up to 2^24 units.
+    """
+    unit = 1 / max([float(score).as_integer_ratio()[1] for score in scores])
+    max_value = 2 * (path_len + 1) * max([abs(score) for score in scores])
+    return np.float32 if max_value / unit < 2 ** 24 else np.float64
+
+
+def _align_trie(reference: DNASeq, reads: List[DNASeq], group: List[int], prefix_len: List[int], results: List,
+                match_score: float, mismatch_score: float, open_gap_score: float, extend_gap_score: float):
+    """
+    Align a group of sorted reads. Results are stored in results (by read index).
+    """
+    ref_len = len(reference)
+    group_reads = [reads[idx] for idx in group]
+    reads_len = np.array([len(read) for read in group_reads])
+    max_len = int(reads_len.max())
+    dtype = _score_dtype([match_score, mismatch_score, open_gap_score, extend_gap_score], ref_len + max_len)
+    read_codes = np.zeros((len(group_reads), max_len), dtype=np.uint8)
+    for read_idx, read in enumerate(group_reads):
+        read_codes[read_idx, :len(read)] = np.frombuffer(read.encode(), dtype=np.uint8)
+    prefix_len = np.array(prefix_len)
+
+    # Substitution score of every base against the reference
+    ref_codes = np.frombuffer(reference.encode(), dtype=np.uint8)
+    sub_table = np.where(np.arange(256)[:, None] == ref_codes[None, :], match_score, mismatch_score).astype(dtype)
+    positions = np.arange(ref_len + 1)
+    extend_cost = (positions * extend_gap_score).astype(dtype)
+
+    # Rows of all trie nodes - the root (empty read prefix) first, then the nodes of each depth together
+    new_node = (np.arange(1, max_len + 1)[None, :] <= reads_len[:, None]) & \
+        (np.arange(1, max_len + 1)[None, :] > prefix_len[:, None])
+    depth_nodes_n = new_node.sum(axis=0)
+    depth_start = np.concatenate([[1], 1 + np.cumsum(depth_nodes_n)])
+    match_m = np.full((int(depth_start[-1]), ref_len + 1), -np.inf, dtype=dtype)
+    del_m = np.full(match_m.shape, -np.inf, dtype=dtype)
+    ins_m = np.full(match_m.shape, -np.inf, dtype=dtype)
+    match_m[0, 0] = 0
+    del_m[0, 1:] = open_gap_score + (positions[1:] - 1) * extend_gap_score
+    open_gap_score, extend_gap_score = dtype(open_gap_score), dtype(extend_gap_score)
+    # Node of every read in each depth
+    read_nodes = np.zeros((len(group_reads), max_len + 1), dtype=np.int64)
+
+    for depth in range(1, max_len + 1):
+        nodes = slice(depth_start[depth - 1], depth_start[depth])
+        node_reads = np.flatnonzero(new_node[:, depth - 1])
+        read_nodes[:, depth] = depth_start[depth - 1] + np.cumsum(new_node[:, depth - 1]) - 1
+        parents = read_nodes[node_reads, depth - 1]
+        prev_m, prev_d, prev_i = match_m[parents], del_m[parents], ins_m[parents]
+
+        # Match - from (read - 1, reference - 1)
+        match_m[nodes, 1:] = np.maximum(np.maximum(prev_m, prev_d), prev_i)[:, :-1] + \
+            sub_table[read_codes[node_reads, depth - 1]]
+        # Insertion - from (read - 1, reference)
+        ins_m[nodes] = np.maximum(np.maximum(prev_m, prev_d) + open_gap_score, prev_i + extend_gap_score)
+        # Deletion - from (read, reference - 1)
+        best_open = np.maximum.accumulate(np.maximum(match_m[nodes], ins_m[nodes]) - extend_cost, axis=1)
+        del_m[nodes, 1:] = best_open[:, :-1] + (open_gap_score - extend_gap_score) + extend_cost[1:]
+
+    for read_idx, idx in enumerate(group):
+        read_len = int(reads_len[read_idx])
+        results[idx] = _traceback(match_m, del_m, ins_m, read_nodes[read_idx, :read_len + 1], ref_len, read_len,
+                                  open_gap_score, extend_gap_score)
+
+
+def _traceback(match_m: np.ndarray, del_m: np.ndarray, ins_m: np.ndarray, path_nodes: np.ndarray, ref_len: int,
+               read_len: int, open_gap_score: float, extend_gap_score: float) -> Tuple[AlignmentPath, float]:
+    """
+    Traceback a single read, one alignment block at a time (see banded_alignment._traceback).
+    Score matrices are [trie node, reference position], and path_nodes is the node of every read prefix.
+    :return: alignment path and alignment score
+    """
+    node = path_nodes[read_len]
+    final = [match_m[node, ref_len], del_m[node, ref_len], ins_m[node, ref_len]]
+    score = max(final)
+    state = final.index(score)
+    ref_idx, read_idx = ref_len, read_len
+    path = [(ref_idx, read_idx)]
+
+    while (ref_idx > 0) or (read_idx > 0):
+        if state == _STATE_M:
+            # Aligned block - the previous state is the best state of (i-1, j-1), match first
+            offsets = np.arange(1, min(ref_idx, read_idx) + 1)
+            nodes, cols = path_nodes[read_idx - offsets], ref_idx - offsets
+            prev_m, prev_d, prev_i = match_m[nodes, cols], del_m[nodes, cols], ins_m[nodes, cols]
+            stop = np.flatnonzero((prev_m < prev_d) | (prev_m < prev_i))
+            steps = int(stop[0]) + 1 if len(stop) > 0 else len(offsets)
+            if len(stop) > 0:
+                state = _STATE_D if prev_d[steps - 1] >= prev_i[steps - 1] else _STATE_I
+            ref_idx -= steps
+            read_idx -= steps
+        elif state == _STATE_D:
+            # Deletion - the previous state is the first of match (open), deletion (extend) and insertion (open)
+            # which gives the deletion score
+            node = path_nodes[read_idx]
+            cols = np.arange(ref_idx - 1, -1, -1)
+            score_d = del_m[node, cols + 1]
+            open_m = match_m[node, cols] + open_gap_score >= score_d
+            stop = np.flatnonzero(open_m | (del_m[node, cols] + extend_gap_score < score_d))
+            steps = int(stop[0]) + 1
+            state = _STATE_M if open_m[steps - 1] else _STATE_I
+            ref_idx -= steps
+        else:
+            # Insertion - the previous state is the first of match (open), deletion (open) and insertion (extend)
+            nodes = path_nodes[read_idx - 1::-1]
+            stop = np.flatnonzero(np.maximum(match_m[nodes, ref_idx], del_m[nodes, ref_idx]) + open_gap_score >=
+                                  ins_m[path_nodes[read_idx:0:-1], ref_idx])
+            steps = int(stop[0]) + 1
+            node = nodes[steps - 1]
+            state = _STATE_M if match_m[node, ref_idx] >= del_m[node, ref_idx] else _STATE_D
+            read_idx -= steps
+        path.append((ref_idx, read_idx))
+
+    return tuple(path[::-1]), float(score)
@@ -1,12 +1,29 @@
 from crispector.utils.constants_and_types import COMPLEMENT, IndelType, Path, DNASeq, CIGAR_D, CIGAR_I, CIGAR_S, CIGAR_M, \
-    AmpliconDf, SITE_NAME, REFERENCE, SGRNA, ON_TARGET, F_PRIMER, R_PRIMER, TX_IN1, TX_IN2, MOCK_IN1, MOCK_IN2, DONOR
-from typing import List, Tuple
+    AmpliconDf, SITE_NAME, REFERENCE, SGRNA, ON_TARGET, F_PRIMER, R_PRIMER, TX_IN1, TX_IN2, MOCK_IN1, MOCK_IN2, DONOR, \
+    ReadsDf, READ, FREQ, FASTQ_CHUNK_SIZE, CompressionType, GZIP_MAGIC, ZSTD_MAGIC, GZIP_HEADER_LEN, GZIP_FEXTRA, \
+    BGZF_PENDING_BLOCKS_PER_THREAD, IO_BUFFER_SIZE, MMAP_CHUNK_SIZE, CigarPath, CIGAR_OP_SHIFT, CIGAR_OP_MASK, \
+    CIGAR_OP_I, CIGAR_OP_D, CIGAR_OP_M, CIGAR_OP_S
+from typing import List, Tuple, Iterator
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
 import re
 from crispector.utils.exceptions import CantOpenMergedFastqFile, BadInputError, BadReferenceAmpliconChar, BadSgRNAChar
 import pandas as pd
 import os
 import binascii
 import gzip
+import io
+import mmap
+import shutil
+import struct
+import subprocess
+import zlib
+
+_DNA_LINE_RE = re.compile(r"[ACGT]+\Z")
+_CIGAR_OP_CHAR = {CIGAR_OP_I: CIGAR_I, CIGAR_OP_D: CIGAR_D, CIGAR_OP_M: CIGAR_M, CIGAR_OP_S: CIGAR_S}
+_CIGAR_OP_INDEL_TYPE = {op: IndelType.from_cigar(op_char) for op, op_char in _CIGAR_OP_CHAR.items()}
 
 
 def is_gz_file(filepath):
@@ -14,57 +31,372 @@ def is_gz_file(filepath):
         return binascii.hexlify(test_f.read(2)) == b'1f8b'
 
 
-def read_DNA_lines(fastq_file) -> List[DNASeq]:
-    sequences = []
-    line = fastq_file.readline()
+######### Compressed input ###########
+def get_compression_type(filepath: Path) -> CompressionType:
+    """
+    Detect fastq compression type from the file magic bytes.
+    :param filepath: fastq file path
+    :return: CompressionType
+    """
+    with open(filepath, 'rb') as test_f:
+        header = test_f.read(GZIP_HEADER_LEN)
+
+    if header.startswith(ZSTD_MAGIC):
+        return CompressionType.ZSTD
+    if not header.startswith(GZIP_MAGIC):
+        return CompressionType.NONE
+    if _get_bgzf_block_size(header) is not None:
+        return CompressionType.BGZF
+    return CompressionType.GZIP
+
+
+def _get_bgzf_block_size(header: bytes):
+    """
+    Return the BGZF block size (BSIZE + 1) from a gzip member header, or None if it isn't a BGZF header.
+    :param header: gzip member header bytes
+    :return: block size or None
+    """
+    if len(header) < GZIP_HEADER_LEN or not (header[3] & GZIP_FEXTRA):
+        return None
+    xlen = struct.unpack("<H", header[10:12])[0]
+    extra = header[12:12 + xlen]
+    idx = 0
+    # Search for BGZF "BC" subfield
+    while idx + 4 <= len(extra):
+        si1, si2, slen = extra[idx], extra[idx + 1], struct.unpack("<H", extra[idx + 2:idx + 4])[0]
+        if (si1, si2, slen) == (66, 67, 2):
+            return struct.unpack("<H", extra[idx + 4:idx + 6])[0] + 1
+        idx += 4 + slen
+    return None
+
+
+def _read_bgzf_blocks(bgzf_file) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Generator function for raw BGZF blocks.
+    Yield each iteration the block deflate payload, CRC32 and uncompressed size
+    :param bgzf_file: binary file handle
+    :return: Yield each iteration the block deflate payload, CRC32 and uncompressed size
+    """
+    while True:
+        header = bgzf_file.read(GZIP_HEADER_LEN)
+        if not header:
+            return
+        block_size = _get_bgzf_block_size(header)
+        if block_size is None:
+            raise IOError("Corrupted BGZF block")
+        xlen = struct.unpack("<H", header[10:12])[0]
+        block = header + bgzf_file.read(block_size - GZIP_HEADER_LEN)
+        if len(block) != block_size:
+            raise IOError("Truncated BGZF block")
+        crc, size = struct.unpack("<II", block[-8:])
+        yield block[12 + xlen:-8], crc, size
+
+
+def _inflate_bgzf_block(block: Tuple[bytes, int, int]) -> bytes:
+    data, crc, size = block
+    data = zlib.decompress(data, -zlib.MAX_WBITS)
+    if (len(data) != size) or (zlib.crc32(data) != crc):
+        raise IOError("BGZF block failed CRC check")
+    return data
+
+
+def _bgzf_parallel_chunks(file_name: Path, threads: int) -> Iterator[bytes]:
+    """
+    Decompress BGZF blocks with a thread pool (zlib releases the GIL) and yield them in file order.
+    :param file_name: BGZF file path
+    :param threads: number of decompression threads
+    :return: Yield each iteration decompressed bytes
+    """
+    max_pending = BGZF_PENDING_BLOCKS_PER_THREAD * threads
+    with open(file_name, 'rb') as bgzf_file, ThreadPoolExecutor(max_workers=threads) as pool:
+        pending = deque()
+        for block in _read_bgzf_blocks(bgzf_file):
+            pending.append(pool.submit(_inflate_bgzf_block, block))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _ChunksRawIO(io.RawIOBase):
+    """
+    Read only raw stream over an iterator of bytes chunks.
+    """
+    def __init__(self, chunks: Iterator[bytes]):
+        self._chunks = chunks
+        self._buf = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return 0
+            self._buf = memoryview(chunk)
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+
+@contextmanager
+def _open_bgzf_parallel(file_name: Path, threads: int):
+    if threads < 2:
+        with gzip.open(file_name, 'rt') as fastq_file:
+            yield fastq_file
+        return
+    raw = _ChunksRawIO(_bgzf_parallel_chunks(file_name, threads))
+    with io.TextIOWrapper(io.BufferedReader(raw, buffer_size=IO_BUFFER_SIZE)) as fastq_file:
+        yield fastq_file
+
+
+@contextmanager
+def _open_pipe(command: List[str]):
+    """
+    Stream the stdout of an external decompression tool as a text file.
+    :param command: command line
+    :return: text file handle
+    """
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                               bufsize=IO_BUFFER_SIZE)
+    try:
+        yield io.TextIOWrapper(process.stdout)
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    process.stdout.close()
+    if process.wait() != 0:
+        raise IOError("{} failed with exit code {}".format(command[0], process.returncode))
+
+
+@contextmanager
+def _open_gzip(file_name: Path, threads: int):
+    pigz = shutil.which("pigz")
+    if pigz is not None:
+        with _open_pipe([pigz, "-dc", "-p", str(threads), file_name]) as fastq_file:
+            yield fastq_file
+    else:
+        with gzip.open(file_name, 'rt') as fastq_file:
+            yield fastq_file
+
+
+@contextmanager
+def _open_zstd(file_name: Path, threads: int):
+    zstd_bin = shutil.which("zstd")
+    if zstd_bin is not None:
+        with _open_pipe([zstd_bin, "-dcq", "-T{}".format(threads), file_name]) as fastq_file:
+            yield fastq_file
+        return
+
+    try:
+        import zstandard
+    except ImportError:
+        raise BadInputError("{} is zstd compressed. Install zstd or the zstandard python package.".format(file_name))
+    with open(file_name, 'rb') as zstd_file:
+        reader = zstandard.ZstdDecompressor().stream_reader(zstd_file, read_size=IO_BUFFER_SIZE)
+        with io.TextIOWrapper(io.BufferedReader(reader, buffer_size=IO_BUFFER_SIZE)) as fastq_file:
+            yield fastq_file
+
+
+@contextmanager
+def _open_plain(file_name: Path, threads: int):
+    with open(file_name) as fastq_file:
+        yield fastq_file
 
-    while line:
-        line = fastq_file.readline()
-        if re.match("[ACGT]+\Z", line[:-1]):
-            sequences.append(line[:-1])
-    return sequences
+
+# Fastq openers - Key is CompressionType and value is a context manager (file_name, threads) -> text file handle.
+# Each opener prefers an external/parallel decompression and falls back to a pure python reader.
+FASTQ_OPENERS = {CompressionType.NONE: _open_plain,
+                 CompressionType.GZIP: _open_gzip,
+                 CompressionType.BGZF: _open_bgzf_parallel,
+                 CompressionType.ZSTD: _open_zstd}
+
+
+def open_fastq_file(file_name: Path, threads: int = None):
+    """
+    Open a plain, gzip, BGZF or zstd compressed fastq file for reading as text.
+    :param file_name: fastq file name
+    :param threads: number of decompression threads. Default is the number of CPUs.
+    :return: context manager of a text file handle
+    """
+    if threads is None:
+        threads = os.cpu_count() or 1
+    return FASTQ_OPENERS[get_compression_type(file_name)](file_name, threads)
+
+
+def read_DNA_lines(fastq_file, chunk_size: int = FASTQ_CHUNK_SIZE) -> Iterator[List[DNASeq]]:
+    """
+    Generator function for fastq sequence lines.
+    Yield each iteration a chunk of up to chunk_size DNA sequences (reads with non ACGT bases are skipped).
+    :param fastq_file: fastq file handle (text mode)
+    :param chunk_size: max number of sequences in each chunk
+    :return: Yield each iteration a list of DNA strings
+    """
+    is_dna = _DNA_LINE_RE.match
+    chunk = []
+    # Sequence is the second line of every 4 lines fastq record
+    for line in islice(fastq_file, 1, None, 4):
+        line = line.rstrip("\n")
+        if is_dna(line):
+            chunk.append(line)
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def count_DNA_lines_mmap(file_name: Path, chunk_size: int = MMAP_CHUNK_SIZE) -> Counter:
+    """
+    Count the sequence lines of an uncompressed fastq file.
+    The file is memory-mapped and scanned chunk by chunk with bytes operations. Sequences are counted as bytes and
+    only the unique ones are validated (ACGT only) and decoded to str.
+    :param file_name: uncompressed fastq file name
+    :param chunk_size: approximate number of bytes scanned in each chunk
+    :return: Counter with key=DNA sequence and value=frequency
+    """
+    byte_counter = Counter()
+    with open(file_name, 'rb') as fastq_file:
+        size = os.fstat(fastq_file.fileno()).st_size
+        if size == 0:
+            return Counter()
+        with mmap.mmap(fastq_file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            start = 0
+            line_idx = 0  # Number of lines scanned so far
+            while start < size:
+                # Chunk ends at a line boundary
+                end = min(start + chunk_size, size)
+                if end < size:
+                    new_line_idx = mm.rfind(b"\n", start, end)
+                    if new_line_idx == -1:
+                        new_line_idx = mm.find(b"\n", end)
+                    end = size if new_line_idx == -1 else new_line_idx + 1
+
+                lines = mm[start:end].split(b"\n")
+                if lines[-1] == b"":
+                    lines.pop()
+                # Sequence is the second line of every 4 lines fastq record
+                byte_counter.update(lines[(1 - line_idx) % 4::4])
+                line_idx += len(lines)
+                start = end
+
+    read_counter = Counter()
+    for seq, freq in byte_counter.items():
+        # CRLF line ends (same as universal newlines of a text mode reader)
+        if seq.endswith(b"\r"):
+            seq = seq[:-1]
+        if seq and not seq.translate(None, b"ACGT"):
+            read_counter[seq.decode("ascii")] += freq
+    return read_counter
 
 
 def reverse_complement(seq: DNASeq) -> DNASeq:
     return "".join(COMPLEMENT.get(base, base) for base in reversed(seq))
 
 
-def parse_fastq_file(file_name: Path) -> List[DNASeq]:
+def count_DNA_lines(fastq_file) -> Counter:
     """
-    process fastq_file to a list of DNA strings
-    :param file_name: fastq file name
-    :return: list of DNA strings
+    Count the sequence lines of an open fastq stream (text mode).
+    :param fastq_file: fastq file handle
+    :return: Counter with key=DNA sequence and value=frequency
+    """
+    read_counter = Counter()
+    for chunk in read_DNA_lines(fastq_file):
+        read_counter.update(chunk)
+    return read_counter
+
+
+def read_counter_to_reads_df(read_counter: Counter) -> ReadsDf:
+    """
+    Convert unique reads counter to ReadsDf (same layout as groupby(READ).size())
+    :param read_counter: Counter with key=DNA sequence and value=frequency
+    :return: ReadsDf with READ & FREQ columns, sorted by READ
     """
+    reads_df = pd.DataFrame(data=sorted(read_counter.items()), columns=[READ, FREQ])
+    reads_df[FREQ] = reads_df[FREQ].astype(int)
+    return reads_df
 
+
+def parse_fastq_stream(fastq_file) -> ReadsDf:
+    """
+    process an open fastq stream (e.g. a pipe) to a ReadsDf of unique reads and their frequency.
+    :param fastq_file: fastq file handle (text mode)
+    :return: ReadsDf with READ & FREQ columns, sorted by READ
+    """
+    return read_counter_to_reads_df(count_DNA_lines(fastq_file))
+
+
+def parse_fastq_file(file_name: Path, threads: int = None) -> ReadsDf:
+    """
+    process fastq_file to a ReadsDf of unique reads and their frequency.
+    Reads are counted while the file is streamed, so memory is proportional to the number of unique reads.
+    :param file_name: fastq file name (plain, gzip, BGZF or zstd)
+    :param threads: number of decompression threads. Default is the number of CPUs.
+    :return: ReadsDf with READ & FREQ columns, sorted by READ
+    """
     try:
-        if is_gz_file(file_name):
-            fastq_file = gzip.open(file_name, 'rt')
-            return read_DNA_lines(fastq_file)
+        if get_compression_type(file_name) == CompressionType.NONE:
+            read_counter = count_DNA_lines_mmap(file_name)
         else:
-            with open(file_name) as fastq_file:
-                return read_DNA_lines(fastq_file)
-    except IOError:
+            with open_fastq_file(file_name, threads) as fastq_file:
+                read_counter = count_DNA_lines(fastq_file)
+    except (IOError, EOFError, zlib.error):
         raise CantOpenMergedFastqFile(file_name)
 
+    return read_counter_to_reads_df(read_counter)
+
+
+def pack_cigar(ops: List[int]) -> CigarPath:
+    """
+    Pack cigar operations to a binary cigar path.
+    :param ops: cigar operations - (length << CIGAR_OP_SHIFT) | op code
+    :return: binary cigar path
+    """
+    return struct.pack("<{}I".format(len(ops)), *ops)
+
+
+def unpack_cigar(cigar: CigarPath) -> Tuple[int, ...]:
+    """
+    Unpack binary cigar path to cigar operations - (length << CIGAR_OP_SHIFT) | op code.
+    :param cigar: binary cigar path
+    :return: cigar operations
+    """
+    return struct.unpack("<{}I".format(len(cigar) // 4), cigar)
+
+
+def cigar_to_str(cigar: CigarPath) -> str:
+    """
+    Render binary cigar path as cigar string (e.g. "45=2D30=").
+    :param cigar: binary cigar path
+    :return: cigar string
+    """
+    if cigar is None:
+        return None
+    return "".join(["{}{}".format(op >> CIGAR_OP_SHIFT, _CIGAR_OP_CHAR[op & CIGAR_OP_MASK])
+                    for op in unpack_cigar(cigar)])
+
 
-def parse_cigar(cigar: str) -> Tuple[int, IndelType]:
+def parse_cigar(cigar: CigarPath) -> Tuple[int, IndelType]:
     """
     Generator function for cigar path.
     Yield each iteration the length of the of the indel and indel type
-    :param cigar:
+    :param cigar: binary cigar path
     :return: Yield each iteration the length of the of the indel and indel type
     """
-    for length, indel in re.findall(r'(\d+)([{}{}{}{}])'.format(CIGAR_D, CIGAR_I, CIGAR_S, CIGAR_M), cigar):
-        length = int(length)
-        indel = IndelType.from_cigar(indel)
-        yield length, indel
+    for op in unpack_cigar(cigar):
+        yield op >> CIGAR_OP_SHIFT, _CIGAR_OP_INDEL_TYPE[op & CIGAR_OP_MASK]
 
 
-def parse_cigar_with_mixed_indels(cigar: str) -> List[Tuple[int, int, IndelType, List[Tuple[int, IndelType]]]]:
+def parse_cigar_with_mixed_indels(cigar: CigarPath) -> List[Tuple[int, int, IndelType, List[Tuple[int, IndelType]]]]:
     """
     Function returns a list of Tuple[indel length, indel length without insertion, IndelType, Mixed_list] where
     adjacent indels are aggregated into indel_type = Mixed.
-    :param cigar:
+    :param cigar: binary cigar path
     :return: list of Tuple[indel length, indel length without insertion, IndelType, Mixed list]
     """
     indel_list = []
@@ -73,10 +405,8 @@ def parse_cigar_with_mixed_indels(cigar: str) -> List[Tuple[int, int, IndelType,
     prev_length_wo_ins = 0  # used to understand with positions are relevant for this modification
     mixed_list = []  # List of all indels comprising current mixed
     mixed_count = 0  # Current mixed indel count of comprising modifications
-    for length, indel in re.findall(r'(\d+)([{}{}{}{}])'.format(CIGAR_D, CIGAR_I, CIGAR_S, CIGAR_M), cigar):
-        indel = IndelType.from_cigar(indel)
-        length = int(length)
-        length_wo_ins = int(length) if indel != IndelType.INS else 0
+    for length, indel in parse_cigar(cigar):
+        length_wo_ins = length if indel != IndelType.INS else 0
         mixed_list.append((length, indel))
         if (indel != IndelType.MATCH) and (prev_indel != IndelType.MATCH):
             mixed_count += 1
@@ -1,25 +1,40 @@
-from crispector.input_processing.utils import parse_cigar_with_mixed_indels
 from crispector.utils.constants_and_types import ReadsDf, DNASeq, IndelType, ExpType, ModTables, ModTablesP, IsEdit, CIGAR, FREQ, \
     C_TX, C_MOCK, REFERENCE, CS_SHIFT_R, CS_SHIFT_L, ModDist, MOD_TABLE_IDX, INDEL_TYPE, INDEL_LEN, IS_EDIT, \
-    POS_IDX_S, POS_IDX_E
+    POS_IDX_S, POS_IDX_E, IndelEventsDf, CUT_SITE, CigarPath, CIGAR_OP_SHIFT, CIGAR_OP_MASK, CIGAR_OP_I, CIGAR_OP_D, \
+    CIGAR_OP_M, CIGAR_OP_S, CIGAR_DTYPE
 from crispector.modifications.modification_types import ModificationTypes
+from crispector.utils.configurator import Configurator
+from typing import List, Tuple
+from scipy.sparse import csr_matrix
 import numpy as np
-from collections import defaultdict
 import pandas as pd
 from copy import deepcopy
 
+# IndelType value of each cigar op code, and IndelType of each IndelType value
+_CIGAR_OP_INDEL_VALUE = np.full(CIGAR_OP_MASK + 1, IndelType.MATCH.value)
+_CIGAR_OP_INDEL_VALUE[[CIGAR_OP_D, CIGAR_OP_I, CIGAR_OP_S]] = [IndelType.DEL.value, IndelType.INS.value,
+                                                                IndelType.SUB.value]
+_INDEL_TYPES = np.array([IndelType(value) for value in range(IndelType.SUB.value + 1)], dtype=object)
+
 
 class ModificationTables:
     """
     A container class for all modification (Indel) tables.
     """
-    def __init__(self, tx_reads: ReadsDf, mock_reads: ReadsDf, modifications: ModificationTypes, ref_df_row: pd.Series):
+    def __init__(self, tx_reads: ReadsDf, mock_reads: ReadsDf, modifications: ModificationTypes, ref_df_row: pd.Series,
+                 tx_indel_events: IndelEventsDf = None, mock_indel_events: IndelEventsDf = None):
         self._tx_reads = tx_reads
         self._mock_reads = mock_reads
+        self._tx_indel_events = tx_indel_events  # Indel events in the qualification window (see Alignment.align_reads)
+        self._mock_indel_events = mock_indel_events
         self._modifications = modifications
         self._amplicon = ref_df_row[REFERENCE]
         self._tables: ModTables = dict()
         self._pointers: ModTablesP = dict()
+        # Pointers cover only the qualification window - 2*window_size + 1 positions from cut-site - window_size
+        window_size = Configurator.get_cfg()["NHEJ_inference"]["window_size"]
+        self._pointers_offset = ref_df_row[CUT_SITE] - window_size
+        self._pointers_size = 2 * window_size + 1
         self._tx_dist: ModDist = pd.DataFrame() # Tx modification distribution - for visualization only
         self._mock_dist: ModDist = pd.DataFrame()  # Mock modification distribution - for visualization only
         self._create_modification_tables_and_distribution()
@@ -40,6 +55,14 @@ class ModificationTables:
     def mock_reads(self) -> ReadsDf:
         return self._mock_reads
 
+    @property
+    def tx_indel_events(self) -> IndelEventsDf:
+        return self._tx_indel_events
+
+    @property
+    def mock_indel_events(self) -> IndelEventsDf:
+        return self._mock_indel_events
+
     @property
     def tx_dist(self) -> ReadsDf:
         return self._tx_dist
@@ -74,12 +97,11 @@ class ModificationTables:
         Also - function creates modification distribution data.
         :return: mock table list and mock pointers
         """
-        # Create table and pointers
+        # Create tables
         for idx, indel_type in enumerate(self._modifications.types):
             # Insertions are between positions (so they have an extra item)
             table_size = len(self._amplicon) + 1 if indel_type == IndelType.INS else len(self._amplicon)
             self._tables[idx] = np.zeros((2, table_size), dtype=np.int)
-            self._pointers[idx] = defaultdict(list)
 
         # Fill the tables
         self._tx_dist = self._convert_read_df_to_modifications(self._tx_reads, ExpType.TX)
@@ -88,55 +110,55 @@ class ModificationTables:
     def _convert_read_df_to_modifications(self, read: ReadsDf, exp_type: ExpType) -> ModDist:
         """
         Fill (inplace!) the modification tables from all reads.
-        For treatment - fill inplace pointers as well.
+        For treatment - fill inplace pointers of the qualification window as well.
         For modification distribution - return the modification distribution
-        This function could be split to two different function. The only reason to combine the logic is to reduce
-        running time. runtime is O(num_of_reads*num_of_modification)
+        All reads are processed together - the modifications of all reads are exploded to flat arrays (see
+        _explode_modifications), and tables, pointers and distribution are filled from the covered positions of all
+        modifications at once.
         :param read: ReadsDf
         :param exp_type: ExpType
         :return: ModDist
         """
         table_row = C_TX if exp_type == ExpType.TX else C_MOCK
-        dist_d = defaultdict(list)
-
-        for row_idx, row in read.iterrows():
-            pos_idx = 0  # position index
-            for length, length_wo_ins, indel_type, mixed_l in parse_cigar_with_mixed_indels(row[CIGAR]):
-                table_idx = self._modifications.find_index(indel_type, length)
-                # For a match - continue
-                if indel_type == IndelType.MATCH:
-                    pos_idx += length_wo_ins
-                    continue
-                # For a mismatch or deletions - update multi indexes according to length
-                elif indel_type in [IndelType.DEL, IndelType.SUB, IndelType.MIXED]:
-                    self._tables[table_idx][table_row, pos_idx:pos_idx+length_wo_ins] += row[FREQ]
-                    # Update multiple keys
-                    if exp_type == ExpType.TX:
-                        for pointer_idx in range(pos_idx, pos_idx+length_wo_ins):
-                            self._pointers[table_idx][pointer_idx].append(row_idx)
-                # For an insertion update single index and don't increase pos_idx
-                elif indel_type == IndelType.INS:
-                    self._tables[table_idx][table_row, pos_idx] += row[FREQ]
-                    if exp_type == ExpType.TX:
-                        self._pointers[table_idx][pos_idx].append(row_idx)
-
-                # Add modification to distribution
-                indel_l = [(length, indel_type)] if indel_type != IndelType.MIXED else mixed_l
-                for dist_length, dist_indel_type in indel_l:
-                    dist_d[MOD_TABLE_IDX].append(table_idx)
-                    dist_d[INDEL_TYPE].append(dist_indel_type)
-                    dist_d[INDEL_LEN].append(dist_length)
-                    dist_d[FREQ].append(row[FREQ])
-                    dist_d[IS_EDIT].append(False)
-                    dist_d[POS_IDX_S].append(pos_idx)
-                    end_idx = pos_idx + length_wo_ins if indel_type != IndelType.INS else pos_idx + 1
-                    dist_d[POS_IDX_E].append(end_idx)
-
-                # Increase index
-                pos_idx += length_wo_ins
-
-        # Convert dict to DataFrame
-        dist_df = pd.DataFrame.from_dict(dist_d, orient='columns')
+        op_mod, op_len, op_type, mod_row, mod_len, mod_type, mod_pos, mod_span = \
+            _explode_modifications(list(read[CIGAR]))
+        mod_table_idx = self._modifications.find_indexes(mod_type, mod_len)
+        mod_freq = read[FREQ].values[mod_row]
+
+        # Positions covered by each modification - deletions, substitutions and mixed cover all their reference
+        # positions, and insertions cover a single position (insertions are between positions)
+        cell_mod = np.repeat(np.arange(len(mod_row)), mod_span)
+        cell_pos = mod_pos[cell_mod] + np.arange(len(cell_mod)) - (np.cumsum(mod_span) - mod_span)[cell_mod]
+        cell_table_idx = mod_table_idx[cell_mod]
+
+        # Fill the tables
+        tables_size = len(self._amplicon) + 1
+        counts = np.bincount(cell_table_idx * tables_size + cell_pos, weights=mod_freq[cell_mod],
+                             minlength=self._modifications.size * tables_size)
+        counts = counts.astype(np.int64).reshape(self._modifications.size, tables_size)
+        for table_idx, table in self._tables.items():
+            table[table_row] += counts[table_idx, :table.shape[1]]
+
+        # Fill the pointers - reads of each position in the qualification window (see ModTableP)
+        if exp_type == ExpType.TX:
+            window_pos = cell_pos - self._pointers_offset
+            in_window = (window_pos >= 0) & (window_pos < self._pointers_size)
+            for table_idx in self._tables:
+                cells = np.flatnonzero(in_window & (cell_table_idx == table_idx))
+                self._pointers[table_idx] = csr_matrix((np.ones(len(cells), dtype=bool),
+                                                        (window_pos[cells], mod_row[cell_mod[cells]])),
+                                                       shape=(self._pointers_size, read.shape[0]))
+
+        # Modification distribution - a row for every indel (mixed modifications have a row for each of their
+        # indels)
+        dist_df = pd.DataFrame({MOD_TABLE_IDX: mod_table_idx[op_mod],
+                                INDEL_TYPE: _INDEL_TYPES[op_type],
+                                INDEL_LEN: op_len,
+                                FREQ: mod_freq[op_mod],
+                                IS_EDIT: np.zeros(len(op_mod), dtype=bool),
+                                POS_IDX_S: mod_pos[op_mod],
+                                POS_IDX_E: mod_pos[op_mod] + mod_span[op_mod]},
+                               columns=[MOD_TABLE_IDX, INDEL_TYPE, INDEL_LEN, FREQ, IS_EDIT, POS_IDX_S, POS_IDX_E])
         return dist_df
 
     def set_tx_dist_is_edit_col(self, edit: IsEdit, table_offset: int, window_size: int):
@@ -155,3 +177,43 @@ class ModificationTables:
             mod_range = range(mod_s - table_offset, mod_e - table_offset)
             if edit[row[MOD_TABLE_IDX]][mod_range].any():
                 self._tx_dist.at[row_idx, IS_EDIT] = True
+
+
+def _explode_modifications(cigars: List[CigarPath]) -> Tuple[np.ndarray, ...]:
+    """
+    Vectorized parse_cigar_with_mixed_indels of all cigar paths. Every run of adjacent indels is a single
+    modification - a mixed modification if the run has more than one indel.
+    :param cigars: binary cigar paths
+    :return: indels arrays - modification index, length & IndelType value of every indel. And modifications arrays -
+    cigar index, length, IndelType value, reference position & number of covered reference positions of every
+    modification.
+    """
+    ops_n = np.array([len(cigar) // 4 for cigar in cigars], dtype=np.int64)
+    ops = np.frombuffer(b"".join(cigars), dtype=CIGAR_DTYPE)
+    op_row = np.repeat(np.arange(len(cigars)), ops_n)
+    lengths = (ops >> CIGAR_OP_SHIFT).astype(np.int64)
+    codes = (ops & CIGAR_OP_MASK).astype(np.int64)
+    is_ins = codes == CIGAR_OP_I
+
+    # Operation start in reference coordinates (exclusive cumsum of each cigar)
+    first_op = np.cumsum(ops_n) - ops_n
+    ref_lengths = np.where(is_ins, 0, lengths)
+    pos_idx = np.cumsum(ref_lengths) - ref_lengths
+    pos_idx -= pos_idx[first_op][op_row]
+
+    # A modification starts on an indel which is the first operation of its cigar or follows a match
+    is_indel = codes != CIGAR_OP_M
+    follows_indel = np.append(False, is_indel[:-1])
+    follows_indel[first_op[ops_n > 0]] = False
+    indel_ops = np.flatnonzero(is_indel)
+    mod_first = np.flatnonzero(~follows_indel[indel_ops])  # first indel of each modification
+    op_mod = np.cumsum(~follows_indel[indel_ops]) - 1
+    mod_ops = indel_ops[mod_first]
+    mods_n = len(mod_ops)
+
+    op_len, op_type = lengths[indel_ops], _CIGAR_OP_INDEL_VALUE[codes[indel_ops]]
+    mod_len = np.bincount(op_mod, weights=op_len, minlength=mods_n).astype(np.int64)
+    mod_len_wo_ins = np.bincount(op_mod, weights=ref_lengths[indel_ops], minlength=mods_n).astype(np.int64)
+    mod_type = np.where(np.bincount(op_mod, minlength=mods_n) > 1, IndelType.MIXED.value, op_type[mod_first])
+    mod_span = np.where(mod_type == IndelType.INS.value, 1, mod_len_wo_ins)
+    return op_mod, op_len, op_type, op_row[mod_ops], mod_len, mod_type, pos_idx[mod_ops], mod_span
@@ -2,6 +2,7 @@ from crispector.utils.exceptions import PriorPositionHasWrongLength
 from crispector.utils.constants_and_types import IndelType
 from typing import List
 from collections import defaultdict
+import numpy as np
 from crispector.utils.configurator import Configurator
 
 
@@ -62,6 +63,23 @@ class ModificationTypes:
                 break
         return index
 
+    def find_indexes(self, indel_types: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+        """
+        Vectorized find_index - return the modification type index of each modification
+        :param indel_types: IndelType values
+        :param lengths: modification lengths
+        :return: modification type indexes
+        """
+        indexes = np.zeros(len(lengths), dtype=np.int64)
+        # The first matching range of each type wins
+        for idx in reversed(range(self.size)):
+            indel_range = self._range[idx]
+            in_range = (indel_types == self._type[idx].value) & (lengths >= indel_range.start) & \
+                (lengths < indel_range.stop)
+            indexes[in_range] = idx
+        indexes[indel_types == IndelType.MATCH.value] = -1
+        return indexes
+
     @classmethod
     def init_from_cfg(cls, enable_substitutions: bool):
         """
@@ -8,12 +8,14 @@ from crispector.utils.constants_and_types import SITE_NAME, IndelType, Path, FRE
     TRANS_RES_TAB, TRANS_HEATMAP_TAB, TRANS_RESULTS_TITLES, EDIT_SECTION, MOD_SECTION, CLS_RES_SECTION, CLS_RES_INS, \
     CLS_RES_DEL, CLS_RES_MIX, MOD_DIST, EDIT_DIST, EDIT_SIZE_DIST, READ_SECTION, READ_EDIT, READ_MOCK_ALL, READ_TX_ALL, \
     FILTERED_PATH, READ_TX_FILTER, READ_MOCK_FILTER, HTML_SITES, HTML_SITES_NAME_LIST, REPORT_PATH, LOGO_PATH, \
-    EDIT_TEXT, UNBALANCED_READ_WARNING, UNMATCHED_PATH, UNMATCHED_TX_PATH, UNMATCHED_MOCK_PATH
+    EDIT_TEXT, UNBALANCED_READ_WARNING, UNMATCHED_PATH, UNMATCHED_TX_PATH, UNMATCHED_MOCK_PATH, CIGAR, IndelEventsDf
 import math
 import os
 import warnings
 from typing import List, Tuple, Dict
 from crispector.input_processing.input_processing import InputProcessing
+from crispector.input_processing.utils import cigar_to_str
+from crispector.input_processing.indel_events import indel_events_to_columns
 from crispector.modifications.modification_types import ModificationTypes
 from crispector.algorithm.core_algorithm import CoreAlgorithm
 from crispector.modifications.modification_tables import ModificationTables
@@ -72,8 +74,10 @@ def create_site_output(algorithm: CoreAlgorithm, modifications: ModificationType
     plot_edited_reads_to_table(mod_table, cut_site, output, html_d, base_path)
 
     # Dump .csv file with all reads
-    mod_table.tx_reads.to_csv(os.path.join(output, "treatment_aligned_reads.csv.gz"), index=False, compression='gzip')
-    mod_table.mock_reads.to_csv(os.path.join(output, "mock_aligned_reads.csv.gz"), index=False, compression='gzip')
+    reads_to_csv(mod_table.tx_reads, os.path.join(output, "treatment_aligned_reads.csv.gz"), compression='gzip',
+                 indel_events=mod_table.tx_indel_events)
+    reads_to_csv(mod_table.mock_reads, os.path.join(output, "mock_aligned_reads.csv.gz"), compression='gzip',
+                 indel_events=mod_table.mock_indel_events)
     html_d[READ_SECTION][READ_TX_ALL] = os.path.join(base_path, "treatment_aligned_reads.csv.gz")
     html_d[READ_SECTION][READ_MOCK_ALL] = os.path.join(base_path, "mock_aligned_reads.csv.gz")
 
@@ -129,12 +133,12 @@ def create_experiment_output(result_df: AlgResultDf, tx_trans_df: TransDf, mock_
     html_d[TRANSLOCATIONS][TITLE] = "Translocations"
     # Dump all translocations reads
     if tx_trans_df.shape[0] > 0:
-        tx_trans_df.to_csv(os.path.join(output, "tx_reads_with_primer_inconsistency.csv"), index=False)
+        reads_to_csv(tx_trans_df, os.path.join(output, "tx_reads_with_primer_inconsistency.csv"))
         html_d[TRANSLOCATIONS][TX_TRANS_PATH] = os.path.join(OUTPUT_DIR, "tx_reads_with_primer_inconsistency.csv")
     else:
         html_d[TRANSLOCATIONS][TX_TRANS_PATH] = ""
     if mock_trans_df.shape[0] > 0:
-        mock_trans_df.to_csv(os.path.join(output, "mock_reads_with_primer_inconsistency.csv"), index=False)
+        reads_to_csv(mock_trans_df, os.path.join(output, "mock_reads_with_primer_inconsistency.csv"))
         html_d[TRANSLOCATIONS][MOCK_TRANS_PATH] = os.path.join(OUTPUT_DIR, "mock_reads_with_primer_inconsistency.csv")
     else:
         html_d[TRANSLOCATIONS][MOCK_TRANS_PATH] = ""
@@ -1161,6 +1165,26 @@ def warnings_and_discarded_sites_text(summary_result_df: pd.DataFrame, min_num_o
         html_d[READING_STATS][DISCARDED_SITES] = "No warnings"
 
 
+def reads_to_csv(reads_df: pd.DataFrame, path: Path, compression: str = None, indel_events: IndelEventsDf = None):
+    """
+    Dump reads to .csv file. Binary cigar path is rendered as cigar string, and indel events are rendered as indels
+    columns (see indel_events_to_columns).
+    :param reads_df: ReadsDf or TransDf
+    :param path: output path
+    :param compression: compression type (see DataFrame.to_csv)
+    :param indel_events: indel events of reads_df (IndelEventsDf). None to dump reads without indels columns.
+    :return:
+    """
+    if CIGAR in reads_df.columns:
+        reads_df = reads_df.assign(**{CIGAR: reads_df[CIGAR].map(cigar_to_str)})
+    if indel_events is not None:
+        indels_cols_d = indel_events_to_columns(indel_events, reads_df.shape[0])
+        cols = list(reads_df.columns)
+        cut_site_loc = cols.index(ALIGN_CUT_SITE) + 1 if ALIGN_CUT_SITE in cols else len(cols)
+        reads_df = reads_df.assign(**indels_cols_d)[cols[:cut_site_loc] + list(indels_cols_d) + cols[cut_site_loc:]]
+    reads_df.to_csv(path, index=False, compression=compression)
+
+
 # Edit read table utils
 def get_read_around_cut_site(read, cut_site, length):
     return read[cut_site-length:cut_site+length]
@@ -1,7 +1,8 @@
-from typing import Dict, List, DefaultDict, Tuple
+from typing import Dict
 from enum import Enum
 import pandas
 import numpy as np
+import scipy.sparse
 
 welcome_msg = "\n\
  CCCCC  RRRRRR  IIIII  SSSSS  PPPPPP  EEEEEEE  CCCCC  TTTTTTT  OOOOO  RRRRRR\n\
@@ -28,6 +29,13 @@ class ExpType(Enum):
             return "mock"
 
 
+class CompressionType(Enum):
+    NONE = 0
+    GZIP = 1
+    BGZF = 2
+    ZSTD = 3
+
+
 class IndelType(Enum):
     DEL = 0
     INS = 1
@@ -93,6 +101,10 @@ ReadsDf = pandas.DataFrame
 # R_SITE, L_SITE
 TransDf = pandas.DataFrame
 
+# pandas data frame with an indel event (deletion, insertion or substitution) of a read per row. columns - READ_ID,
+# INDEL_TYPE, POS_IDX_S, POS_IDX_E, INDEL_LEN, INDEL_BASES
+IndelEventsDf = pandas.DataFrame
+
 # pandas data frame with columns: SITE_A, SITE_B, TX_TRANS_READ, MOCK_TRANS_READ, TRANS_PVAL, TRANS_FDR
 TransResultDf = pandas.DataFrame
 
@@ -109,8 +121,9 @@ ModTables = Dict[int, ModTable]
 # R_SITE, L_SITE
 ModDist = pandas.DataFrame
 
-# Dictionary of pointers. The key is position index and the value is row_idx for  ReadsDf
-ModTableP = DefaultDict[int, List]
+# Sparse matrix of pointers. Rows are the qualification window positions (from cut-site - window_size), columns are
+# ReadsDf rows
+ModTableP = scipy.sparse.csr_matrix
 # A dict of keys modification table index and value ModTableP
 ModTablesP = Dict[int, ModTableP]
 
@@ -120,7 +133,7 @@ IsEdit = Dict[int, np.ndarray]
 DNASeq = str
 Path = str
 Pr = float
-CigarPath = str
+CigarPath = bytes  # Binary cigar path (see CIGAR_OP_SHIFT)
 
 # AlgResult - dictionary with key name_of_property (e.g. 'CI_high') and their value
 AlgResult = Dict[str, Dict]
@@ -130,6 +143,15 @@ AlgResultDf = pandas.DataFrame
 FASTP_DIR = dict()
 FASTP_DIR[ExpType.TX] = "treatment_fastp"
 FASTP_DIR[ExpType.MOCK] = "mock_fastp"
+FASTP_MIN_THREADS = 2  # Min fastp worker threads per job, when jobs run concurrently
+FASTP_MAX_THREADS = 16  # fastp doesn't use more than 16 worker threads
+FASTP_THREADS_OPT_RE = r"\s(-w|--thread)(=|\s+)\d+"  # fastp worker threads option (set by crispector)
+FASTP_CACHE_READS = "merged_reads.tsv.gz"  # Cached merged reads, grouped to unique reads
+FASTP_CACHE_FILES = ["fastp.json", "fastp.html"]  # Cached fastp summary files
+FASTP_CACHE_DEFAULT_SIZE = 20  # GB
+ALIGNMENT_CACHE_DEFAULT_SIZE = 5  # GB
+ALIGNMENT_CACHE_VERSION = "3"  # Cached alignments format version. Change to invalidate old cache entries.
+ALIGNMENT_CACHE_QUERY_SIZE = 500  # Max number of reads in a single cache query
 
 # Filter constants
 FILTERED_PATH = dict()
@@ -145,7 +167,6 @@ SITE_NAME, REFERENCE, SGRNA, ON_TARGET = 'Site Name', 'AmpliconReference', 'gRNA
 F_PRIMER = 'ForwardPrimer'
 R_PRIMER = 'ReversePrimer'
 TX_IN1, TX_IN2, MOCK_IN1, MOCK_IN2 = "TxInput1Path", "TxInput2Path", "MockInput1Path", "MockInput2Path"
-TX_MERGED, MOCK_MERGED = "TxMerged", "MockMerged"
 DONOR = "DonorReference"
 CUT_SITE = 'cut-site'
 MAX_SCORE = 'max_score'
@@ -183,6 +204,10 @@ L_READ = "left_primer_read"
 ALIGN_CUT_SITE = "alignment_cut_site"
 INDEL_COLS = [ALIGN_CUT_SITE, DEL_LEN, DEL_START, DEL_END, DEL_BASE, INS_LEN, INS_POS, INS_BASE, SUB_CNT, SUB_POS, SUB_BASE]
 
+# IndelEventsDf constants
+READ_ID = "read_id"
+INDEL_BASES = "indel_bases"
+
 # TransDf constants
 TRANS_NAME = "translocation_name"
 IS_TRANS = "is_translocation"
@@ -202,10 +227,31 @@ BINOM_PERCENTILE = 95
 C_TX = 0
 C_MOCK = 1
 PRIMER_LEN = 20
+PRIMER_MIN_PIECE_LEN = 4  # Min primer piece length for the primers index pigeonhole filter
+DEMULTIPLEX_MIN_SHARD_SIZE = 1000  # Min number of unique partial reads per demultiplexing worker process
+ALIGNMENT_CHUNK_SIZE = 500  # Max number of unique reads in a single alignment work unit
+BANDED_ALIGNMENT_BATCH_SIZE = 128  # Max number of reads aligned together by the banded aligner
+INDEL_SHIFT_BATCH_SIZE = 20000  # Max number of alignments shifted together (see shift_indels_into_cut_site)
+ALIGNMENT_BOUND_KMER_LEN = 8  # k-mer length for alignment score upper bound
+TRIE_ALIGNMENT_MAX_CELLS = 1 << 22  # Max number of DP cells kept by the trie aligner for a group of reads
+# numpy aligners (banded & trie) require scores which are multiples of ALIGNMENT_EXACT_SCORE_UNIT and at most
+# ALIGNMENT_EXACT_SCORE_MAX in absolute value. Their alignment scores are then exact in float64.
+ALIGNMENT_EXACT_SCORE_UNIT = 2 ** -10
+ALIGNMENT_EXACT_SCORE_MAX = 2 ** 20
 COMPLEMENT = {'A': 'T', 'C': 'G', 'G': 'C', 'T': 'A'}
 BAD_AMPLICON_THRESHOLD = 500
 CIGAR_LEN_THRESHOLD = 8 # This threshold is applied only if alignment score is low
 READ_LEN_SIDE = 20
+FASTQ_CHUNK_SIZE = 100000  # Number of fastq sequences parsed before they are counted
+
+# Compressed input constants
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_HEADER_LEN = 18  # BGZF header length (gzip header with a single BC extra subfield)
+GZIP_FEXTRA = 0x04
+BGZF_PENDING_BLOCKS_PER_THREAD = 8  # Max number of BGZF blocks waiting for decompression, per thread
+IO_BUFFER_SIZE = 1 << 20
+MMAP_CHUNK_SIZE = 1 << 26  # Bytes scanned at once when an uncompressed fastq is memory-mapped
 OUTPUT_DIR = "crispector_output"
 UNBALANCED_READ_WARNING = 3  #if Tx vs M read numbers are high unbalanced, (*3 or /3), report to the user
 
@@ -233,10 +279,12 @@ TRANS_FDR = "FDR"
 TRANS_RESULTS_TITLES = [SITE_A, SITE_B, TX_TRANS_READ, MOCK_TRANS_READ, TRANS_PVAL, TRANS_FDR]
 # Cigar path constants
 CIGAR_D, CIGAR_I, CIGAR_S, CIGAR_M = "D", "I", "X", "="
-
-# AlignedIndel - A Tuple of indel_type, length, and position in alignment coordinates.
-# Only used by input processing module.
-AlignedIndel = Tuple[IndelType, int, int]
+# Binary cigar path - a little-endian uint32 for each operation, (length << CIGAR_OP_SHIFT) | op code. Op codes are
+# BAM cigar op codes. The cigar string is rendered only for output files.
+CIGAR_OP_SHIFT = 4
+CIGAR_OP_MASK = (1 << CIGAR_OP_SHIFT) - 1
+CIGAR_OP_I, CIGAR_OP_D, CIGAR_OP_M, CIGAR_OP_S = 1, 2, 7, 8
+CIGAR_DTYPE = "<u4"
 
 # plots colors
 OFF_TARGET_COLOR = '#ffa5a5'
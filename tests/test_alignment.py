@@ -0,0 +1,77 @@
+"""Tests for `crispector.input_processing.alignment` module."""
+from crispector.input_processing.alignment import Alignment
+from crispector.input_processing.utils import reverse_complement
+from crispector.utils.configurator import Configurator
+
+
+def _aligner(**scores):
+    Configurator.set_cfg_path(None)
+    align_cfg = dict(Configurator.get_cfg()["alignment"])
+    align_cfg.update(scores)
+    return Alignment._create_aligner(align_cfg)
+
+
+def test_align_reads_unit_gap_open_above_gap_extend():
+    # Split gaps score more than a single gap, so aligning only the middle part of the read isn't optimal
+    aligner = _aligner(match_score=5, mismatch_score=-4, open_gap_score=-2, extend_gap_score=-6)
+    reference, read = "GATTGCCAGTTT", "GATTGCCT"
+    alignment = Alignment._align_reads_unit(aligner, reference, False, [read])[0][0]
+    assert alignment[4] == aligner.score(reference, read)
+    assert alignment[:5] == Alignment._needle_wunsch_align(aligner, reference, read)
+
+
+def test_banded_align_gap_open_above_gap_extend():
+    # The score bound of paths which leave the band doesn't hold, so reads are aligned without a band
+    aligner = _aligner(match_score=5, mismatch_score=-4, open_gap_score=-2, extend_gap_score=-6)
+    reference, read = "GGTAAGCGTTTT", "GGTTCAATTT"
+    alignments, _, _, banded_n, _ = Alignment._align_reads_unit(aligner, reference, False, [read], band_margin=1)
+    assert banded_n == 0
+    assert alignments[0][4] == aligner.score(reference, read)
+
+
+def test_reverse_alignment_gap_open_above_gap_extend():
+    # Split gaps score more than a single gap, so the length bound can't skip the reverse alignment
+    aligner = _aligner(match_score=5, mismatch_score=-4, open_gap_score=-2, extend_gap_score=-6)
+    reference, read = "TATAATATATATAATATTAAATAAATTTTTTTAAATTTTATA", "TATAATATATATAATAAATT"
+    alignment = Alignment._align_reads_unit(aligner, reference, True, [read])[0][0]
+    assert alignment[5]
+    assert alignment[4] == aligner.score(reverse_complement(reference), read)
+
+
+def test_trie_align_non_integer_scores():
+    aligner = _aligner(match_score=2, mismatch_score=-1.25, open_gap_score=-3.5, extend_gap_score=-0.25)
+    reference = "TTATTTAATTAAAAATAAAAAAATATAATTTAATATTATAT"
+    # Reads which start & end with insertions are traced back to the first read position by insertion blocks
+    reads = ["TTATATAATTTAATAT", "GGG" + reference, reference + "CC", "CTTATTTAATTAAAAATAAATATAATTTAATATTATA"]
+    trie_d = Alignment._trie_align(aligner, reference, reads)
+    for read in reads:
+        assert trie_d[read] == Alignment._needle_wunsch_align(aligner, reference, read)
+
+
+def test_trie_align_inexact_scores():
+    # Scores aren't summed exactly in float64, so the reads aren't aligned with the trie aligner
+    aligner = _aligner(match_score=2, mismatch_score=-1.1, open_gap_score=-3.3, extend_gap_score=-0.3)
+    reference, read = "TTATTTAATTAAAAATAAAAAAATATAATTTAATATTATAT", "TTATATAATTTAATAT"
+    alignment = Alignment._align_reads_unit(aligner, reference, False, [read], None, True)[0][0]
+    assert alignment[:5] == Alignment._needle_wunsch_align(aligner, reference, read)
+
+
+def test_banded_align_non_integer_scores():
+    aligner = _aligner(match_score=2, mismatch_score=-1.25, open_gap_score=-3.5, extend_gap_score=-0.25)
+    reference = "TTATATAAAAATAATATAATT"
+    reads = ["TTATATTATAATAATATAATTTT", "TTATATAAAATAATATAGATT"]
+    banded_d = Alignment._banded_align(aligner, reference, reads, 2)
+    for read in reads:
+        assert banded_d[read] == Alignment._needle_wunsch_align(aligner, reference, read)
+
+
+def test_banded_align_inexact_scores():
+    # Scores aren't summed exactly in float64, so the reads are aligned without a band
+    cases = [((5, -4, -10, -0.1), "CCCCCCAACAACACAACCACCC", "CCCCCCAACAACACACAAACCACCCAAACCAAAACCC"),
+             ((2, -1.1, -3.3, -0.3), "TTATATAAAAATAATATAATT", "TTATATTATAATAATATAATTTT")]
+    for scores, reference, read in cases:
+        aligner = _aligner(match_score=scores[0], mismatch_score=scores[1], open_gap_score=scores[2],
+                           extend_gap_score=scores[3])
+        alignments, _, _, banded_n, _ = Alignment._align_reads_unit(aligner, reference, False, [read], band_margin=2)
+        assert banded_n == 0
+        assert alignments[0][:5] == Alignment._needle_wunsch_align(aligner, reference, read)